@@ -1,8 +1,7 @@
 import dash
-from dash import dcc, html, Input, Output, State, dash_table, ALL
+from dash import dcc, html, Input, Output, State, dash_table, ALL, Patch
 import dash_bootstrap_components as dbc
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
 import os
 from datetime import datetime, timedelta
@@ -10,17 +9,42 @@ import json
 import io
 import numpy as np
 import sys
+import sqlite3
+from flask import request, jsonify
+
+from datastore import dataset_version
+from catalog import unit_weight_kg
+from safety_stock import get_safety_stock, DEFAULT_LEAD_TIME_DAYS, DEFAULT_SERVICE_LEVEL
+from order_cycles import get_order_cycles
+from demand import (LONG_PERIOD_DAYS, VERY_LONG_PERIOD_DAYS, SALES_SPIKE_FACTOR, UPWARD_TREND_FACTOR,
+                    HIGH_VOLUME_THRESHOLD, daily_demand_matrix, demand_signals)
+from expiry_index import (get_expiry_index, get_expiry_status,
+                          status_labels, status_overview, STATUS_EXPIRED, STATUS_EXPIRING_SOON, STATUS_NEARING_EXPIRY)
+from predicted_waste import get_predicted_waste, ACTION_DISCOUNT, ACTION_DISPOSE
+from markdown_optimizer import get_markdown_plan
+from sustainability import get_sustainability_summary
+from dashboard import get_dashboard_snapshot
+from sales_facts import get_sales_facts
+from notifications import get_notifications
+from downsample import downsample_series, visible_range
+from figures import CHART_COLORS, FIGURE_LAYOUTS, build_figure, cached_figure, horizontal_bar_facets
+from sales_history import read_sales_csv
+from sql_store import DB_FILE, sync_database, product_daily_sales, product_stock_by_location, last_purchase_date
+from ingest import (ingest_sales, ingestion_paused, reload_needed, sales_records, start_drop_folder_watcher,
+                    stream_sequence)
+from supplier_metrics import get_supplier_metrics
+from promotions import BASELINE_DAYS, get_promotions, get_upcoming_promotions
+from weather_demand import EFFECT_STEPS, get_weather_demand_outlook, get_weather_sensitivity, weather_insights
+from sales_insights import ALL as ALL_SLICES, FALSE_DISCOVERY_RATE, HOLIDAY, get_sales_insights
+from location_stock import (ALL_LOCATIONS, capacity_text, catalog_on_hand, get_location_partitions, stock_status,
+                            unmatched_text)
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+LIVE_REFRESH_SECONDS = 5 # How often the dashboard checks for streamed sales
+DEBUG_MODE = True # Dash debug mode (with the code reloader) when run as a script
+SQL_DB_PATH = os.path.join(DATA_DIR, DB_FILE) # Indexed SQLite copy of sales / movements / purchases; None to run without it
+DRILLDOWN_SALES_DAYS = 30
 
-def get_season(month):
-    if 3 <= month <= 5:
-        return 'Spring'
-    elif 6 <= month <= 8:
-        return 'Summer'
-    elif 9 <= month <= 11:
-        return 'Autumn'
-    else: # 12, 1, 2
-        return 'Winter'
-    
 # --- Data Loading Function ---
 def load_data():
     """
@@ -29,8 +53,7 @@ def load_data():
     Returns a dictionary where each DataFrame is converted to a JSON string.
     """
     data = {}
-    base_dir = os.path.dirname(__file__) # Gets the directory 
-    data_dir = os.path.join(base_dir, 'data')
+    data_dir = DATA_DIR
 
     try:
         products_path = os.path.join(data_dir, 'products_and_suppliers_combined.csv')
@@ -39,7 +62,7 @@ def load_data():
         df_products['ExpiryDate'] = pd.to_datetime(df_products['ExpiryDate'], errors='coerce')
 
         if 'Weight' not in df_products.columns:
-            df_products['Weight'] = 0.5 # Default weight of 0.5 kg per product entry for waste calculation
+            df_products['Weight'] = unit_weight_kg(df_products) # kg per unit, from UnitOfMeasure / pack size / category
 
         data['products'] = df_products.to_json(date_format='iso', orient='split')
         
@@ -50,32 +73,21 @@ def load_data():
         data['purchases'] = df_purchases.to_json(date_format='iso', orient='split')
         
 
-        sales_path = os.path.join(data_dir, 'sales_data.csv')
-        df_sales = pd.read_csv(sales_path)
+        # Streamed sales are appended to both files; read them together so a batch is in both or neither
+        with ingestion_paused():
+            sales_path = os.path.join(data_dir, 'sales_data.csv')
+            df_sales = read_sales_csv(sales_path) # Daily aggregates when the file is too large to hold
+            inventory_path = os.path.join(data_dir, 'inventory_movements.csv')
+            df_inventory = pd.read_csv(inventory_path)
+            data['stream_sequence'] = stream_sequence() # Batches after this one are not in the files read
+            if SQL_DB_PATH:
+                try:
+                    sync_database(data_dir, SQL_DB_PATH) # Loads only what changed since the last sync
+                except sqlite3.Error as e:
+                    print(f"Warning: SQLite backend not updated: {e}")
         df_sales['SaleDate'] = pd.to_datetime(df_sales['SaleDate'])
         data['sales'] = df_sales.to_json(date_format='iso', orient='split')
         
-         # Ensure SaleDate is datetime type and handle errors
-        df_sales['SaleDate'] = pd.to_datetime(df_sales['SaleDate'], errors='coerce')
-        df_sales.dropna(subset=['SaleDate'], inplace=True)
-        df_sales['Month'] = df_sales['SaleDate'].dt.month
-        df_sales['Season'] = df_sales['Month'].apply(get_season)
-        df_sales['Year'] = df_sales['SaleDate'].dt.year
-
-        # Ensure TotalPrice is numeric and handle errors
-        df_sales['TotalPrice'] = pd.to_numeric(df_sales['TotalPrice'], errors='coerce')
-        df_sales.dropna(subset=['TotalPrice'], inplace=True)
-
-        # Verify 'Profit' column exists and add fallback if not (as it should be there after running script)
-        if 'Profit' not in df_sales.columns:
-            print("CRITICAL WARNING: 'Profit' column not found in sales_data.csv. Please ensure you ran the 'add_profit_column.py' script successfully.")
-            # Fallback (add random profit if missing, but ideally, fix the CSV)
-            df_sales['Profit'] = df_sales['TotalPrice'] * np.random.uniform(0.15, 0.25, len(df_sales))
-
-        
-
-        inventory_path = os.path.join(data_dir, 'inventory_movements.csv')
-        df_inventory = pd.read_csv(inventory_path)
         df_inventory['MovementDate'] = pd.to_datetime(df_inventory['MovementDate'])
         data['inventory'] = df_inventory.to_json(date_format='iso', orient='split')
 
@@ -111,6 +123,12 @@ def load_data():
             'promotions': pd.DataFrame().to_json(date_format='iso', orient='split'),
             'weather': pd.DataFrame().to_json(date_format='iso', orient='split')
         }
+
+    # Version token used to cache derived results (safety stock etc.) until a CSV changes
+    data['version'] = dataset_version(data_dir)
+
+    # Pre-join sales with product attributes (category, cost, profit) once per dataset version
+    get_sales_facts(data)
     return data
 
 # Initialize app with Bootstrap themes
@@ -128,355 +146,67 @@ server = app.server
 app_data = load_data()
 
 # --- Helper Functions for Data Calculations ---
-def get_realtime_metrics(stored_data_json):
-    df_products = pd.read_json(io.StringIO(stored_data_json['products']), orient='split') if stored_data_json.get('products') else pd.DataFrame()
-    df_inventory = pd.read_json(io.StringIO(stored_data_json['inventory']), orient='split') if stored_data_json.get('inventory') else pd.DataFrame()
-
-    if not df_products.empty and 'ExpiryDate' in df_products.columns:
-        df_products['ExpiryDate'] = pd.to_datetime(df_products['ExpiryDate'], errors='coerce')
-
-    if not df_inventory.empty and 'MovementDate' in df_inventory.columns:
-        df_inventory['MovementDate'] = pd.to_datetime(df_inventory['MovementDate'])
-
-    if not df_inventory.empty:
-        stock_in = df_inventory[df_inventory['MovementType'] == 'IN']['Quantity'].sum()
-        stock_out = df_inventory[df_inventory['MovementType'] == 'OUT']['Quantity'].sum()
-        items_in_stock = stock_in - stock_out
-    else:
-        items_in_stock = 0
-
-    prev_items_in_stock = 12900 # Example dummy value
-    stock_change_percent = ((items_in_stock - prev_items_in_stock) / prev_items_in_stock) * 100 if prev_items_in_stock else 0
-
-    reorder_recommendations = 15 # Example dummy value
-    prev_reorder_recommendations = 7 # Example dummy value
-    reorder_change_percent = ((reorder_recommendations - prev_reorder_recommendations) / prev_reorder_recommendations) * 100 if prev_reorder_recommendations else 0
-
-    if not df_products.empty:
-        today = pd.to_datetime(datetime.now().date())
-        expiring_items_count = df_products[
-            (df_products['ExpiryDate'].notna()) &
-            (df_products['ExpiryDate'] >= today) &
-            (df_products['ExpiryDate'] <= today + timedelta(days=30))
-        ].shape[0]
-    else:
-        expiring_items_count = 0
-
-    prev_expiring_items = 8.4 # Example dummy value
-    expiring_change_percent = ((expiring_items_count - prev_expiring_items) / prev_expiring_items) * 100 if prev_expiring_items else 0
-
-    return {
-        'items_in_stock': f"{items_in_stock:,.0f}",
-        'stock_change': f"{stock_change_percent:+.0f}%", # Added + for positive change
-        'stock_change_class': 'positive' if stock_change_percent >= 0 else 'negative',
-        'reorder_recommendations': f"{reorder_recommendations}",
-        'reorder_change': f"{reorder_change_percent:+.0f}%",
-        'reorder_change_class': 'positive' if reorder_change_percent >= 0 else 'negative',
-        'expiring_items': f"{expiring_items_count}",
-        'expiring_change': f"{expiring_change_percent:+.0f}%",
-        'expiring_change_class': 'negative' if expiring_change_percent >= 0 else 'positive', # Negative for expiring is 'bad'
-    }
-
-def get_sales_data_for_chart(stored_data_json):
-    df_sales = pd.read_json(io.StringIO(stored_data_json['sales']), orient='split') if stored_data_json.get('sales') else pd.DataFrame()
-    if df_sales.empty:
-        return pd.DataFrame()
-    df_sales['SaleDate'] = pd.to_datetime(df_sales['SaleDate'])
-    monthly_sales = df_sales.set_index('SaleDate').resample('MS')['TotalPrice'].sum().reset_index()
-    monthly_sales['Date_Label'] = monthly_sales['SaleDate'].dt.strftime('%b %Y')
-    if len(monthly_sales) > 5:
-        monthly_sales = monthly_sales.tail(5)
-    return monthly_sales
-
-def calculate_last_5_months_sales_change(stored_data_json):
-    df_sales = pd.read_json(io.StringIO(stored_data_json['sales']), orient='split') if stored_data_json.get('sales') else pd.DataFrame()
-    if df_sales.empty:
-        return "0", "0%"
-    df_sales['SaleDate'] = pd.to_datetime(df_sales['SaleDate'])
-    today = pd.to_datetime(datetime.now().date())
-    five_months_ago_start = today - pd.DateOffset(months=5)
-    recent_sales_sum = df_sales[df_sales['SaleDate'] >= five_months_ago_start]['TotalPrice'].sum()
-    ten_months_ago_start = today - pd.DateOffset(months=10)
-    previous_period_sales_sum = df_sales[(df_sales['SaleDate'] >= ten_months_ago_start) & (df_sales['SaleDate'] < five_months_ago_start)]['TotalPrice'].sum()
-    
-    percentage_change = 0
-    if previous_period_sales_sum > 0:
-        percentage_change = ((recent_sales_sum - previous_period_sales_sum) / previous_period_sales_sum) * 100
-    elif recent_sales_sum > 0: # Handle case where previous period sales were 0
-        percentage_change = 100 
-    return f"{recent_sales_sum:,.0f}", f"{percentage_change:+.0f}%"
-
-def get_top_categories_in_profit(stored_data_json, top_n=5):
-    df_sales = pd.read_json(io.StringIO(stored_data_json['sales']), orient='split') if stored_data_json.get('sales') else pd.DataFrame()
-    df_products = pd.read_json(io.StringIO(stored_data_json['products']), orient='split') if stored_data_json.get('products') else pd.DataFrame()
-    
-    if df_sales.empty or df_products.empty:
-        return pd.DataFrame(), 0
-
-    df_sales['SaleDate'] = pd.to_datetime(df_sales['SaleDate'])
-    
-    
-    product_cols_to_merge = ['ProductID', 'Category', 'Cost']
-    existing_product_cols = [col for col in product_cols_to_merge if col in df_products.columns]
-    
-    if len(existing_product_cols) < len(product_cols_to_merge):
-        return pd.DataFrame(), 0 
-
-    df_merged = pd.merge(df_sales, df_products[existing_product_cols], 
-                         on='ProductID', how='left')
-    
-    
-    df_merged['Cost'] = pd.to_numeric(df_merged['Cost'], errors='coerce').fillna(0)
-    df_merged['Quantity'] = pd.to_numeric(df_merged['Quantity'], errors='coerce').fillna(0)
-    df_merged['TotalPrice'] = pd.to_numeric(df_merged['TotalPrice'], errors='coerce').fillna(0)
-    
-    df_merged['Category'] = df_merged['Category'].fillna('Unknown') 
-
-    df_merged['Profit'] = df_merged['TotalPrice'] - (df_merged['Quantity'] * df_merged['Cost'])
-
-    df_merged = df_merged.dropna(subset=['Profit'])
-    
-    if df_merged.empty:
-        return pd.DataFrame(), 0
-
-   
-    today = datetime.now() 
-    current_quarter_start = today - timedelta(days=90)
-    
-    df_quarterly_profit_data = df_merged[
-        (df_merged['SaleDate'] >= current_quarter_start)
-    ].copy() 
-    
-    
-    if df_quarterly_profit_data.empty:
-        return pd.DataFrame(), 0
-
-    
-    total_profit_current_quarter = df_quarterly_profit_data['Profit'].sum() 
-
-    
-    category_profit = df_quarterly_profit_data.groupby('Category')['Profit'].sum().nlargest(top_n).reset_index()
-    category_profit.columns = ['Category', 'Profit']
-    
-    
-    category_profit = category_profit[category_profit['Profit'] > 0]
-    
-    return category_profit, total_profit_current_quarter
-
-def get_notifications(stored_data_json):
-    df_products = pd.read_json(io.StringIO(stored_data_json['products']), orient='split') if stored_data_json.get('products') else pd.DataFrame()
-    notifications = []
-
-    if not df_products.empty and 'ExpiryDate' in df_products.columns:
-        df_products['ExpiryDate'] = pd.to_datetime(df_products['ExpiryDate'], errors='coerce')
-
-    today = pd.to_datetime(datetime.now().date())
-    
-    # Dynamic: Expiring products (top 2)
-    expiring_soon_products = df_products[
-        (df_products['ExpiryDate'].notna()) &
-        (df_products['ExpiryDate'] >= today) &
-        (df_products['ExpiryDate'] <= today + timedelta(days=7))
-    ].head(2) # Limit to a few to avoid overwhelming notifications
-    for _, row in expiring_soon_products.iterrows():
-        days_left = (row['ExpiryDate'] - today).days
-        notifications.append({
-            'type': 'expiring',
-            'text': f"Item {row['ProductName']} expiring in {days_left} days!",
-            'time': f"{days_left} days left"
-        })
-
-
-    # Static notifications (ensure they are not duplicated if the function is called multiple times)
-    notifications.append({'type': 'new_supplier', 'text': "New supplier 'Tech Solutions Inc.' onboarding required.", 'time': "6 hours ago"})
-    notifications.append({'type': 'waste', 'text': "Waste report for Q1 needs review.", 'time': "1 day ago"})
-    notifications.append({'type': 'low_stock', 'text': "Item XYZ is low in stock: 10 units left!", 'time': "3m ago"})
-    notifications.append({'type': 'pending_invoice', 'text': "New supplier ABC has pending invoice.", 'time': "1h ago"})
-
-    return notifications
-
-def get_monthly_waste_data_for_chart(stored_data_json, num_months=3): 
+def get_expiry_data(stored_data_json, view_filter='All', page_current=0, page_size=None):
     """
-    Calculates monthly waste data for the bar chart, showing the last 'num_months' months.
-    Labels months as Jan, Feb, etc.
+    Returns (table rows for the requested page, overview metrics, total rows in the view).
+    Status is held as integer codes; display strings are only built for the rows on the page.
     """
-    df_products = pd.read_json(io.StringIO(stored_data_json['products']), orient='split') if stored_data_json.get('products') else pd.DataFrame()
-
-    if df_products.empty:
-        return {'months': [], 'waste_kilos': [], 'df': pd.DataFrame({'Month': [], 'Waste_KGS': []})}
-
-    df_products['ExpiryDate'] = pd.to_datetime(df_products['ExpiryDate'], errors='coerce')
-    today = pd.to_datetime(datetime.now().date())
-    
-    # Filter for items that have expired before 'today'
-    expired_items = df_products[
-        (df_products['ExpiryDate'].notna()) &
-        (df_products['ExpiryDate'] < today)
-    ].copy()
-
-    if expired_items.empty:
-        return {'months': [], 'waste_kilos': [], 'df': pd.DataFrame({'Month': [], 'Waste_KGS': []})}
-
-    
-    expired_items['ExpiryMonth'] = expired_items['ExpiryDate'].dt.to_period('M')
-    monthly_waste = expired_items.groupby('ExpiryMonth')['Weight'].sum().reset_index()
-    monthly_waste.columns = ['MonthPeriod', 'Waste_KGS']
-
-    
-    end_month = today.to_period('M')
-    all_periods = pd.period_range(end=end_month, periods=2 * num_months, freq='M')
-
-    full_monthly_data = pd.DataFrame({'MonthPeriod': all_periods})
-    full_monthly_data = pd.merge(full_monthly_data, monthly_waste, on='MonthPeriod', how='left').fillna(0)
-    
-    
-    display_df = full_monthly_data.tail(num_months).copy()
-    
-    
-    display_df['Month'] = display_df['MonthPeriod'].dt.strftime('%b')
-
-    return {
-        'months': display_df['Month'].tolist(),
-        'waste_kilos': display_df['Waste_KGS'].tolist(),
-        'df': display_df[['Month', 'Waste_KGS']]
-    }
-
-def calculate_overall_quarterly_waste(stored_data_json): # Renamed function
-    """
-    Calculates the total waste for the last 3 months (quarter) and its change from the previous 3 months.
-    This is used for the summary text.
-    """
-    df_products = pd.read_json(io.StringIO(stored_data_json['products']), orient='split') if stored_data_json.get('products') else pd.DataFrame()
-
-    if df_products.empty:
-        return {'total_waste_text': "0 kgs", 'change_text': "0%"}
-
-    df_products['ExpiryDate'] = pd.to_datetime(df_products['ExpiryDate'], errors='coerce')
-    today = pd.to_datetime(datetime.now().date())
-    
-    expired_items = df_products[
-        (df_products['ExpiryDate'].notna()) &
-        (df_products['ExpiryDate'] < today)
-    ].copy()
-
-    if expired_items.empty:
-        return {'total_waste_text': "0 kgs", 'change_text': "0%"}
-
-    # Calculate waste for the last 3 months (current quarter)
-    end_date_current = today
-    start_date_current = end_date_current - pd.DateOffset(months=3) # 3 months for a quarter
-    
-    current_period_waste = expired_items[
-        (expired_items['ExpiryDate'] >= start_date_current) &
-        (expired_items['ExpiryDate'] < end_date_current)
-    ]['Weight'].sum()
-
-    # Calculate waste for the previous 3 months (previous quarter)
-    end_date_previous = start_date_current
-    start_date_previous = end_date_previous - pd.DateOffset(months=3) # Previous 3 months
-
-    previous_period_waste = expired_items[
-        (expired_items['ExpiryDate'] >= start_date_previous) &
-        (expired_items['ExpiryDate'] < end_date_previous)
-    ]['Weight'].sum()
-
-    waste_change_percent = 0
-    if previous_period_waste > 0:
-        waste_change_percent = ((current_period_waste - previous_period_waste) / previous_period_waste) * 100
-    else:
-        waste_change_percent = 100 if current_period_waste > 0 else 0
-
-    total_waste_text = f"{current_period_waste:,.0f} kgs"
-    change_text = f"{waste_change_percent:+.0f}%"
-
-    return {'total_waste_text': total_waste_text, 'change_text': change_text}
-
-
-def get_expiry_data(stored_data_json, view_filter='All'):
     print(f"get_expiry_data received view_filter: {view_filter}")
-    df_products = pd.read_json(io.StringIO(stored_data_json['products']), orient='split') if stored_data_json.get('products') else pd.DataFrame()
+    df_stock, _ = get_expiry_index(stored_data_json)
     
-    if df_products.empty:
-        return pd.DataFrame(), {'expired': '0', 'expiring_7': '0 (0 units)', 'expiring_30': '0 (0 units)'}
+    if df_stock.empty:
+        return pd.DataFrame(), {'expired': '0', 'expiring_7': '0 (0 units)', 'expiring_30': '0 (0 units)', 'at_risk': '0 (0 units)'}, 0
     
-
-    df_products['ExpiryDate'] = pd.to_datetime(df_products['ExpiryDate'], errors='coerce')
-    today = pd.to_datetime(datetime.now().date())
-
-    # Calculate expiry statuses
-    df_products['Status'] = 'Good'
-    df_products.loc[df_products['ExpiryDate'] < today, 'Status'] = 'Expired'
-    df_products.loc[(df_products['Status'] != 'Expired') & 
-                    (df_products['ExpiryDate'] >= today) & 
-                    (df_products['ExpiryDate'] <= today + timedelta(days=7)), 
-                    'Status'] = 'Expiring Soon'
-    
-     # Logic for 'X Days Remaining'
-    nearing_expiry_mask = (df_products['Status'] != 'Expired') & \
-                          (df_products['Status'] != 'Expiring Soon') & \
-                          (df_products['ExpiryDate'] > today + timedelta(days=7)) & \
-                          (df_products['ExpiryDate'] <= today + timedelta(days=30))
-    
-    # Calculate days remaining for products that fit this mask
-    # Ensure to convert ExpiryDate and today to date for accurate day difference, then to timedelta
-    days_remaining_series = (df_products.loc[nearing_expiry_mask, 'ExpiryDate'].dt.date - today.date()).apply(lambda x: x.days)
-
-    # Update the 'Status' column with the exact days remaining 
-    df_products.loc[nearing_expiry_mask, 'Status'] = 'Nearing Expiry (' + days_remaining_series.astype(str) + ' Days)'
-    # --- END Status Calculation ---
+    status_codes, days_remaining = get_expiry_status(stored_data_json)
+    predicted_waste = get_predicted_waste(stored_data_json)
+    at_risk = (predicted_waste['Action'] == ACTION_DISCOUNT).to_numpy()
 
   # --- Filtering Logic ---
-    display_df = df_products.copy()
-
     if view_filter == 'Expired': 
-        display_df = display_df[display_df['Status'] == 'Expired']
+        view_rows = np.flatnonzero(status_codes == STATUS_EXPIRED)
     elif view_filter == 'Expiring Soon': # Includes both 'Expiring Soon' AND 'Nearing Expiry (X Days)'
-        display_df = display_df[
-            (display_df['Status'] == 'Expiring Soon') | 
-            (display_df['Status'].str.contains('Nearing Expiry \\(', na=False)) # ESCAPED PARENTHESIS
-        ]
+        view_rows = np.flatnonzero((status_codes == STATUS_EXPIRING_SOON) | (status_codes == STATUS_NEARING_EXPIRY))
     elif view_filter == 'Expiring in 30 Days': # ONLY includes 'Nearing Expiry (X Days)'
-        display_df = display_df[display_df['Status'].str.contains('Nearing Expiry \\(', na=False)] # ESCAPED PARENTHESIS
-    elif view_filter == 'All Items': 
-        display_df = df_products.copy() 
+        view_rows = np.flatnonzero(status_codes == STATUS_NEARING_EXPIRY)
+    elif view_filter == 'At Risk': # Still sellable, but predicted to expire unsold; biggest predicted waste first
+        view_rows = np.flatnonzero(at_risk)
+        view_rows = view_rows[np.argsort(-predicted_waste['PredictedWaste'].to_numpy()[view_rows], kind='stable')]
+    else: # 'All' / 'All Items'
+        view_rows = np.arange(len(df_stock))
     # --- END Filtering Logic ---
 
-
-    # Format ExpiryDate for display
-    display_df['ExpiryDate'] = display_df['ExpiryDate'].dt.strftime('%d %b %Y')
-
-    # Prepare data for the table
-    table_data = display_df[['ProductName', 'ProductID', 'quantity', 'ExpiryDate', 'Status']].rename(columns={
-        'ProductName': 'PRODUCT NAME',
-        'ProductID': 'STOCK ID',
-        'quantity': 'QUANTITY',
-        'ExpiryDate': 'EXPIRY DATE',
-        'Status': 'STATUS'
+    total_rows = len(view_rows)
+    if page_size:
+        view_rows = view_rows[page_current * page_size:(page_current + 1) * page_size]
+
+    # Prepare data for the table (visible rows only)
+    page_df = df_stock.iloc[view_rows]
+    table_data = pd.DataFrame({
+        'PRODUCT NAME': page_df['ProductName'].to_numpy(),
+        'STOCK ID': page_df['StockID'].to_numpy(),
+        'QUANTITY': page_df['quantity'].to_numpy(),
+        'EXPIRY DATE': page_df['ExpiryDate'].dt.strftime('%d %b %Y').to_numpy(),
+        'STATUS': status_labels(status_codes[view_rows], days_remaining[view_rows]),
+        'PREDICTED WASTE': predicted_waste['PredictedWaste'].to_numpy()[view_rows].astype(np.int64),
     })
 
-    # Calculate expiry overview metrics
-    expired_count = df_products[df_products['Status'] == 'Expired'].shape[0]
-    expired_units = df_products[df_products['Status'] == 'Expired']['quantity'].sum()
-
-    expiring_7_count = df_products[df_products['Status'] == 'Expiring Soon'].shape[0]
-    expiring_7_units = df_products[df_products['Status'] == 'Expiring Soon']['quantity'].sum()
-
-    expiring_30_count = df_products[
-        (df_products['Status'] == 'Expiring Soon') | 
-        (df_products['Status'].str.contains('Nearing Expiry \\(', na=False)) 
-    ].shape[0]
-    expiring_30_units = df_products[
-        (df_products['Status'] == 'Expiring Soon') | 
-        (df_products['Status'].str.contains('Nearing Expiry \\(', na=False)) 
-    ]['quantity'].sum()
+    # Calculate expiry overview metrics in one grouped pass
+    counts, units = status_overview(status_codes, df_stock['quantity'].to_numpy())
+    expired_count, expired_units = counts[STATUS_EXPIRED], units[STATUS_EXPIRED]
+    expiring_7_count, expiring_7_units = counts[STATUS_EXPIRING_SOON], units[STATUS_EXPIRING_SOON]
+    expiring_30_count = expiring_7_count + counts[STATUS_NEARING_EXPIRY]
+    expiring_30_units = expiring_7_units + units[STATUS_NEARING_EXPIRY]
+    at_risk_count = int(at_risk.sum())
+    at_risk_units = int(predicted_waste['PredictedWaste'].to_numpy()[at_risk].sum())
 
     expiry_overview = {
         'expired': f"{expired_count} item{'s' if expired_count != 1 else ''} ({expired_units} units)",
         'expiring_7': f"{expiring_7_count} item{'s' if expiring_7_count != 1 else ''} ({expiring_7_units} units)",
-        'expiring_30': f"{expiring_30_count} item{'s' if expiring_30_count != 1 else ''} ({expiring_30_units} units)"
+        'expiring_30': f"{expiring_30_count} item{'s' if expiring_30_count != 1 else ''} ({expiring_30_units} units)",
+        'at_risk': f"{at_risk_count} item{'s' if at_risk_count != 1 else ''} ({at_risk_units} units)"
     }
 
-    return table_data, expiry_overview
+    return table_data, expiry_overview, total_rows
 
 
 def calculate_reorder_qty_placeholder(product_id, current_stock, reorder_point, status, demand_proxy, lead_time_days, safety_stock_factor):
@@ -569,7 +299,19 @@ dashboard_content = html.Div(
             className="welcome-banner",
             style={'background-image': 'url("/assets/welcome_banner_bg.png")'}
         ),
-        html.H4("Real-Time Metrics", className="section-title"),
+        html.Div(
+            [
+                html.H4("Real-Time Metrics", className="section-title"),
+                dcc.Dropdown(
+                    id='dashboard-location-dropdown',
+                    options=[{'label': 'All Locations', 'value': ALL_LOCATIONS}],
+                    value=ALL_LOCATIONS,
+                    clearable=False,
+                    style={'width': '260px'}
+                )
+            ],
+            className="d-flex align-items-center justify-content-between"
+        ),
         dbc.Row(
             [
                 dbc.Col(
@@ -580,6 +322,7 @@ dashboard_content = html.Div(
                                 html.H3(id="items-in-stock-value", className="metric-value"),
                                 html.Span(id="items-in-stock-change", className="metric-change")
                             ], className="d-flex align-items-center"),
+                            html.Small(id="items-in-stock-capacity", className="text-muted"), # Capacity use at the selected location
                         ],
                         className="metric-card"
                     ),
@@ -689,6 +432,7 @@ dashboard_content = html.Div(
             ],
             className="mb-4"
         ),
+        dcc.Interval(id='live-sales-interval', interval=LIVE_REFRESH_SECONDS * 1000),
     ],
     className="content"
 )
@@ -718,7 +462,8 @@ expiry_management_content = html.Div(
                                     options=[
                                         {'label': 'All', 'value': 'All'},
                                         {'label': 'Expiring Soon', 'value': 'Expiring Soon'},
-                                        {'label': 'Expired', 'value': 'Expired'}
+                                        {'label': 'Expired', 'value': 'Expired'},
+                                        {'label': 'At Risk', 'value': 'At Risk'}
                                     ],
                                     value='All',
                                     clearable=False,
@@ -735,6 +480,7 @@ expiry_management_content = html.Div(
                                     {"name": "QUANTITY", "id": "QUANTITY"},
                                     {"name": "EXPIRY DATE", "id": "EXPIRY DATE"},
                                     {"name": "STATUS", "id": "STATUS"},
+                                    {"name": "PREDICTED WASTE", "id": "PREDICTED WASTE"},
                                     # THIS IS CRUCIAL: 'presentation': 'markdown'
                                      {"name": "ACTIONS", "id": "ACTIONS"}
                                      
@@ -743,8 +489,10 @@ expiry_management_content = html.Div(
     editable=False, 
     cell_selectable=True, # <<< Enable individual cell selection
     
-    page_action='native',
+    page_action='custom', # Rows (and their status strings) are built server-side one page at a time
+    page_current=0,
     page_size=10,  # Set this to your desired number of rows (e.g., 10, 15, 20)
+    page_count=1,
     
                             style_table={'overflowX': 'auto', 'minWidth': '100%'},
                             style_header={
@@ -812,7 +560,8 @@ expiry_management_content = html.Div(
                             [html.I(className="bi bi-plus-circle me-2"), "Add New Item Batch"],
                             id='add-item-batch-button',
                             className='add-item-batch-button mt-4'
-                        )
+                        ),
+                        html.Div(id='expiry-action-panel', className='mt-3')
                     ]
                 ),
             ],
@@ -842,6 +591,12 @@ expiry_management_content = html.Div(
                                     html.P(id="expiring-30-days-count", className="expiry-overview-value text-info"),
                                 ], className="expiry-overview-item"
                             ),
+                            html.Div(
+                                [
+                                    html.P("At Risk of Waste:", className="expiry-overview-label"),
+                                    html.P(id="at-risk-count", className="expiry-overview-value text-danger"),
+                                ], className="expiry-overview-item"
+                            ),
                         ],
                         className="analytics-card"
                     ),
@@ -866,9 +621,122 @@ expiry_management_content = html.Div(
 )
 
 
+# Sustainability Tracker Page Content
+sustainability_layout = html.Div(
+    [
+        html.Div(
+            [
+                html.H3("Sustainability Tracker", className="dashboard-header-title"),
+                html.P("Waste, carbon footprint and disposal cost of expired stock over the last 12 months.", className="text-muted"),
+                html.Img(src="/assets/user_avatar.png", className="user-avatar")
+            ],
+            className="dashboard-header"
+        ),
+        html.Div(
+            [
+                html.Span("Location: ", className="me-2"),
+                dcc.Dropdown(
+                    id='sustainability-location-dropdown',
+                    options=[{'label': 'All Locations', 'value': 'all'}],
+                    value='all',
+                    clearable=False,
+                    style={'width': '200px', 'display': 'inline-block', 'verticalAlign': 'middle'}
+                )
+            ],
+            className="d-flex align-items-center justify-content-end mb-3"
+        ),
+        dbc.Row(
+            [
+                dbc.Col(
+                    dbc.Card(
+                        [
+                            html.P("Wasted Stock", className="metric-label"),
+                            html.Div([
+                                html.H3(id="sustainability-waste-value", className="metric-value"),
+                                html.Span(id="sustainability-waste-change", className="metric-change")
+                            ], className="d-flex align-items-center"),
+                        ],
+                        className="metric-card"
+                    ),
+                    md=4
+                ),
+                dbc.Col(
+                    dbc.Card(
+                        [
+                            html.P("Carbon Footprint", className="metric-label"),
+                            html.Div([
+                                html.H3(id="sustainability-co2e-value", className="metric-value"),
+                                html.Span(id="sustainability-co2e-change", className="metric-change")
+                            ], className="d-flex align-items-center"),
+                        ],
+                        className="metric-card"
+                    ),
+                    md=4
+                ),
+                dbc.Col(
+                    dbc.Card(
+                        [
+                            html.P("Disposal Cost", className="metric-label"),
+                            html.Div([
+                                html.H3(id="sustainability-cost-value", className="metric-value"),
+                                html.Span(id="sustainability-cost-change", className="metric-change")
+                            ], className="d-flex align-items-center"),
+                        ],
+                        className="metric-card"
+                    ),
+                    md=4
+                ),
+            ],
+            className="mb-4"
+        ),
+        dbc.Row(
+            [
+                dbc.Col(
+                    dbc.Card(
+                        [
+                            html.H5("Monthly CO2e by Location", className="card-title"),
+                            dcc.Graph(id='sustainability-monthly-chart', config={'displayModeBar': False})
+                        ],
+                        className="analytics-card"
+                    ),
+                    lg=7
+                ),
+                dbc.Col(
+                    dbc.Card(
+                        [
+                            html.H5("Footprint by Category", className="card-title"),
+                            dash_table.DataTable(
+                                id='sustainability-category-table',
+                                columns=[
+                                    {"name": "CATEGORY", "id": "CATEGORY"},
+                                    {"name": "WASTE (KG)", "id": "WASTE (KG)"},
+                                    {"name": "CO2E (KG)", "id": "CO2E (KG)"},
+                                    {"name": "DISPOSAL COST", "id": "DISPOSAL COST"},
+                                ],
+                                data=[],
+                                style_table={'overflowX': 'auto'},
+                                style_header={'backgroundColor': '#f8f9fa', 'fontWeight': 'bold', 'textAlign': 'left'},
+                                style_cell={'fontFamily': 'Inter, sans-serif', 'fontSize': '14px', 'textAlign': 'left', 'padding': '8px 12px'}
+                            )
+                        ],
+                        className="analytics-card"
+                    ),
+                    lg=5
+                ),
+            ],
+            className="mb-4"
+        ),
+    ],
+    className="content"
+)
+
+
 # Main App Layout
 app.layout = html.Div([
     dcc.Store(id='stored-data', data=app_data),
+    dcc.Store(id='stored-data-sequence', data=app_data.get('stream_sequence', 0)), # Last streamed batch in stored-data
+    dcc.Store(id='live-sales-sequence', data=0), # Latest streamed sales batch the dashboard has picked up
+    dcc.Store(id='live-sales-reload', data=0), # Set when stored-data trails the stream too far to catch up in memory
     dcc.Location(id='url', refresh=False),
     
     # --- NEW: Stores for time aggregation state ---
@@ -909,6 +777,8 @@ def display_page(pathname):
     elif pathname == '/sales-trends': 
         page_layout = sales_trends_layout
         content_class = "content-container p-4"
+    elif pathname == '/sustainability':
+        page_layout = sustainability_layout
         
     return page_layout, content_class # This line handles all returns correctly
 
@@ -923,61 +793,69 @@ def display_page(pathname):
         Output('expiring-items-value', 'children'),
         Output('expiring-items-change', 'children'),
         Output('expiring-items-change', 'className'),
+        Output('items-in-stock-capacity', 'children'),
+        Output('dashboard-location-dropdown', 'options'),
     ],
-    Input('stored-data', 'data')
+    Input('stored-data', 'data'),
+    Input('live-sales-sequence', 'data'), # Streamed sales are folded into the snapshot
+    Input('dashboard-location-dropdown', 'value')
 )
-def update_realtime_metrics(data):
-    metrics = get_realtime_metrics(data)
-    stock_class = f"metric-change {metrics['stock_change_class']}"
+def update_realtime_metrics(data, live_sequence, location):
+    snapshot = get_dashboard_snapshot(data)
+    metrics, stock = snapshot['metrics'], snapshot['stock']
+    selected = stock.get(location, stock[ALL_LOCATIONS])
+    location_options = [{'label': 'All Locations', 'value': ALL_LOCATIONS}] + \
+        [{'label': stock[location_id]['name'], 'value': location_id} for location_id in sorted(stock) if location_id != ALL_LOCATIONS]
+    stock_class = f"metric-change {selected['stock_change_class']}"
     reorder_class = f"metric-change {metrics['reorder_change_class']}"
     expiring_class = f"metric-change {metrics['expiring_change_class']}"
     return (
-        metrics['items_in_stock'], html.Span([html.I(className="bi bi-arrow-up-right"), metrics['stock_change']]), stock_class,
+        selected['items_in_stock_text'], html.Span([html.I(className="bi bi-arrow-up-right"), selected['stock_change']]), stock_class,
         metrics['reorder_recommendations'], html.Span([html.I(className="bi bi-arrow-up-right"), metrics['reorder_change']]), reorder_class,
-        html.Span(metrics['expiring_items']), html.Span([html.I(className="bi bi-arrow-down-right"), metrics['expiring_change']]), expiring_class
+        html.Span(metrics['expiring_items']), html.Span([html.I(className="bi bi-arrow-down-right"), metrics['expiring_change']]), expiring_class,
+        selected['capacity_text'], location_options
     )
 
 @app.callback(
     [Output('sales-over-time-chart', 'figure'),
      Output('sales-over-time-summary', 'children')],
-    [Input('stored-data', 'data')]
+    [Input('stored-data', 'data'),
+     Input('live-sales-sequence', 'data')]
 )
-def update_sales_chart(data):
-    monthly_sales = get_sales_data_for_chart(data)
-    total_sales_str, percentage_change_str = calculate_last_5_months_sales_change(data)
-
-    if monthly_sales.empty:
-        fig = go.Figure()
-    else:
-        fig = px.line(monthly_sales, x='SaleDate', y='TotalPrice', markers=True,
-                      line_shape='linear',
-                      color_discrete_sequence=['#1abc9c'])
-
-        fig.update_xaxes(
-            tickvals=monthly_sales['SaleDate'],
-            ticktext=monthly_sales['SaleDate'].dt.strftime('%b'),
-            showgrid=False, showline=False, zeroline=False
-        )
-        fig.update_yaxes(
-            showgrid=True, gridcolor='#e0e0e0', showline=False, zeroline=False, showticklabels=True
-        )
+def update_sales_chart(data, live_sequence):
+    snapshot = get_dashboard_snapshot(data)
+    monthly_sales = snapshot['monthly_sales']
+    total_sales_str, percentage_change_str = snapshot['sales_total'], snapshot['sales_change']
+
+    def build():
+        if monthly_sales.empty:
+            return build_figure('dashboard-sales', [])
+        xaxis = dict(FIGURE_LAYOUTS['dashboard-sales']['xaxis'], tickvals=monthly_sales['SaleDate'],
+                     ticktext=monthly_sales['SaleDate'].dt.strftime('%b'))
+        trace = {
+            'type': 'scatter', 'mode': 'lines+markers',
+            'x': monthly_sales['SaleDate'], 'y': monthly_sales['TotalPrice'],
+            'line': {'color': '#1abc9c', 'shape': 'linear'}, 'showlegend': False,
+            'hovertemplate': 'SaleDate=%{x}<br>TotalPrice=%{y}<extra></extra>',
+        }
+        return build_figure('dashboard-sales', [trace], xaxis=xaxis)
 
-    fig.update_layout(
-        margin=dict(l=20, r=20, t=20, b=20),
-        plot_bgcolor='white', paper_bgcolor='white',
-        xaxis_title=None, yaxis_title=None,
-        hovermode='x unified', font=dict(family="Inter, sans-serif")
-    )
+    if snapshot['live_sequence'] is None:
+        fig = cached_figure(data, 'sales-over-time-chart', (datetime.now().date(),), build)
+    else: # Superseded by the next streamed batch; not worth a cache slot
+        fig = build()
     summary_text = f"₹{total_sales_str} Last 5 Months {percentage_change_str}"
     return fig, summary_text
 
 @app.callback(
     [Output('total-profit-value', 'children'),
      Output('category-profit-bars-container', 'children')],
-    [Input('stored-data', 'data')]
+    [Input('stored-data', 'data'),
+     Input('live-sales-sequence', 'data')]
 )
-def update_profit_categories(data):
-    category_profit, total_profit = get_top_categories_in_profit(data)
+def update_profit_categories(data, live_sequence):
+    snapshot = get_dashboard_snapshot(data)
+    category_profit, total_profit = snapshot['category_profit'], snapshot['total_profit']
     total_profit_formatted = f"₹{total_profit:,.0f}"
     bars_children = []
 
@@ -1008,6 +886,39 @@ def update_profit_categories(data):
             )
     return total_profit_formatted, bars_children
 
+@app.callback(
+    Output('live-sales-sequence', 'data'),
+    Output('live-sales-reload', 'data'),
+    Input('live-sales-interval', 'n_intervals'),
+    State('live-sales-sequence', 'data'),
+    State('stored-data-sequence', 'data')
+)
+def poll_live_sales(n_intervals, current_sequence, loaded_sequence):
+    # Only a new batch triggers the dashboard tiles; stored data that trails the stream too far is reloaded
+    # before the batches it still needs drop out of memory
+    sequence = stream_sequence()
+    reload = sequence if reload_needed(loaded_sequence) else dash.no_update
+    return (dash.no_update if sequence == current_sequence else sequence), reload
+
+@server.before_request
+def watch_drop_folder():
+    # Every serving process watches the drop folder, whatever started it (a WSGI server, debug or not);
+    # the first request starts the watcher, later ones return straight away
+    start_drop_folder_watcher(DATA_DIR)
+
+@server.route('/api/sales/batch', methods=['POST'])
+def post_sales_batch():
+    """Streams a batch of sales in: a JSON list of sale records ({"sales": [...]} also works) or a text/csv body."""
+    try:
+        if request.mimetype == 'text/csv':
+            records = pd.read_csv(io.StringIO(request.get_data(as_text=True)))
+        else:
+            records = sales_records(request.get_json(force=True))
+        result = ingest_sales(records, DATA_DIR)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result)
+
 @app.callback(
     Output('notifications-list', 'children'),
     Input('stored-data', 'data')
@@ -1025,6 +936,10 @@ def update_notifications(data):
             icon_class = "bi bi-trash-fill text-success"
         elif notification['type'] == 'low_stock':
             icon_class = "bi bi-box-fill text-danger"
+        elif notification['type'] == 'stockout_risk':
+            icon_class = "bi bi-graph-down-arrow text-danger"
+        elif notification['type'] == 'late_supplier':
+            icon_class = "bi bi-truck text-warning"
         elif notification['type'] == 'pending_invoice':
             icon_class = "bi bi-file-earmark-text text-warning"
         notification_elements.append(
@@ -1045,46 +960,114 @@ def update_notifications(data):
     [Input('stored-data', 'data')]
 )
 def update_sustainability_insights(data):
-    # Get overall quarterly waste for the summary text
-    overall_waste_summary = calculate_overall_quarterly_waste(data) # Calling the new quarterly function
-    total_waste_text = overall_waste_summary['total_waste_text']
-    waste_change_text = overall_waste_summary['change_text']
-
-    # Get monthly waste data for the bar chart (last 3 months for the quarter)
-    monthly_data_for_chart = get_monthly_waste_data_for_chart(data, num_months=3) # Requesting 3 months for the chart
-    waste_df_monthly = monthly_data_for_chart['df']
+    waste = get_dashboard_snapshot(data)['waste']
+    total_waste_text = waste['total_waste_text']
+    waste_change_text = waste['change_text']
+
+    # Monthly waste bars for the last 3 months (the quarter)
+    waste_df_monthly = pd.DataFrame({'Month': waste['months'], 'Waste_KGS': waste['waste_kilos']})
+
+    def build():
+        if waste_df_monthly.empty:
+            return go.Figure().to_dict()
+        trace = {
+            'type': 'bar', 'x': waste_df_monthly['Month'], 'y': waste_df_monthly['Waste_KGS'], # 'Month' holds 'Feb', 'Mar', etc.
+            'marker': {'color': '#a0d9b4', 'line': {'width': 0}}, 'showlegend': False,
+            'hovertemplate': 'Month=%{x}<br>Waste_KGS=%{y}<extra></extra>',
+        }
+        return build_figure('dashboard-waste', [trace])
 
-    if waste_df_monthly.empty:
-        fig = go.Figure()
-    else:
-        fig = px.bar(waste_df_monthly, x='Month', y='Waste_KGS', # 'Month' column contains 'Feb', 'Mar', etc.
-                     color_discrete_sequence=['#a0d9b4'])
-
-        fig.update_layout(
-            margin=dict(l=0, r=0, t=0, b=0),
-            plot_bgcolor='white', paper_bgcolor='white',
-            xaxis_title=None, yaxis_title=None,
-            xaxis=dict(showgrid=False, showline=False, zeroline=False),
-            yaxis=dict(showgrid=False, showline=False, zeroline=False, showticklabels=False),
-            hovermode='x unified', font=dict(family="Inter, sans-serif")
-        )
-        fig.update_traces(marker_line_width=0)
+    fig = cached_figure(data, 'monthly-waste-chart', (datetime.now().date(),), build)
 
     # The summary text now indicates "Last Quarter"
     return fig, total_waste_text, f"Last Quarter {waste_change_text}"
 
 
+@app.callback(
+    [Output('sustainability-waste-value', 'children'),
+     Output('sustainability-waste-change', 'children'),
+     Output('sustainability-waste-change', 'className'),
+     Output('sustainability-co2e-value', 'children'),
+     Output('sustainability-co2e-change', 'children'),
+     Output('sustainability-co2e-change', 'className'),
+     Output('sustainability-cost-value', 'children'),
+     Output('sustainability-cost-change', 'children'),
+     Output('sustainability-cost-change', 'className'),
+     Output('sustainability-monthly-chart', 'figure'),
+     Output('sustainability-category-table', 'data'),
+     Output('sustainability-location-dropdown', 'options')],
+    [Input('stored-data', 'data'),
+     Input('sustainability-location-dropdown', 'value')]
+)
+def update_sustainability_tracker(data, location):
+    summary = get_sustainability_summary(data, location=location)
+    totals, previous = summary['totals'], summary['previous_totals']
+
+    def change(column):
+        # Less waste than the previous 12 months is the good direction
+        percent = ((totals[column] - previous[column]) / previous[column]) * 100 if previous[column] else 0
+        return f"{percent:+.0f}%", 'metric-change ' + ('positive' if percent <= 0 else 'negative')
+
+    monthly = summary['monthly']
+
+    def build():
+        if monthly.empty:
+            return go.Figure().to_dict()
+        months = monthly['Month'].dt.strftime('%b %Y')
+        traces = [
+            {'type': 'bar', 'name': str(location_id), 'legendgroup': str(location_id),
+             'x': months[rows.index], 'y': rows['CO2eKg'],
+             'marker': {'color': CHART_COLORS[position % len(CHART_COLORS)]},
+             'hovertemplate': f'Location={location_id}<br>Month=%{{x}}<br>kg CO2e=%{{y}}<extra></extra>'}
+            for position, (location_id, rows) in enumerate(monthly.groupby('LocationID', sort=False))
+        ]
+        xaxis = dict(FIGURE_LAYOUTS['sustainability-monthly']['xaxis'],
+                     categoryarray=[month.strftime('%b %Y') for month in summary['months']])
+        return build_figure('sustainability-monthly', traces, xaxis=xaxis)
+
+    fig = cached_figure(data, 'sustainability-monthly-chart', (location, datetime.now().date()), build)
+
+    by_category = summary['by_category']
+    table_data = [
+        {'CATEGORY': row.Category, 'WASTE (KG)': f"{row.WasteKg:,.0f}", 'CO2E (KG)': f"{row.CO2eKg:,.0f}",
+         'DISPOSAL COST': f"₹{row.DisposalCost:,.0f}"}
+        for row in by_category.itertuples()
+    ]
+    location_options = [{'label': 'All Locations', 'value': 'all'}] + \
+        [{'label': location_id, 'value': location_id} for location_id in summary['locations']]
+
+    waste_change, waste_class = change('WasteKg')
+    co2e_change, co2e_class = change('CO2eKg')
+    cost_change, cost_class = change('DisposalCost')
+    return (
+        f"{totals['WasteKg']:,.0f} kg", waste_change, waste_class,
+        f"{totals['CO2eKg'] / 1000:,.1f} t CO2e", co2e_change, co2e_class,
+        f"₹{totals['DisposalCost']:,.0f}", cost_change, cost_class,
+        fig, table_data, location_options
+    )
+
+
 # Callbacks for Expiry Management Page
 @app.callback(
     [Output('expiry-table', 'data'),
+     Output('expiry-table', 'page_count'),
+     Output('expiry-table', 'page_current'),
      Output('expired-items-count', 'children'),
      Output('expiring-7-days-count', 'children'),
-     Output('expiring-30-days-count', 'children')],
+     Output('expiring-30-days-count', 'children'),
+     Output('at-risk-count', 'children')],
     [Input('stored-data', 'data'),
-     Input('expiry-view-dropdown', 'value')]
+     Input('expiry-view-dropdown', 'value'),
+     Input('expiry-table', 'page_current'),
+     Input('expiry-table', 'page_size')]
 )
-def update_expiry_data(data, view_filter):
-    table_data_df, expiry_overview_metrics = get_expiry_data(data, view_filter)
+def update_expiry_data(data, view_filter, page_current, page_size):
+    # A new view or dataset starts again from the first page
+    if dash.callback_context.triggered_id != 'expiry-table':
+        page_current = 0
+    page_current = page_current or 0
+    table_data_df, expiry_overview_metrics, total_rows = get_expiry_data(data, view_filter, page_current, page_size)
+    page_count = max(1, -(-total_rows // page_size)) if page_size else 1
 
     # Convert DataFrame to a list of dictionaries (records)
     records = table_data_df.to_dict('records')
@@ -1096,34 +1079,66 @@ def update_expiry_data(data, view_filter):
     
     return (
         records,
+        page_count,
+        page_current,
         expiry_overview_metrics['expired'],
         expiry_overview_metrics['expiring_7'],
-        expiry_overview_metrics['expiring_30']
+        expiry_overview_metrics['expiring_30'],
+        expiry_overview_metrics['at_risk']
     )
     
    # --- Callback to handle cell clicks (modified slightly for clarity) ---
 @app.callback(
-    Output('some-output-div', 'children'), # Make sure this div exists in your layout
+    Output('expiry-action-panel', 'children'),
     Input('expiry-table', 'active_cell'),
-    State('expiry-table', 'data')
+    State('expiry-table', 'data'),
+    State('stored-data', 'data')
 )
-def handle_action_cell_click(active_cell, table_data):
+def handle_action_cell_click(active_cell, table_data, stored_data_json):
     print("Active Cell:", active_cell) # Keep this for debugging in your terminal
-    if active_cell:
+    if active_cell and table_data:
         row_id = active_cell['row']
         column_id = active_cell['column_id']
-        # The value will be "[Discount](javascript:void(0)) | [Dispose](javascript:void(0))"
 
-        if column_id == 'ACTIONS':
+        if column_id == 'ACTIONS' and row_id < len(table_data):
             clicked_row_data = table_data[row_id]
             stock_id = clicked_row_data['STOCK ID']
 
-            
+            # Recommendation from the cached predicted-waste table
+            df_stock, _ = get_expiry_index(stored_data_json)
+            predicted_waste = get_predicted_waste(stored_data_json)
+            markdown_plan = get_markdown_plan(stored_data_json)
+            matches = np.flatnonzero(df_stock['StockID'].to_numpy() == stock_id)
+            discount_label = "Discount This Item"
+            if len(matches):
+                prediction = predicted_waste.iloc[matches[0]]
+                recommended = prediction['Action']
+                if recommended == ACTION_DISPOSE:
+                    advice = f"Expired: {prediction['PredictedWaste']:,.0f} units can no longer be sold. Recommended: Dispose."
+                elif recommended == ACTION_DISCOUNT:
+                    advice = (f"At current demand ({prediction['DailyDemand']:.1f} units/day) about {prediction['PredictedWaste']:,.0f} "
+                              f"of {clicked_row_data['QUANTITY']} units will expire unsold in {prediction['DaysLeft']:.0f} days. "
+                              f"Recommended: Discount.")
+                    if stock_id in markdown_plan.index:
+                        markdown = markdown_plan.loc[stock_id]
+                        if markdown['BestDiscount'] > 0:
+                            discount_label = f"Discount {markdown['BestDiscount']:.0%}"
+                            advice += (f" Best markdown: {markdown['BestDiscount']:.0%} off, expected to sell {markdown['ExpectedUnitsSold']:,.0f} units "
+                                       f"and recover ₹{markdown['ExpectedRevenue']:,.0f} (₹{markdown['RevenueUplift']:,.0f} more than at full price).")
+                        else:
+                            advice += " A markdown would not recover more revenue than the full price."
+                else:
+                    advice = "Expected to sell through before expiry. No action needed."
+            else:
+                recommended, advice = None, "No prediction available for this item."
+
             return html.Div([
                 html.P(f"Action requested for Stock ID: {stock_id}."),
-                html.P("What action do you want to perform?"),
-                dbc.Button("Discount This Item", id={'type': 'final-action-btn', 'action': 'discount', 'stock_id': stock_id}, color="success", className="me-2"),
-                dbc.Button("Dispose This Item", id={'type': 'final-action-btn', 'action': 'dispose', 'stock_id': stock_id}, color="danger")
+                html.P(advice),
+                dbc.Button(discount_label, id={'type': 'final-action-btn', 'action': 'discount', 'stock_id': stock_id}, color="success", className="me-2",
+                           outline=recommended != ACTION_DISCOUNT, disabled=recommended == ACTION_DISPOSE),
+                dbc.Button("Dispose This Item", id={'type': 'final-action-btn', 'action': 'dispose', 'stock_id': stock_id}, color="danger",
+                           outline=recommended != ACTION_DISPOSE)
             ])
             
     return ""
@@ -1159,6 +1174,17 @@ stock_management_content = html.Div(
                         # Filter Dropdowns
                         dbc.Row(
                             [
+                                dbc.Col(
+                                    dcc.Dropdown(
+                                        id='stock-location-filter',
+                                        options=[{'label': 'All Locations', 'value': ALL_LOCATIONS}],
+                                        value=ALL_LOCATIONS,
+                                        placeholder="Location",
+                                        clearable=False,
+                                        className="filter-dropdown"
+                                    ),
+                                    md=3
+                                ),
                                 dbc.Col(
                                     dcc.Dropdown(
                                         id='stock-category-filter',
@@ -1168,7 +1194,7 @@ stock_management_content = html.Div(
                                         clearable=False,
                                         className="filter-dropdown"
                                     ),
-                                    md=4
+                                    md=3
                                 ),
                                 dbc.Col(
                                     dcc.Dropdown(
@@ -1179,7 +1205,7 @@ stock_management_content = html.Div(
                                         clearable=False,
                                         className="filter-dropdown"
                                     ),
-                                    md=4
+                                    md=3
                                 ),
                                 dbc.Col(
                                     dcc.Dropdown(
@@ -1195,11 +1221,12 @@ stock_management_content = html.Div(
                                         clearable=False,
                                         className="filter-dropdown"
                                     ),
-                                    md=4
+                                    md=3
                                 ),
                             ],
                             className="mb-4"
                         ),
+                        html.P(id='stock-location-summary', className="text-muted mb-3"), # Units and capacity use at the selected location
                         # Stock Table
                         dash_table.DataTable(
                             id='stock-table',
@@ -1297,9 +1324,27 @@ stock_management_content = html.Div(
 
 
 # --- Helper Function for Stock Management Data ---
-def get_stock_data(stored_data_json, search_term='', category_filter='all', supplier_filter='all', status_filter='all'):
+def get_stock_data(stored_data_json, search_term='', category_filter='all', supplier_filter='all', status_filter='all',
+                   location_filter=ALL_LOCATIONS):
     df_products = pd.read_json(io.StringIO(stored_data_json['products']), orient='split') if stored_data_json.get('products') else pd.DataFrame()
 
+    # Rows are catalog products; on-hand units come from the selected location's partition of the per-location
+    # stock engine where its ProductIDs match the catalog. All Locations keeps the catalog quantity of products
+    # without movements, a single location lists only the catalog products moved there.
+    on_hand, _ = catalog_on_hand(get_location_partitions(stored_data_json).get(location_filter), df_products)
+    if not df_products.empty and 'ProductID' in df_products.columns:
+        moved = df_products['ProductID'].isin(on_hand.index)
+        if location_filter != ALL_LOCATIONS:
+            df_products = df_products[moved]
+            moved = moved[moved]
+        if moved.any():
+            catalog_quantity = pd.to_numeric(df_products['quantity'], errors='coerce').to_numpy(dtype=float) \
+                if 'quantity' in df_products.columns else np.zeros(len(df_products))
+            df_products = df_products.assign(quantity=np.where(moved, on_hand.reindex(df_products['ProductID']).to_numpy(),
+                                                               catalog_quantity))
+            if (df_products['quantity'] % 1 == 0).all(): # Whole units display without a decimal point
+                df_products['quantity'] = df_products['quantity'].astype('int64')
+
     if df_products.empty:
         print("df_products is empty in get_stock_data.")
         return pd.DataFrame().to_dict('records')
@@ -1325,12 +1370,7 @@ def get_stock_data(stored_data_json, search_term='', category_filter='all', supp
         return pd.DataFrame().to_dict('records')
 
     # --- Calculate Stock Status ---
-    LOW_STOCK_THRESHOLD = 20
-    OUT_OF_STOCK_THRESHOLD = 0
-
-    df_products['STATUS'] = 'In Stock' # Default status
-    df_products.loc[df_products['quantity'] <= OUT_OF_STOCK_THRESHOLD, 'STATUS'] = 'Out of Stock'
-    df_products.loc[(df_products['quantity'] > OUT_OF_STOCK_THRESHOLD) & (df_products['quantity'] <= LOW_STOCK_THRESHOLD), 'STATUS'] = 'Low Stock'
+    df_products['STATUS'] = stock_status(df_products['quantity'])
     
     # --- Add ACTIONS column (Must be a Markdown string for DataTable rendering) ---
     # This markdown string will render as a clickable link.
@@ -1407,19 +1447,28 @@ def get_stock_data(stored_data_json, search_term='', category_filter='all', supp
 @app.callback(
     [Output('stock-table', 'data'),
      Output('stock-category-filter', 'options'),
-     Output('stock-supplier-filter', 'options')],
+     Output('stock-supplier-filter', 'options'),
+     Output('stock-location-filter', 'options'),
+     Output('stock-location-summary', 'children')],
     [Input('stored-data', 'data'),
      Input('stock-search-input', 'value'),
      Input('stock-category-filter', 'value'),
      Input('stock-supplier-filter', 'value'),
-     Input('stock-status-filter', 'value')]
+     Input('stock-status-filter', 'value'),
+     Input('stock-location-filter', 'value')]
 )
-def update_stock_table(data, search_term, category_filter, supplier_filter, status_filter):
+def update_stock_table(data, search_term, category_filter, supplier_filter, status_filter, location_filter):
+    location_filter = location_filter or ALL_LOCATIONS
     # Get data for the table based on filters
-    filtered_stock_data = get_stock_data(data, search_term, category_filter, supplier_filter, status_filter)
+    filtered_stock_data = get_stock_data(data, search_term, category_filter, supplier_filter, status_filter, location_filter)
 
-    # Get unique categories and suppliers for dropdown options
+    # Get unique categories and suppliers for dropdown options (from the catalog products the table can list)
+    partitions = get_location_partitions(data)
+    partition = partitions.get(location_filter)
     df_products = pd.read_json(io.StringIO(data['products']), orient='split') if data.get('products') else pd.DataFrame()
+    on_hand, unmatched = catalog_on_hand(partition, df_products)
+    if location_filter != ALL_LOCATIONS and not df_products.empty:
+        df_products = df_products[df_products['ProductID'].isin(on_hand.index)]
     
     categories = [{'label': 'All Categories', 'value': 'all'}]
     if not df_products.empty and 'Category' in df_products.columns:
@@ -1428,8 +1477,40 @@ def update_stock_table(data, search_term, category_filter, supplier_filter, stat
     suppliers = [{'label': 'All Suppliers', 'value': 'all'}]
     if not df_products.empty and 'Supplier' in df_products.columns:
         suppliers.extend([{'label': sup, 'value': sup} for sup in df_products['Supplier'].unique()])
+
+    locations = [{'label': 'All Locations', 'value': ALL_LOCATIONS}] + \
+        [{'label': partitions[location_id]['name'], 'value': location_id} for location_id in sorted(partitions)
+         if location_id != ALL_LOCATIONS]
+    summary = "No stock movements loaded: quantities are the catalog's." if location_filter == ALL_LOCATIONS else ""
+    if partition is not None and not partition['stock'].empty:
+        kpis = partition['kpis']
+        summary = (f"{partition['name']}: {kpis['Units']:,.0f} units of {kpis['Products']} products on hand "
+                   f"({kpis['LowStock']} low, {kpis['OutOfStock']} out of stock), {capacity_text(kpis)}.")
+        if on_hand.empty and location_filter == ALL_LOCATIONS:
+            summary += " Listed quantities are the catalog's."
+    summary = ' '.join(filter(None, [summary, unmatched_text(unmatched)]))
     
-    return filtered_stock_data, categories, suppliers
+    return filtered_stock_data, categories, suppliers, locations, summary
+
+def product_drilldown(product_id):
+    """Last restock, recent units sold and stock by location for one product, as indexed SQLite lookups."""
+    details = {'last_restocked': 'N/A', 'units_sold': 'N/A', 'stock_by_location': 'N/A'}
+    if not SQL_DB_PATH or not os.path.exists(SQL_DB_PATH):
+        return details
+    try:
+        last_purchase = last_purchase_date(SQL_DB_PATH, product_id)
+        today = datetime.now().date()
+        recent_sales = product_daily_sales(SQL_DB_PATH, product_id, today - timedelta(days=DRILLDOWN_SALES_DAYS - 1), today)
+        stock = product_stock_by_location(SQL_DB_PATH, product_id)
+    except sqlite3.Error as e:
+        print(f"Warning: product drilldown failed for {product_id}: {e}")
+        return details
+    if last_purchase is not None:
+        details['last_restocked'] = last_purchase.strftime('%d %b %Y')
+    details['units_sold'] = f"{recent_sales['Quantity'].sum():,.0f} units (₹{recent_sales['TotalPrice'].sum():,.0f})"
+    if not stock.empty:
+        details['stock_by_location'] = ', '.join(f"{row.LocationID}: {row.NetQuantity:,.0f}" for row in stock.itertuples())
+    return details
 
 # --- Callback for 'View' button in Stock Table (using active_cell) ---
 @app.callback(
@@ -1438,10 +1519,11 @@ def update_stock_table(data, search_term, category_filter, supplier_filter, stat
     [Input('stock-table', 'active_cell'), # <--- CHANGED: Listen to active_cell of the DataTable
      Input('close-stock-details-modal', 'n_clicks')], # Input for closing the modal
     [State('stock-table', 'data'),         # <--- ADDED: State to access the full table data
-     State('stock-details-modal', 'is_open')],
+     State('stock-details-modal', 'is_open'),
+     State('stored-data', 'data')],
     prevent_initial_call=True
 )
-def toggle_stock_details_modal(active_cell, close_n_clicks, table_data, is_open): # <--- UPDATED ARGUMENTS
+def toggle_stock_details_modal(active_cell, close_n_clicks, table_data, is_open, stored_data_json): # <--- UPDATED ARGUMENTS
     ctx = dash.callback_context
 
     if not ctx.triggered:
@@ -1479,12 +1561,21 @@ def toggle_stock_details_modal(active_cell, close_n_clicks, table_data, is_open)
 
             # Inventory Details
             minimum_stock = clicked_row_data.get('ReorderPoint', 'N/A')
-            last_restocked = 'N/A' # Not in CSV - will be N/A
+            drilldown = product_drilldown(stock_id)
+            last_restocked = drilldown['last_restocked']
 
             # Supplier contact
             phone = 'N/A' # Not in CSV - will be N/A
             email = 'N/A' # Not in CSV - will be N/A
 
+            # Service-level safety stock (same cached table the reorder page uses)
+            safety_stock = 'N/A'
+            reorder_level = 'N/A'
+            safety_stock_df = get_safety_stock(stored_data_json)
+            if stock_id in safety_stock_df.index:
+                safety_stock = f"{safety_stock_df.at[stock_id, 'SafetyStock']:.0f} units ({DEFAULT_SERVICE_LEVEL*100:.0f}% service level)"
+                reorder_level = f"{safety_stock_df.at[stock_id, 'ReorderLevel']:.0f} units"
+
             # --- Calculations for Price and Profitability ---
             profit_margin = 'N/A'
             total_cost_value = 'N/A'
@@ -1547,6 +1638,14 @@ def toggle_stock_details_modal(active_cell, close_n_clicks, table_data, is_open)
                     dbc.Col(html.P(f"Total quantity: {raw_quantity} {unit_of_measure}"), width=6), # Assuming this is current stock again
                     dbc.Col(html.P(f"Last Restocked: {last_restocked}"), width=6),
                 ]),
+                dbc.Row([
+                    dbc.Col(html.P(f"Safety stock: {safety_stock}"), width=6),
+                    dbc.Col(html.P(f"Reorder level: {reorder_level}"), width=6),
+                ]),
+                dbc.Row([
+                    dbc.Col(html.P(f"Sold (last {DRILLDOWN_SALES_DAYS} days): {drilldown['units_sold']}"), width=6),
+                    dbc.Col(html.P(f"Stock by location: {drilldown['stock_by_location']}"), width=6),
+                ]),
 
                 # Supplier Contact
                 html.H5("Supplier Contact", className="mb-2 mt-4"),
@@ -1681,6 +1780,14 @@ reorder_recommendations_layout = html.Div(className="main-content-area p-3", chi
                         'color': '#1abc9c', # Turquoise
                         'fontWeight': 'bold'
                     },
+                    {
+                        'if': {
+                            'column_id': 'REASON FOR REORDER',
+                            'filter_query': '{REASON FOR REORDER} eq "Upcoming Promotion"'
+                        },
+                        'color': '#8e44ad', # Purple
+                        'fontWeight': 'bold'
+                    },
                     {
                         'if': {
                             'column_id': 'REASON FOR REORDER',
@@ -1730,37 +1837,38 @@ reorder_recommendations_layout = html.Div(className="main-content-area p-3", chi
 # You must have dcc.Store(id='stored-data') in your app.layout for this to work.
 @app.callback(
     Output('stored-data', 'data'),
-    Input('url', 'pathname') # Triggered on initial load and URL changes
+    Output('stored-data-sequence', 'data'),
+    Input('url', 'pathname'), # Triggered on initial load and URL changes
+    Input('live-sales-reload', 'data') # ... and when streamed sales outgrow what is kept in memory
 )
-def initialize_stored_data(pathname):
-    return load_data()
-
-
-# --- Global Constants for Demand Analysis (can be moved to config) ---
-SHORT_PERIOD_DAYS = 7
-LONG_PERIOD_DAYS = 30
-VERY_LONG_PERIOD_DAYS = 90
-SALES_SPIKE_FACTOR = 1.5
-UPWARD_TREND_FACTOR = 1.2
-HIGH_VOLUME_THRESHOLD = 5 # units per day for consistent high sales
+def initialize_stored_data(pathname, reload):
+    data = load_data()
+    return data, data.get('stream_sequence', 0)
 
 
 # Mock functions for demonstration of logic if not already defined in the environment
 # These should be replaced by your actual imported functions if running in a full app context.
-def calculate_reorder_qty_placeholder(product_id, stock_qty, reorder_point, status_reorder, demand_proxy, avg_lead_time_days, safety_stock_buffer):
+def calculate_reorder_qty_placeholder(product_id, stock_qty, reorder_point, status_reorder, demand_proxy, avg_lead_time_days, safety_stock_buffer, safety_stock_units=None):
     # Simplified placeholder for calculation
+    lead_time_demand = demand_proxy.get(product_id, 0) * avg_lead_time_days
+    # Service-level safety stock (in units) from safety_stock.py when available, flat % buffer otherwise
+    if safety_stock_units is not None and product_id in safety_stock_units:
+        target_stock = lead_time_demand + safety_stock_units[product_id]
+    else:
+        target_stock = lead_time_demand * (1 + safety_stock_buffer)
+
     # For core inventory reasons
     if status_reorder == 'Out of Stock':
-        return max(50, demand_proxy.get(product_id, 0) * avg_lead_time_days * (1 + safety_stock_buffer) * 2)
+        return max(50, target_stock * 2)
     elif status_reorder == 'Expired':
-         return max(50, demand_proxy.get(product_id, 0) * avg_lead_time_days * (1 + safety_stock_buffer) * 2) # Assume similar urgency as out of stock
+         return max(50, target_stock * 2) # Assume similar urgency as out of stock
     elif status_reorder == 'Low Stock':
-        return max(20, demand_proxy.get(product_id, 0) * avg_lead_time_days * (1 + safety_stock_buffer))
+        return max(20, target_stock)
     elif status_reorder == 'Expiring Soon':
-        return max(10, demand_proxy.get(product_id, 0) * avg_lead_time_days * (1 + safety_stock_buffer))
+        return max(10, target_stock)
     # For demand-driven/AI/ML reasons when stock is 'Adequate'
     else: # This covers 'Adequate' stock with demand-driven reasons
-        return max(0, demand_proxy.get(product_id, 0) * avg_lead_time_days * (1 + safety_stock_buffer)) # Ensure positive
+        return max(0, target_stock) # Ensure positive
 
 # --- Callbacks for Reorder Recommendations Page ---
 @app.callback(
@@ -1798,70 +1906,55 @@ def populate_reorder_table(stored_data_json):
     df_products['ReorderPoint'] = pd.to_numeric(df_products['ReorderPoint'], errors='coerce').fillna(0)
     df_products['PurchaseDate'] = pd.to_datetime(df_products['PurchaseDate'], errors='coerce')
     df_products['ExpiryDate'] = pd.to_datetime(df_products['ExpiryDate'], errors='coerce')
-    
+
+    # --- Reorder Quantity Parameters ---
+    AVG_LEAD_TIME_DAYS = DEFAULT_LEAD_TIME_DAYS # Fallback for products outside the safety-stock table
+    SAFETY_STOCK_BUFFER = 0.20 # Fallback 20% buffer when no service-level safety stock is available
+
+    # Per-SKU safety stock at the target service level (cached per dataset version)
+    safety_stock_df = get_safety_stock(stored_data_json)
+    safety_stock_units = safety_stock_df['SafetyStock'].to_dict()
+    lead_time_days = safety_stock_df['LeadTimeDays'].to_dict()
+
+    def planning_assumptions(product_id):
+        lead_time = lead_time_days.get(product_id, AVG_LEAD_TIME_DAYS)
+        if product_id in safety_stock_units:
+            return f"Lead time: {lead_time:.0f} days, Safety stock: {safety_stock_units[product_id]:.0f} units ({DEFAULT_SERVICE_LEVEL*100:.0f}% service level)."
+        return f"Lead time: {lead_time:.0f} days, Safety stock buffer: {SAFETY_STOCK_BUFFER*100}%."
+
     # --- Demand Forecasting and Trend Analysis (using sales data) ---
     demand_proxy = {} # Average daily sales over LONG_PERIOD_DAYS
     sales_analysis_flags = {} # To store HighDemand, UpwardTrend, ConsistentHighSales
 
     if not df_sales.empty and 'SaleDate' in df_sales.columns and 'Quantity' in df_sales.columns:
-        df_sales['SaleDate'] = pd.to_datetime(df_sales['SaleDate'], errors='coerce')
-        df_sales['Quantity'] = pd.to_numeric(df_sales['Quantity'], errors='coerce').fillna(0)
-        df_sales.dropna(subset=['SaleDate'], inplace=True) # Remove rows with invalid dates
-
-        # Calculate average daily sales for various periods
+        # Products x days matrix of units sold, ending today, analysed for all products at once
+        # (same windows and thresholds the backtester sweeps, see demand.demand_signals)
         today = datetime.now().date()
-        
-        # Aggregate sales by ProductID and Date
-        daily_sales = df_sales.groupby(['ProductID', df_sales['SaleDate'].dt.date])['Quantity'].sum().reset_index()
-        daily_sales.rename(columns={'SaleDate': 'Date'}, inplace=True)
-
-        for product_id in df_products['ProductID'].unique():
-            product_sales = daily_sales[daily_sales['ProductID'] == product_id]
-            
-            # Initialize flags
-            is_high_demand = False
-            is_upward_trend = False
-            is_consistent_high_sales = False
-
-            # Sales over different periods
-            sales_last_short_period = product_sales[product_sales['Date'] >= (today - timedelta(days=SHORT_PERIOD_DAYS))]['Quantity'].sum()
-            sales_prev_short_period = product_sales[(product_sales['Date'] >= (today - timedelta(days=SHORT_PERIOD_DAYS * 2))) & (product_sales['Date'] < (today - timedelta(days=SHORT_PERIOD_DAYS)))]['Quantity'].sum()
-
-            sales_last_long_period = product_sales[product_sales['Date'] >= (today - timedelta(days=LONG_PERIOD_DAYS))]['Quantity'].sum()
-            sales_prev_long_period = product_sales[(product_sales['Date'] >= (today - timedelta(days=LONG_PERIOD_DAYS * 2))) & (product_sales['Date'] < (today - timedelta(days=LONG_PERIOD_DAYS)))]['Quantity'].sum()
-
-            sales_very_long_period = product_sales[product_sales['Date'] >= (today - timedelta(days=VERY_LONG_PERIOD_DAYS))]['Quantity'].sum()
-
-            avg_daily_sales_last_short = sales_last_short_period / SHORT_PERIOD_DAYS if SHORT_PERIOD_DAYS > 0 else 0
-            avg_daily_sales_prev_short = sales_prev_short_period / SHORT_PERIOD_DAYS if SHORT_PERIOD_DAYS > 0 else 0
-            avg_daily_sales_last_long = sales_last_long_period / LONG_PERIOD_DAYS if LONG_PERIOD_DAYS > 0 else 0
-            avg_daily_sales_prev_long = sales_prev_long_period / LONG_PERIOD_DAYS if LONG_PERIOD_DAYS > 0 else 0
-            avg_daily_sales_very_long = sales_very_long_period / VERY_LONG_PERIOD_DAYS if VERY_LONG_PERIOD_DAYS > 0 else 0
+        product_ids = df_products['ProductID'].unique()
+        daily_sales = daily_demand_matrix(df_sales, product_ids, today, max(LONG_PERIOD_DAYS * 2, VERY_LONG_PERIOD_DAYS) + 1)
+        signals = demand_signals(daily_sales, SALES_SPIKE_FACTOR, UPWARD_TREND_FACTOR, HIGH_VOLUME_THRESHOLD)
 
-
-            demand_proxy[product_id] = avg_daily_sales_last_long # Use recent long period for demand proxy
-
-            # Determine flags
-            # High Demand / Sales Spike
-            if avg_daily_sales_last_short > HIGH_VOLUME_THRESHOLD and avg_daily_sales_prev_short > 0 and avg_daily_sales_last_short >= avg_daily_sales_prev_short * SALES_SPIKE_FACTOR:
-                 is_high_demand = True
-            
-            # Upward Trend (check for a sustained increase over longer periods)
-            if not is_high_demand and avg_daily_sales_last_long > HIGH_VOLUME_THRESHOLD and avg_daily_sales_prev_long > 0 and avg_daily_sales_last_long >= avg_daily_sales_prev_long * UPWARD_TREND_FACTOR:
-                is_upward_trend = True
-
-            # Consistent High Sales Volume (check against a simple threshold)
-            if not is_high_demand and not is_upward_trend and avg_daily_sales_very_long >= HIGH_VOLUME_THRESHOLD:
-                is_consistent_high_sales = True
-            
+        demand_proxy = dict(zip(product_ids, signals['AvgDailyDemand'][:, -1])) # Use recent long period for demand proxy
+        for i, product_id in enumerate(product_ids):
             sales_analysis_flags[product_id] = {
-                'IsHighDemand': is_high_demand,
-                'IsUpwardTrend': is_upward_trend,
-                'IsConsistentHighSales': is_consistent_high_sales
+                'IsHighDemand': bool(signals['IsHighDemand'][i, -1]),
+                'IsUpwardTrend': bool(signals['IsUpwardTrend'][i, -1]),
+                'IsConsistentHighSales': bool(signals['IsConsistentHighSales'][i, -1])
             }
     else:
         print("Warning: Sales data is empty or missing required columns. Demand analysis skipped.")
 
+    # Products with a promotion starting soon: plan for their expected lift in demand
+    upcoming_promotions = get_upcoming_promotions(stored_data_json)
+    for product_id, expected_lift in upcoming_promotions['ExpectedLiftPct'].items():
+        if product_id in demand_proxy and pd.notna(expected_lift) and expected_lift > 0:
+            demand_proxy[product_id] *= 1 + expected_lift / 100
+
+    # ... and for the weather expected over the coming month, through the significant weather sensitivities
+    for product_id, weather_multiplier in get_weather_demand_outlook(stored_data_json).items():
+        if product_id in demand_proxy:
+            demand_proxy[product_id] *= weather_multiplier
+
     # --- Status Determination ---
     today = pd.to_datetime(datetime.now().date())
     df_products['STATUS_REORDER'] = 'Adequate'
@@ -1888,7 +1981,8 @@ def populate_reorder_table(stored_data_json):
         flags = sales_analysis_flags.get(product_id, {})
         
         # Only consider adding if current status is 'Adequate' and a demand flag is true
-        if row['STATUS_REORDER'] == 'Adequate' and (flags.get('IsHighDemand') or flags.get('IsUpwardTrend') or flags.get('IsConsistentHighSales')):
+        if row['STATUS_REORDER'] == 'Adequate' and (flags.get('IsHighDemand') or flags.get('IsUpwardTrend') or flags.get('IsConsistentHighSales')
+                                                    or product_id in upcoming_promotions.index):
             # Temporarily calculate recommended qty to ensure it would be positive for these demand reasons
             temp_recommended_qty = calculate_reorder_qty_placeholder(
                 row['ProductID'],
@@ -1896,8 +1990,9 @@ def populate_reorder_table(stored_data_json):
                 row['ReorderPoint'],
                 'Adequate', # Force 'Adequate' status for the temp calculation here
                 demand_proxy,
-                AVG_LEAD_TIME_DAYS,
-                SAFETY_STOCK_BUFFER
+                lead_time_days.get(product_id, AVG_LEAD_TIME_DAYS),
+                SAFETY_STOCK_BUFFER,
+                safety_stock_units
             )
             if temp_recommended_qty > 0:
                 demand_driven_products.append(row)
@@ -1912,9 +2007,6 @@ def populate_reorder_table(stored_data_json):
         return pd.DataFrame().to_dict('records')
 
     # --- Reorder Quantity Calculation (AI/ML Placeholder) ---
-    AVG_LEAD_TIME_DAYS = 7
-    SAFETY_STOCK_BUFFER = 0.20 # 20% safety stock
-
     reorder_candidates['RECOMMENDED QTY'] = reorder_candidates.apply(
         lambda row: calculate_reorder_qty_placeholder(
             row['ProductID'],
@@ -1922,8 +2014,9 @@ def populate_reorder_table(stored_data_json):
             row['ReorderPoint'],
             row['STATUS_REORDER'], # Use actual status, could be 'Adequate' for new additions
             demand_proxy,
-            AVG_LEAD_TIME_DAYS,
-            SAFETY_STOCK_BUFFER
+            lead_time_days.get(row['ProductID'], AVG_LEAD_TIME_DAYS),
+            SAFETY_STOCK_BUFFER,
+            safety_stock_units
         ),
         axis=1
     ).round().astype(int)
@@ -1948,7 +2041,9 @@ def populate_reorder_table(stored_data_json):
         flags = sales_analysis_flags.get(product_id, {})
         
         if row['RECOMMENDED QTY'] > 0: # Only assign these if a reorder is actually recommended
-            if flags.get('IsHighDemand'):
+            if product_id in upcoming_promotions.index:
+                return 'Upcoming Promotion'
+            elif flags.get('IsHighDemand'):
                 return 'High Demand / Sales Spike'
             elif flags.get('IsUpwardTrend'):
                 return 'Upward Trend'
@@ -1973,18 +2068,24 @@ def populate_reorder_table(stored_data_json):
             return 'Expiring Soon (Waste Mitigation): Product has an upcoming expiry date (e.g., within 30 days). Reordering is recommended to ensure fresh stock is available, while also prompting actions to sell or move existing expiring stock to minimize waste.'
         elif row['STATUS_REORDER'] == 'Expired':
             return 'Expired (Waste Mitigation): The product\'s shelf life has ended. These items are typically marked for disposal. A reorder recommendation here implies replacement of truly expired stock that has been removed from inventory.'
+        elif product_id in upcoming_promotions.index and row['RECOMMENDED QTY'] > 0:
+            promotion = upcoming_promotions.loc[product_id]
+            expected_lift = (f"Its expected promotion lift is {promotion['ExpectedLiftPct']:+.0f}% (its past promotions, weighted towards the promotion-wide lift where its own sales are thin)"
+                             + (", which is included in the demand estimate." if promotion['ExpectedLiftPct'] > 0 else ".")
+                             if pd.notna(promotion['ExpectedLiftPct']) else "No past promotion lift has been measured for this product.")
+            return f"Upcoming Promotion (Demand Uplift): '{promotion['PromotionName']}' starts on {promotion['PromotionStartDate']:%d %b %Y}. {expected_lift} Reordering ahead of the promotion avoids stockouts during it ({demand_info}). {planning_assumptions(product_id)}"
         elif flags.get('IsHighDemand'):
-            return f"High Demand / Sales Spike (Market Responsiveness): Current sales volumes are significantly higher than the historical average or forecast ({demand_info}), indicating an unexpected surge in customer demand. Could be due to unexpected market trends, competitor issues, sudden popularity, or effective marketing campaigns. Requires immediate reordering to capitalize on the opportunity and avoid lost sales. Lead time: {AVG_LEAD_TIME_DAYS} days, Safety stock buffer: {SAFETY_STOCK_BUFFER*100}%."
+            return f"High Demand / Sales Spike (Market Responsiveness): Current sales volumes are significantly higher than the historical average or forecast ({demand_info}), indicating an unexpected surge in customer demand. Could be due to unexpected market trends, competitor issues, sudden popularity, or effective marketing campaigns. Requires immediate reordering to capitalize on the opportunity and avoid lost sales. {planning_assumptions(product_id)}"
         elif flags.get('IsUpwardTrend'):
-            return f"Upward Trend (Growth & Anticipation): Analysis of sales data over a longer period reveals a consistent increase in sales volume ({demand_info}). This is a sustained growth pattern rather than a sudden spike. Suggests a growing market share or increasing popularity. Reordering proactively ensures you meet future demand, prevent stockouts, and maintain customer satisfaction as the product gains traction. Lead time: {AVG_LEAD_TIME_DAYS} days, Safety stock buffer: {SAFETY_STOCK_BUFFER*100}%."
+            return f"Upward Trend (Growth & Anticipation): Analysis of sales data over a longer period reveals a consistent increase in sales volume ({demand_info}). This is a sustained growth pattern rather than a sudden spike. Suggests a growing market share or increasing popularity. Reordering proactively ensures you meet future demand, prevent stockouts, and maintain customer satisfaction as the product gains traction. {planning_assumptions(product_id)}"
         elif flags.get('IsConsistentHighSales'):
-            return f"Consistent High Sales Volume (Stable Performance): The product consistently sells at a high volume ({demand_info}) over multiple periods, indicating it's a popular or staple item with reliable demand. These are 'cash cow' products. Reordering ensures you always have adequate stock to support ongoing, predictable high sales without interruption, optimizing inventory turnover. Lead time: {AVG_LEAD_TIME_DAYS} days, Safety stock buffer: {SAFETY_STOCK_BUFFER*100}%."
+            return f"Consistent High Sales Volume (Stable Performance): The product consistently sells at a high volume ({demand_info}) over multiple periods, indicating it's a popular or staple item with reliable demand. These are 'cash cow' products. Reordering ensures you always have adequate stock to support ongoing, predictable high sales without interruption, optimizing inventory turnover. {planning_assumptions(product_id)}"
         elif row['RECOMMENDED QTY'] > 0: # General AI/ML if not specifically categorized above but still recommended
              return (
                  f"AI/ML Recommendation (Predictive Optimization): This recommendation is generated by advanced algorithms considering multiple complex factors beyond simple thresholds. "
                  f"These could include: seasonality, promotional impact, supplier lead time fluctuations, economic indicators, or market basket analysis. "
                  f"Based on these predictive insights, the system anticipates future demand. This recommendation helps in capitalizing on opportunities and preventing potential stockouts. "
-                 f"Assumptions: Average lead time of {AVG_LEAD_TIME_DAYS} days and a safety stock buffer: {SAFETY_STOCK_BUFFER*100}%."
+                 f"Assumptions: {planning_assumptions(product_id)}"
              )
         return 'Adequate Stock: Current stock levels are sufficient and do not require immediate reordering.'
 
@@ -1993,7 +2094,9 @@ def populate_reorder_table(stored_data_json):
     reorder_candidates['REASON_FOR_REORDER_DETAIL_HIDDEN'] = reorder_candidates.apply(get_reorder_reason_detailed, axis=1)
     
     reorder_candidates['ADJUST QUANTITY'] = reorder_candidates['RECOMMENDED QTY']
-    reorder_candidates['CYCLIC REORDER'] = 'N/A'
+    # Joint EOQ review cycle per SKU (suppliers' SKUs are ordered together), cached per dataset version
+    order_cycles = get_order_cycles(stored_data_json)
+    reorder_candidates['CYCLIC REORDER'] = reorder_candidates['ProductID'].map(order_cycles['CycleLabel']).fillna('N/A')
 
     final_cols_for_table = [
         "ProductName", "Supplier", "StockQuantity", "PurchaseDate",
@@ -2066,199 +2169,32 @@ def display_modal(active_cell, n_clicks_close, data, is_open):
     # If no relevant trigger or condition met, keep modal state as is
     return is_open, dash.no_update
 
-# --- 1. Dummy Data Definitions ---
-# This data will be used to populate the tables for visual testing.
-# REMEMBER: You will need to replace this with logic that processes your real CSV data later.
-
-# Dummy Data for the TOP Summary Table (corrected 'Actions' column)
-dummy_summary_table_data = [
-    {
-        "Supplier Name": "Global Foods Inc.",
-        "Past Deliveries": "Avg 2 Days", # Updated as per request
-        "Phone No": "555-111-2222",
-        "Lead Time Variability": "Low", # Updated as per request
-        "Order Fulfillment (%)": "98.5%",
-        "Average Rating": 4.8,
-        "Actions": "View"
-    },
-    {
-        "Supplier Name": "Produce Pro Co.",
-        "Past Deliveries": "Avg 1.5 Days", # Updated as per request
-        "Phone No": "555-333-4444",
-        "Lead Time Variability": "Very Low", # Updated as per request
-        "Order Fulfillment (%)": "99.1%",
-        "Average Rating": 4.9,
-        "Actions": "View"
-    },
-    {
-        "Supplier Name": "Bakery Delights Ltd.",
-        "Past Deliveries": "Avg 3 Days", # Updated as per request
-        "Phone No": "555-555-6666",
-        "Lead Time Variability": "Medium", # Updated as per request
-        "Order Fulfillment (%)": "97.0%",
-        "Average Rating": 4.5,
-        "Actions": "View"
-    },
-    {
-        "Supplier Name": "Meat Masters LLC",
-        "Past Deliveries": "Avg 4 Days", # Updated as per request
-        "Phone No": "555-777-8888",
-        "Lead Time Variability": "High", # Updated as per request
-        "Order Fulfillment (%)": "95.2%",
-        "Average Rating": 4.2,
-        "Actions": "View"
-    },
-    {
-        "Supplier Name": "Beverage Best Corp.",
-        "Past Deliveries": "Avg 2.5 Days", # Updated as per request
-        "Phone No": "555-999-0000",
-        "Lead Time Variability": "Medium", # Updated as per request
-        "Order Fulfillment (%)": "98.0%",
-        "Average Rating": 4.7,
-        "Actions": "View"
-    }
-]
-
-# Define columns for the TOP Summary DataTable (no change needed here as names are already strings)
+# --- 1. Supplier Table Columns ---
+# Rows come from supplier_metrics.get_supplier_metrics, built from purchase_history and the catalog.
 summary_table_columns = [
     {"name": "Supplier Name", "id": "Supplier Name"},
-    {"name": "Past Deliveries", "id": "Past Deliveries"},
-    {"name": "Phone No", "id": "Phone No"},
+    {"name": "Products", "id": "Products"},
+    {"name": "Deliveries", "id": "Deliveries"},
+    {"name": "Avg Delivery Interval", "id": "Avg Delivery Interval"},
+    {"name": "Lead Time (days)", "id": "Lead Time (days)"},
     {"name": "Lead Time Variability", "id": "Lead Time Variability"},
-    {"name": "Order Fulfillment (%)", "id": "Order Fulfillment (%)"},
-    {"name": "Average Rating", "id": "Average Rating"},
-    {"name": "Actions", "id": "Actions", "presentation": "markdown"}
+    {"name": "Spend", "id": "Spend"},
+    {"name": "Unit Price", "id": "Unit Price"},
+    {"name": "Last Delivery", "id": "Last Delivery"},
 ]
 
-# NEW: Dummy Products List
-dummy_products = ["Bread", "Milk", "Eggs", "Cheese", "Meat", "Beverages"]
-
-# NEW: Granular Dummy Data for Supplier Performance per Product
-dummy_product_supplier_metrics = {
-    "Global Foods Inc.": {
-        "Bread": {
-            "Past Deliveries": "Avg 2 Days",
-            "Phone No": "555-111-2222",
-            "Lead Time Variability": "Low",
-            "Order Fulfillment (%)": "98.5%",
-            "Average Rating": 4.8,
-            "Quality Score": "9.0/10",
-            "Price per unit": 40
-        },
-        "Milk": {
-            "Past Deliveries": "Avg 1 Day",
-            "Phone No": "555-111-2222",
-            "Lead Time Variability": "Very Low",
-            "Order Fulfillment (%)": "99.0%",
-            "Average Rating": 4.9,
-            "Quality Score": "9.5/10",
-            "Price per unit": 60
-        },
-        "Eggs": {
-            "Past Deliveries": "Avg 2 Days",
-            "Phone No": "555-111-2222",
-            "Lead Time Variability": "Low",
-            "Order Fulfillment (%)": "98.0%",
-            "Average Rating": 4.7,
-            "Quality Score": "8.8/10",
-            "Price per unit": 120
-        },
-        "Cheese": {
-            "Past Deliveries": "Avg 3 Days",
-            "Phone No": "555-111-2222",
-            "Lead Time Variability": "Medium",
-            "Order Fulfillment (%)": "97.5%",
-            "Average Rating": 4.6,
-            "Quality Score": "8.5/10",
-            "Price per unit": 350
-        },
-        "Meat": {
-            "Past Deliveries": "Avg 4 Days",
-            "Phone No": "555-111-2222",
-            "Lead Time Variability": "High",
-            "Order Fulfillment (%)": "95.0%",
-            "Average Rating": 4.2,
-            "Quality Score": "8.0/10",
-            "Price per unit": 250
-        },
-        "Beverages": {
-            "Past Deliveries": "Avg 2.5 Days",
-            "Phone No": "555-111-2222",
-            "Lead Time Variability": "Medium",
-            "Order Fulfillment (%)": "98.0%",
-            "Average Rating": 4.7,
-            "Quality Score": "9.1/10",
-            "Price per unit": 100
-        }
-    },
-    "Produce Pro Co.": {
-        "Bread": {
-            "Past Deliveries": "Avg 1.5 Days",
-            "Phone No": "555-333-4444",
-            "Lead Time Variability": "Very Low",
-            "Order Fulfillment (%)": "99.1%",
-            "Average Rating": 4.9,
-            "Quality Score": "9.5/10",
-            "Price per unit": 45
-        },
-        "Milk": {
-            "Past Deliveries": "Avg 2 Days",
-            "Phone No": "555-333-4444",
-            "Lead Time Variability": "Low",
-            "Order Fulfillment (%)": "98.5%",
-            "Average Rating": 4.8,
-            "Quality Score": "9.2/10",
-            "Price per unit": 65
-        },
-        "Eggs": {
-            "Past Deliveries": "Avg 1.8 Days",
-            "Phone No": "555-333-4444",
-            "Lead Time Variability": "Very Low",
-            "Order Fulfillment (%)": "99.5%",
-            "Average Rating": 5.0,
-            "Quality Score": "9.8/10",
-            "Price per unit": 115
-        },
-        "Cheese": {
-            "Past Deliveries": "Avg 2.5 Days",
-            "Phone No": "555-333-4444",
-            "Lead Time Variability": "Low",
-            "Order Fulfillment (%)": "98.0%",
-            "Average Rating": 4.7,
-            "Quality Score": "9.0/10",
-            "Price per unit": 340
-        },
-        "Meat": {
-            "Past Deliveries": "Avg 3.5 Days",
-            "Phone No": "555-333-4444",
-            "Lead Time Variability": "Medium",
-            "Order Fulfillment (%)": "96.0%",
-            "Average Rating": 4.4,
-            "Quality Score": "8.5/10",
-            "Price per unit": 260
-        },
-        "Beverages": {
-            "Past Deliveries": "Avg 2 Days",
-            "Phone No": "555-333-4444",
-            "Lead Time Variability": "Low",
-            "Order Fulfillment (%)": "98.5%",
-            "Average Rating": 4.8,
-            "Quality Score": "9.3/10",
-            "Price per unit": 95
-        }
-    },
-    "Bakery Delights Ltd.": { # Add more product data for this supplier if needed
-         "Bread": {
-            "Past Deliveries": "Avg 2 Days",
-            "Phone No": "555-555-6666",
-            "Lead Time Variability": "Medium",
-            "Order Fulfillment (%)": "97.0%",
-            "Average Rating": 4.5,
-            "Quality Score": "8.7/10",
-            "Price per unit": 38
-        }
-    }
-}
+# Metrics compared per product in the comparison table, in display order
+comparison_metric_keys = [
+    "Deliveries",
+    "Avg Delivery Interval",
+    "Lead Time (days)",
+    "Lead Time Variability",
+    "Volume",
+    "Spend",
+    "Unit Price",
+    "Unit Price Trend",
+    "Last Delivery",
+]
 
 
 # --- 2. Supplier Management Layout ---
@@ -2281,7 +2217,7 @@ supplier_management_layout = html.Div(
 dash_table.DataTable(
     id='supplier-summary-data-table',
     columns=summary_table_columns,
-    data=dummy_summary_table_data,
+    data=[], # Filled from the stored data by callback
 
     style_table={'overflowX': 'auto', 'minWidth': '100%'},
     style_header={
@@ -2299,17 +2235,6 @@ dash_table.DataTable(
     },
     style_cell={'fontFamily': 'Inter, sans-serif', 'fontSize': '0.9rem'},
     page_action='none',
-
-    style_cell_conditional=[
-        {
-            'if': {'column_id': 'Actions'},
-            'textAlign': 'center',
-            'width': '80px',
-            'minWidth': '80px',
-            'maxWidth': '80px',
-        }
-    ],
-    
 )
                 ],
             ),
@@ -2326,8 +2251,8 @@ dash_table.DataTable(
                             dbc.Col(
                                 dcc.Dropdown(
                                     id='supplier-comparison-dropdown-1',
-                                    options=[{'label': s['Supplier Name'], 'value': s['Supplier Name']} for s in dummy_summary_table_data],
-                                    value='Global Foods Inc.', # Default selection
+                                    options=[], # Set by callback
+                                    value=None, # Defaults to the top suppliers by spend
                                     placeholder="Select Supplier 1",
                                     clearable=False, # Ensure a supplier is always selected
                                     className="mb-3"
@@ -2337,8 +2262,8 @@ dash_table.DataTable(
                             dbc.Col(
                                 dcc.Dropdown(
                                     id='supplier-comparison-dropdown-2',
-                                    options=[{'label': s['Supplier Name'], 'value': s['Supplier Name']} for s in dummy_summary_table_data],
-                                    value='Produce Pro Co.', # Default selection
+                                    options=[], # Set by callback
+                                    value=None, # Defaults to the top suppliers by spend
                                     placeholder="Select Supplier 2",
                                     clearable=False, # Ensure a supplier is always selected
                                     className="mb-3"
@@ -2348,8 +2273,8 @@ dash_table.DataTable(
                             dbc.Col(
                                 dcc.Dropdown(
                                     id='product-comparison-dropdown', # NEW Product Dropdown
-                                    options=[{'label': p, 'value': p} for p in dummy_products],
-                                    value='Bread', # Default selected product
+                                    options=[], # Set by callback
+                                    value=None, # Defaults to the first product both suppliers carry
                                     placeholder="Select Product",
                                     clearable=False, # Ensure a product is always selected
                                     className="mb-3"
@@ -2464,92 +2389,94 @@ dash_table.DataTable(
 # Callback for the TOP Summary Table
 @app.callback(
     Output('supplier-summary-data-table', 'data'),
-    [Input('url', 'pathname')]
+    [Input('stored-data', 'data')]
 )
-def get_dummy_supplier_summary_data(pathname):
-    return dummy_summary_table_data
+def update_supplier_summary_table(stored_data_json):
+    if not stored_data_json:
+        return []
+    return get_supplier_metrics(stored_data_json)['summary_rows']
 
-# NEW/UPDATED Callback for the Supplier Comparison Table (now product-specific)
+# Supplier options by spend; the two largest suppliers are compared by default
+@app.callback(
+    Output('supplier-comparison-dropdown-1', 'options'),
+    Output('supplier-comparison-dropdown-2', 'options'),
+    Output('supplier-comparison-dropdown-1', 'value'),
+    Output('supplier-comparison-dropdown-2', 'value'),
+    [Input('stored-data', 'data')],
+    [State('supplier-comparison-dropdown-1', 'value'),
+     State('supplier-comparison-dropdown-2', 'value')]
+)
+def update_supplier_comparison_options(stored_data_json, supplier1_id, supplier2_id):
+    suppliers = get_supplier_metrics(stored_data_json)['suppliers'] if stored_data_json else {}
+    options = [{'label': name, 'value': supplier_id} for supplier_id, name in suppliers.items()]
+    ranked = list(suppliers)
+    if supplier1_id not in suppliers:
+        supplier1_id = ranked[0] if ranked else None
+    if supplier2_id not in suppliers:
+        supplier2_id = next((supplier_id for supplier_id in ranked if supplier_id != supplier1_id), supplier1_id)
+    return options, options, supplier1_id, supplier2_id
+
+# Products carried by either selected supplier
+@app.callback(
+    Output('product-comparison-dropdown', 'options'),
+    Output('product-comparison-dropdown', 'value'),
+    [Input('supplier-comparison-dropdown-1', 'value'),
+     Input('supplier-comparison-dropdown-2', 'value')],
+    [State('product-comparison-dropdown', 'value'),
+     State('stored-data', 'data')]
+)
+def update_product_comparison_options(supplier1_id, supplier2_id, selected_product, stored_data_json):
+    if not stored_data_json:
+        return [], None
+    products = get_supplier_metrics(stored_data_json)['products']
+    products1, products2 = products.get(supplier1_id, []), products.get(supplier2_id, [])
+    names = sorted(set(products1) | set(products2))
+    if selected_product not in names:
+        shared = sorted(set(products1) & set(products2))
+        selected_product = (shared or names or [None])[0]
+    return [{'label': name, 'value': name} for name in names], selected_product
+
+# Callback for the Supplier Comparison Table (product-specific)
 @app.callback(
     Output('supplier-comparison-table', 'data'),
     Output('supplier-comparison-table', 'columns'), # Output for dynamic columns
     [Input('supplier-comparison-dropdown-1', 'value'),
      Input('supplier-comparison-dropdown-2', 'value'),
-     Input('product-comparison-dropdown', 'value')] # NEW Input: selected product
+     Input('product-comparison-dropdown', 'value')],
+    [State('stored-data', 'data')]
 )
-def update_supplier_comparison_table(supplier1_name, supplier2_name, selected_product):
-    # Initialize comparison data and columns
-    comparison_data = []
+def update_supplier_comparison_table(supplier1_id, supplier2_id, selected_product, stored_data_json):
+    if not stored_data_json:
+        return [], []
+    supplier_metrics = get_supplier_metrics(stored_data_json)
+    suppliers = supplier_metrics['suppliers']
     comparison_columns = [
         {"name": "Metric", "id": "Metric"},
-        {"name": supplier1_name, "id": "Supplier 1"},
-        {"name": supplier2_name, "id": "Supplier 2"},
-    ]
-
-    # Get metrics for selected product and suppliers
-    metrics_s1 = dummy_product_supplier_metrics.get(supplier1_name, {}).get(selected_product, {})
-    metrics_s2 = dummy_product_supplier_metrics.get(supplier2_name, {}).get(selected_product, {})
-
-    # Define the order and names of the metrics for the comparison table
-    metric_keys = [
-        "Past Deliveries",
-        "Phone No",
-        "Lead Time Variability",
-        "Order Fulfillment (%)",
-        "Average Rating",
-        "Quality Score",
-        "Price per unit" # This will be special-cased
+        {"name": suppliers.get(supplier1_id, "Supplier 1"), "id": "Supplier 1"},
+        {"name": suppliers.get(supplier2_id, "Supplier 2"), "id": "Supplier 2"},
     ]
 
-    for key in metric_keys:
-        value_s1 = metrics_s1.get(key, "N/A")
-        value_s2 = metrics_s2.get(key, "N/A")
-
-        row = {"Metric": key}
-
-        # Special handling for "Price per unit"
-        if key == "Price per unit":
-            row["Metric"] = f"Price per unit of {selected_product}"
-            # Format as Indian Rupees
-            row["Supplier 1"] = f"₹{value_s1}" if value_s1 != "N/A" else "N/A"
-            row["Supplier 2"] = f"₹{value_s2}" if value_s2 != "N/A" else "N/A"
-        else:
-            row["Supplier 1"] = str(value_s1)
-            row["Supplier 2"] = str(value_s2)
-        
+    # Precomputed per (SupplierID, ProductName), so switching selections is a dictionary lookup
+    metrics_s1 = supplier_metrics['rows'].get((supplier1_id, selected_product), {})
+    metrics_s2 = supplier_metrics['rows'].get((supplier2_id, selected_product), {})
+    comparison_data = []
+    for key in comparison_metric_keys:
+        row = {"Metric": key, "Supplier 1": str(metrics_s1.get(key, "N/A")), "Supplier 2": str(metrics_s2.get(key, "N/A"))}
+        if key == "Unit Price":
+            row["Metric"] = f"Unit Price of {selected_product}"
         comparison_data.append(row)
-        
-    return comparison_data, comparison_columns
 
+    return comparison_data, comparison_columns
 
-# --- Dummy Data for Sales & Trends Page ---
-# This will be used for the carousel and initial chart placeholders.
-# REMEMBER: You will replace chart data with logic processing your real CSV data later.
 
-# Dummy data for the Carousel
-dummy_carousel_items = [
-    {
-        "key": "1",
-        "src": "/assets/monsoon_raincoat_sales.png", # Placeholder: Chart showing increase in raincoat sales
-        "header": "Monsoon Season Surge: Zeel Raincoat Dominance",
-        "caption": "Significant spike in Zeel Raincoat sales across all regions, driven by early and heavy monsoon showers.",
-        "img_alt": "Line chart showing a sharp increase in Zeel Raincoat sales during monsoon months."
-    },
-    {
-        "key": "2",
-        "src": "/assets/health_home_comfort_sales.png", # Placeholder: Chart showing sales of dehumidifiers/air purifiers
-        "header": "Health & Home Comfort: Humidity Solutions",
-        "caption": "Increased demand for dehumidifiers and air purifiers as consumers combat monsoon humidity and associated indoor air quality concerns.",
-        "img_alt": "Bar chart illustrating higher sales of home comfort appliances like dehumidifiers and air purifiers."
-    },
-    {
-        "key": "3", # This is the changed item
-        "src": "/assets/warm_beverages_comfort_food_sales.png", # Placeholder: Chart showing sales of specific F&B items
-        "header": "Warm Beverages & Comfort Food Craze",
-        "caption": "Surge in sales of tea, coffee, instant noodles, and baking essentials, reflecting consumer preference for warm and convenient options during monsoon.",
-        "img_alt": "Chart depicting increased sales of hot beverages and convenience foods."
-    }
-]
+# --- Sales & Trends Page Data ---
+# Carousel slides, computed from the data (see carousel_items below)
+CAROUSEL_INSIGHT_SLIDES = 5 # Strongest mined sales shifts shown (see sales_insights.py)
+CAROUSEL_WEATHER_SLIDES = 3 # Strongest significant weather effects shown
+WEATHER_LABELS = { # Variable -> (step label, header when demand rises with it, header when it falls)
+    'Temperature_C': (f"+{EFFECT_STEPS['Temperature_C']:.0f} °C", "Warmer Days", "Cooler Days"),
+    'Precipitation_mm': (f"+{EFFECT_STEPS['Precipitation_mm']:.0f} mm of rain", "Rainy Days", "Dry Days"),
+}
 
 # Dummy Data for Chart Placeholders (You'll replace this with your CSV data)
 # For demonstration purposes, creating a simple DataFrame.
@@ -2759,6 +2686,16 @@ dbc.Col(lg=12, children=[ # Adjust lg/md/sm as per your layout needs
         ])
     ])
 ]),
+
+# Promotion lift: units per day during each promotion against the pre-promotion baseline
+dbc.Card(
+    dbc.CardBody([
+        html.H5("Promotion Lift", className="card-title mb-3"),
+        html.Div(id='promotion-lift-kpi', className="text-muted mb-2"),
+        dcc.Graph(id='promotion-lift-chart', config={'displayModeBar': False})
+    ]),
+    className="mt-4"
+),
  ],
 className="content-container p-4",# Use your existing content-container class for padding
 id="sales-trends-main-content"
@@ -2766,7 +2703,98 @@ id="sales-trends-main-content"
 
 
 # --- Manual Carousel Callback ---
-# Assuming dummy_carousel_items is defined correctly at the top of your app.py
+def carousel_items(stored_data_json):
+    """
+    Carousel slides (header, caption, figure): the strongest mined sales shifts (category x season x city x
+    holiday slices), then the strongest weather effects on demand per category and city.
+    """
+    shifts = get_sales_insights(stored_data_json).head(CAROUSEL_INSIGHT_SLIDES) if stored_data_json else pd.DataFrame()
+    sensitivity = get_weather_sensitivity(stored_data_json) if stored_data_json else pd.DataFrame()
+    insights = weather_insights(sensitivity, CAROUSEL_WEATHER_SLIDES) if not sensitivity.empty else pd.DataFrame()
+    if shifts.empty and insights.empty:
+        return [{
+            "header": "No Significant Sales Shifts",
+            "caption": f"No season, city or holiday slice of any category differs from the rest of its context at a "
+                       f"{FALSE_DISCOVERY_RATE:.0%} false discovery rate, and no category shows a weather effect at that "
+                       f"rate in any city.",
+            "figure": None,
+        }]
+
+    items = []
+    for shift in shifts.itertuples():
+        items.append({
+            "header": f"{shift_subject(shift)}: {shift_slice(shift)} {'Up' if shift.ShiftPct > 0 else 'Down'} "
+                      f"{abs(shift.ShiftPct):.0f}%",
+            "caption": f"{shift.MeanIn:,.1f} units/day on {shift.DaysIn} days against {shift.MeanOut:,.1f} on the other "
+                       f"{shift.DaysOut} days{shift_context(shift)} (p = {shift.PValue:.1g}).",
+            "figure": cached_figure(stored_data_json, 'carousel-shift',
+                                    (shift.Category, shift.Focus, shift.Value, tuple(sorted(shift.Context.items()))),
+                                    lambda shift=shift: sales_shift_figure(shift)),
+        })
+    for insight in insights.itertuples():
+        step, rising, falling = WEATHER_LABELS[insight.Variable]
+        items.append({
+            "header": f"{rising if insight.EffectPct > 0 else falling} Boost {insight.Category} in {insight.City}",
+            "caption": f"Each {step} goes with {insight.EffectPct:+.1f}% daily units of {insight.Category} in {insight.City} "
+                       f"(t = {insight.T:.1f}, adjusted p = {insight.Q:.1g}, over {insight.Days} days of sales and weather).",
+            "figure": cached_figure(stored_data_json, 'carousel-weather', (insight.Category, insight.Variable, insight.City),
+                                    lambda insight=insight: weather_effect_figure(sensitivity, insight)),
+        })
+    return items
+
+
+def weather_effect_figure(sensitivity, insight):
+    """Effect of the insight's weather variable on its category in every city, the insight's city highlighted."""
+    rows = sensitivity[sensitivity['Category'] == insight.Category]
+    trace = {
+        'type': 'bar', 'x': rows['City'].tolist(), 'y': rows[f'EffectPct_{insight.Variable}'].round(1).tolist(),
+        'marker': {'color': ['#0d6efd' if city == insight.City else '#adb5bd' for city in rows['City']]},
+        'hovertemplate': '%{x}: %{y:+.1f}%<extra></extra>',
+    }
+    return build_figure('carousel-insight', [trace],
+                        yaxis={'title': {'text': f"% daily units per {WEATHER_LABELS[insight.Variable][0]}"},
+                               'zeroline': True, 'zerolinecolor': '#adb5bd'})
+
+
+def shift_subject(shift):
+    return "All Categories" if shift.Category == ALL_SLICES else shift.Category
+
+
+def shift_slice(shift):
+    """Display name of the slice: 'Winter', 'Mumbai' or 'Holidays'."""
+    return "Holidays" if shift.Focus == 'Holiday' else shift.Value
+
+
+def shift_context(shift):
+    """Caption suffix naming the context the slice was compared within, e.g. ' (Mumbai, holidays)'."""
+    parts = [("holidays" if value == HOLIDAY else "regular days") if dimension == 'Holiday' else value
+             for dimension, value in shift.Context.items()]
+    return f" ({', '.join(parts)})" if parts else ""
+
+
+def sales_shift_figure(shift):
+    """Mean daily units of every value of the insight's focus dimension in its context, the insight's slice highlighted."""
+    values = list(shift.Profile)
+    trace = {
+        'type': 'bar', 'x': values, 'y': [round(float(shift.Profile[value]), 1) for value in values],
+        'marker': {'color': ['#0d6efd' if value == shift.Value else '#adb5bd' for value in values]},
+        'hovertemplate': '%{x}: %{y:,.1f} units/day<extra></extra>',
+    }
+    return build_figure('carousel-insight', [trace], yaxis={'title': {'text': "Units per day"}})
+
+
+def render_carousel_slide(item):
+    figure = (dcc.Graph(figure=item["figure"], config={'displayModeBar': False}, style={'height': '250px', 'width': '100%'})
+              if item["figure"] is not None else None)
+    return html.Div(
+        [
+            html.Div(figure, className="manual-carousel-image-container"),
+            html.H5(item["header"], className="manual-carousel-header"), # Use custom class for H5
+            html.P(item["caption"], className="manual-carousel-caption") # Use custom class for P
+        ],
+        className="d-flex flex-column align-items-center justify-content-center manual-carousel-slide", # Add custom class for slide
+        style={'height': '100%'} # Ensure inner div takes full height of parent container
+    )
 
 # Callback to update the manual carousel content and index
 @app.callback(
@@ -2775,9 +2803,10 @@ id="sales-trends-main-content"
     Input('prev-carousel-btn', 'n_clicks'),
     Input('next-carousel-btn', 'n_clicks'),
     State('current-carousel-index', 'data'),
+    State('stored-data', 'data'),
     prevent_initial_call=True
 )
-def update_manual_carousel(n_clicks_prev, n_clicks_next, current_index):
+def update_manual_carousel(n_clicks_prev, n_clicks_next, current_index, stored_data_json):
     ctx = dash.callback_context
 
     if not ctx.triggered:
@@ -2785,7 +2814,8 @@ def update_manual_carousel(n_clicks_prev, n_clicks_next, current_index):
 
     button_id = ctx.triggered[0]['prop_id'].split('.')[0]
 
-    num_items = len(dummy_carousel_items)
+    items = carousel_items(stored_data_json)
+    num_items = len(items)
 
     new_index = current_index
     if button_id == 'next-carousel-btn':
@@ -2794,56 +2824,18 @@ def update_manual_carousel(n_clicks_prev, n_clicks_next, current_index):
         new_index = (current_index - 1 + num_items) % num_items
     # No 'else' needed here, as prevent_initial_call handles initial state
 
-    # Create the content for the current slide
-    item = dummy_carousel_items[new_index]
-    carousel_slide_content = html.Div(
-        [
-            # Image Container: Use a div to control image dimensions and centering
-            html.Div(
-                html.Img(
-                    src=item["src"],
-                    alt=item["img_alt"],
-                    className="manual-carousel-image" # Apply custom CSS class here
-                ),
-                className="manual-carousel-image-container" # Apply custom CSS class here
-            ),
-            html.H5(item["header"], className="manual-carousel-header"), # Use custom class for H5
-            html.P(item["caption"], className="manual-carousel-caption") # Use custom class for P
-        ],
-        className="d-flex flex-column align-items-center justify-content-center manual-carousel-slide", # Add custom class for slide
-        style={'height': '100%'} # Ensure inner div takes full height of parent container
-    )
-
-    return carousel_slide_content, new_index
+    return render_carousel_slide(items[new_index % num_items]), new_index
 
-# Callback to display the first item on initial load
+# Callback to display the current item on initial load and when the data changes
 @app.callback(
     Output('manual-carousel-content', 'children', allow_duplicate=True),
     Input('current-carousel-index', 'data'), # This input will be triggered by initial data=0
+    Input('stored-data', 'data'),
     prevent_initial_call='initial_duplicate'
 )
-def display_initial_carousel_item(current_index):
-    if current_index is None:
-        current_index = 0 # Fallback, though data=0 should ensure it's not None
-
-    item = dummy_carousel_items[current_index]
-    carousel_slide_content = html.Div(
-        [
-            html.Div(
-                html.Img(
-                    src=item["src"],
-                    alt=item["img_alt"],
-                    className="manual-carousel-image"
-                ),
-                className="manual-carousel-image-container"
-            ),
-            html.H5(item["header"], className="manual-carousel-header"),
-            html.P(item["caption"], className="manual-carousel-caption")
-        ],
-        className="d-flex flex-column align-items-center justify-content-center manual-carousel-slide",
-        style={'height': '100%'}
-    )
-    return carousel_slide_content
+def display_initial_carousel_item(current_index, stored_data_json):
+    items = carousel_items(stored_data_json)
+    return render_carousel_slide(items[(current_index or 0) % len(items)])
 
 # Helper function to aggregate data based on time period and specified column names
 def aggregate_data(df, time_agg, date_col, value_col):
@@ -2878,144 +2870,132 @@ def aggregate_data(df, time_agg, date_col, value_col):
     return agg_df
 
 
-# --- Callback to update Sales Time Aggregation State ---
-@app.callback(
-    Output('sales-time-agg-state', 'data'),
-    Input('sales-agg-daily', 'n_clicks'),
-    Input('sales-agg-weekly', 'n_clicks'),
-    Input('sales-agg-monthly', 'n_clicks'),
-    Input('sales-agg-yearly', 'n_clicks'),
-    State('sales-time-agg-state', 'data')
-)
-def update_sales_agg_state(d, w, m, y, current_state):
-    ctx = dash.callback_context
-    if not ctx.triggered:
-        return current_state
-    button_id = ctx.triggered [0]['prop_id'].split('.')[0]
-    if button_id == 'sales-agg-daily': return 'Daily'
-    elif button_id == 'sales-agg-weekly': return 'Weekly'
-    elif button_id == 'sales-agg-monthly': return 'Monthly'
-    elif button_id == 'sales-agg-yearly': return 'Yearly'
-    return current_state
-
-# --- Callback to update Profit Time Aggregation State ---
-@app.callback(
-    Output('profit-time-agg-state', 'data'),
-    Input('profit-agg-daily', 'n_clicks'),
-    Input('profit-agg-weekly', 'n_clicks'),
-    Input('profit-agg-monthly', 'n_clicks'),
-    Input('profit-agg-yearly', 'n_clicks'),
-    State('profit-time-agg-state', 'data')
-)
-def update_profit_agg_state(d, w, m, y, current_state):
-    ctx = dash.callback_context
-    if not ctx.triggered:
-        return current_state
-    button_id = ctx.triggered [0]['prop_id'].split('.')[0]
-    if button_id == 'profit-agg-daily': return 'Daily'
-    elif button_id == 'profit-agg-weekly': return 'Weekly'
-    elif button_id == 'profit-agg-monthly': return 'Monthly'
-    elif button_id == 'profit-agg-yearly': return 'Yearly'
-    return current_state
-
-# Callback to update Sales and Profit charts based on stored data and aggregation states
-@app.callback(
-    Output('total-sales-over-time-chart', 'figure'),
-    Output('total-profit-over-time-chart', 'figure'),
-    Input('stored-data', 'data'), # Data from dcc.Store
-    Input('sales-time-agg-state', 'data'), # <-- NEW: Get state from dcc.Store
-    Input('profit-time-agg-state', 'data') # <-- NEW: Get state from dcc.Store
-)
-def update_sales_and_profit_charts(stored_data_json, sales_time_agg, profit_time_agg):
+# --- Sales / Profit Time Aggregation State (client-side: the buttons only set a store) ---
+AGG_STATE_FROM_BUTTON_JS = """
+function(daily, weekly, monthly, yearly, current_state) {
+    const triggered = dash_clientside.callback_context.triggered;
+    if (!triggered.length || !triggered[0].value) {
+        return current_state;
+    }
+    const suffix = triggered[0].prop_id.split('.')[0].split('-').pop();
+    const states = {daily: 'Daily', weekly: 'Weekly', monthly: 'Monthly', yearly: 'Yearly'};
+    return states[suffix] || current_state;
+}
+"""
+
+for agg_prefix in ('sales', 'profit'):
+    app.clientside_callback(
+        AGG_STATE_FROM_BUTTON_JS,
+        Output(f'{agg_prefix}-time-agg-state', 'data'),
+        Input(f'{agg_prefix}-agg-daily', 'n_clicks'),
+        Input(f'{agg_prefix}-agg-weekly', 'n_clicks'),
+        Input(f'{agg_prefix}-agg-monthly', 'n_clicks'),
+        Input(f'{agg_prefix}-agg-yearly', 'n_clicks'),
+        State(f'{agg_prefix}-time-agg-state', 'data')
+    )
+
+# Helper: Layout templates for the sales / profit growth charts, built once and shared by every response
+TREND_CHART_LAYOUTS = {
+    chart: {
+        'title': {
+            'text': title,
+            'font': {'size': 18, 'color': '#333'}
+        },
+        'yaxis': {
+            'title': yaxis_title,
+            'showgrid': False,
+            'zeroline': False
+        },
+        'plot_bgcolor': '#f8f9fa',
+        'paper_bgcolor': '#fff',
+        'margin': {'l': 40, 'r': 20, 't': 60, 'b': 30},
+        'height': 250,
+        'showlegend': False
+    }
+    for chart, title, yaxis_title in (('sales', 'Overall Sales Growth', 'Sales Amount'),
+                                      ('profit', 'Overall Profit Growth', 'Profit Amount'))
+}
+
+def trend_chart_series(agg_df, value_col, time_agg, window=None):
+    """
+    Returns (x, y, xaxis layout) for a sales / profit growth chart from aggregate_data() output.
+    Daily series are downsampled (LTTB) to the chart's width; window=(start, end) keeps that range at full resolution.
+    """
+    x, y = agg_df['Date'].to_numpy(), agg_df[value_col].to_numpy()
+    xaxis = {'title': 'Time Period', 'showgrid': False, 'zeroline': False}
+    if time_agg == 'Daily':
+        x, y = downsample_series(x, y, window=window)
+        if window is not None:
+            xaxis['range'] = [window[0], window[1]] # Keep the user's zoom when the finer points arrive
+    else:
+        xaxis.update({'tickmode': 'array', 'tickvals': agg_df['Date'], 'ticktext': agg_df['Date']})
+    return x, y, xaxis
+
+
+def update_trend_chart(stored_data_json, chart, value_col, trace_name, time_agg, relayout_data):
+    """
+    Figure update for one growth chart. The first render sends the full figure (layout template + trace);
+    aggregation changes and zooms send a Patch with only the trace x/y and the x axis.
+    """
     if stored_data_json is None or 'sales' not in stored_data_json:
-        return {}, {}
+        return {}
 
-    df_sales = pd.read_json(io.StringIO(stored_data_json['sales']), orient='split')
-    df_sales['SaleDate'] = pd.to_datetime(df_sales['SaleDate'], errors='coerce')
-    df_sales.dropna(subset=['SaleDate'], inplace=True)
+    df_sales = get_sales_facts(stored_data_json)
 
     if df_sales.empty:
-        return {}, {}
-
-    # Sales Chart Logic:
-    sales_agg_df = aggregate_data(df_sales, sales_time_agg, 'SaleDate', 'TotalPrice')
-    sales_fig = {
-        'data': [
-            go.Scatter(
-                x=sales_agg_df['Date'],
-                y=sales_agg_df['TotalPrice'],
-                mode='lines',
-                fill='tozeroy',
-                line=dict(color='#198754'), # Green line color
-                name='Total Sales'
-            )
-        ],
-        'layout': {
-            'title': {
-                'text': 'Overall Sales Growth',
-                'font': {'size': 18, 'color': '#333'}
-            },
-            'xaxis': {
-                'title': 'Time Period',
-                'tickmode': 'array',
-                'tickvals': sales_agg_df['Date'],
-                'ticktext': sales_agg_df['Date'],
-                'showgrid': False,
-                'zeroline': False
-            },
-            'yaxis': {
-                'title': 'Sales Amount',
-                'showgrid': False,
-                'zeroline': False
-            },
-            'plot_bgcolor': '#f8f9fa',
-            'paper_bgcolor': '#fff',
-            'margin': {'l': 40, 'r': 20, 't': 60, 'b': 30},
-            'height': 250,
-            'showlegend': False
+        return {}
+
+    triggered = dash.callback_context.triggered_id
+    window = None
+    if triggered == f'total-{chart}-over-time-chart':
+        window = visible_range(relayout_data)
+        if window is None or time_agg != 'Daily': # Only daily charts have finer points to fetch
+            return dash.no_update
+        window = None if window == 'reset' else window
+
+    agg_df = aggregate_data(df_sales, time_agg, 'SaleDate', value_col)
+    x, y, xaxis = trend_chart_series(agg_df, value_col, time_agg, window)
+
+    if triggered in (None, 'stored-data'):
+        return {
+            'data': [
+                go.Scatter(
+                    x=x,
+                    y=y,
+                    mode='lines',
+                    fill='tozeroy',
+                    line=dict(color='#198754'), # Green line color
+                    name=trace_name
+                )
+            ],
+            'layout': dict(TREND_CHART_LAYOUTS[chart], xaxis=xaxis, uirevision=time_agg)
         }
-    }
 
-    # Profit Chart Logic:
-    profit_agg_df = aggregate_data(df_sales, profit_time_agg, 'SaleDate', 'Profit')
-    profit_fig = {
-        'data': [
-            go.Scatter(
-                x=profit_agg_df['Date'],
-                y=profit_agg_df['Profit'],
-                mode='lines',
-                fill='tozeroy',
-                line=dict(color='#198754'),
-                name='Profit'
-            )
-        ],
-        'layout': {
-            'title': {
-                'text': 'Overall Profit Growth',
-                'font': {'size': 18, 'color': '#333'}
-            },
-            'xaxis': {
-                'title': 'Time Period',
-                'tickmode': 'array',
-                'tickvals': profit_agg_df['Date'],
-                'ticktext': profit_agg_df['Date'],
-                'showgrid': False,
-                'zeroline': False
-            },
-            'yaxis': {
-                'title': 'Profit Amount',
-                'showgrid': False,
-                'zeroline': False
-            },
-            'plot_bgcolor': '#f8f9fa',
-            'paper_bgcolor': '#fff',
-            'margin': {'l': 40, 'r': 20, 't': 60, 'b': 30},
-            'height': 250,
-            'showlegend': False
-        }
-    }
+    patch = Patch()
+    patch['data'][0]['x'] = x
+    patch['data'][0]['y'] = y
+    patch['layout']['xaxis'] = xaxis
+    patch['layout']['uirevision'] = time_agg # Zooming in does not reset when the points are refreshed
+    return patch
+
+# Callbacks to update the Sales and Profit charts: one per chart, so toggling one chart's aggregation leaves the other alone
+@app.callback(
+    Output('total-sales-over-time-chart', 'figure'),
+    Input('stored-data', 'data'), # Data from dcc.Store
+    Input('sales-time-agg-state', 'data'),
+    Input('total-sales-over-time-chart', 'relayoutData') # Zoom / pan: re-fetch the visible window
+)
+def update_sales_over_time_chart(stored_data_json, sales_time_agg, relayout_data):
+    return update_trend_chart(stored_data_json, 'sales', 'TotalPrice', 'Total Sales', sales_time_agg, relayout_data)
 
-    return sales_fig, profit_fig
+@app.callback(
+    Output('total-profit-over-time-chart', 'figure'),
+    Input('stored-data', 'data'),
+    Input('profit-time-agg-state', 'data'),
+    Input('total-profit-over-time-chart', 'relayoutData')
+)
+def update_profit_over_time_chart(stored_data_json, profit_time_agg, relayout_data):
+    return update_trend_chart(stored_data_json, 'profit', 'Profit', 'Profit', profit_time_agg, relayout_data)
 
 
 @app.callback(
@@ -3031,9 +3011,7 @@ def update_kpis(stored_data_json, sales_time_agg, profit_time_agg):
     if stored_data_json is None or 'sales' not in stored_data_json:
         return "₹0", "N/A", "₹0", "N/A"
 
-    df_sales = pd.read_json(io.StringIO(stored_data_json['sales']), orient='split')
-    df_sales['SaleDate'] = pd.to_datetime(df_sales['SaleDate'], errors='coerce')
-    df_sales.dropna(subset=['SaleDate'], inplace=True)
+    df_sales = get_sales_facts(stored_data_json)
 
     if df_sales.empty:
         return "₹0", "N/A", "₹0", "N/A"
@@ -3071,14 +3049,14 @@ def set_product_seasonal_options(stored_data_json):
     if stored_data_json is None or 'sales' not in stored_data_json:
         return [], None
 
-    df_sales = pd.read_json(io.StringIO(stored_data_json['sales']), orient='split')
+    df_sales = get_sales_facts(stored_data_json)
 
-    if 'ProductCategory' not in df_sales.columns:
-        print("Warning: 'ProductCategory' column not found in data for product seasonal dropdown.")
+    if df_sales.empty:
+        print("Warning: no sales data for product seasonal dropdown.")
         return [], None
 
     # Get unique product categories and prepare options
-    product_categories = sorted(df_sales['ProductCategory'].unique().tolist())
+    product_categories = sorted(df_sales['Category'].unique().tolist())
     options = [{'label': category, 'value': category} for category in product_categories]
 
     # --- Set Default Product ---
@@ -3110,21 +3088,14 @@ def update_product_seasonal_trends(selected_product, selected_year, stored_data_
     if stored_data_json is None or 'sales' not in stored_data_json:
         return "", {}
 
-    df_sales = pd.read_json(io.StringIO(stored_data_json['sales']), orient='split')
-    df_sales['SaleDate'] = pd.to_datetime(df_sales['SaleDate'], errors='coerce')
-    df_sales.dropna(subset=['SaleDate'], inplace=True)
-
-    # Re-calculate season/year if not already in stored_data (better to do this in load_data)
-    df_sales['Month'] = df_sales['SaleDate'].dt.month
-    df_sales['Season'] = df_sales['Month'].apply(get_season)
-    df_sales['Year'] = df_sales['SaleDate'].dt.year
+    df_sales = get_sales_facts(stored_data_json) # Season and Year are precomputed on the fact table
 
     if df_sales.empty or selected_product is None:
         return "$0 (N/A)", {} # Adjusted for INR later
 
     # Filter by selected product
     # Adjust 'ProductCategory' to 'ProductName' if that's your column
-    filtered_df = df_sales[df_sales['ProductCategory'] == selected_product].copy()
+    filtered_df = df_sales[df_sales['Category'] == selected_product]
 
     if filtered_df.empty:
         return f"₹0 ({selected_product})", {} # Updated for INR
@@ -3215,12 +3186,12 @@ def set_product_brand_product_options(stored_data_json):
     if stored_data_json is None or 'sales' not in stored_data_json:
         return [], None
 
-    df_sales = pd.read_json(io.StringIO(stored_data_json['sales']), orient='split')
+    df_sales = get_sales_facts(stored_data_json)
 
-    if 'ProductCategory' not in df_sales.columns:
+    if df_sales.empty:
         return [], None
 
-    product_categories = sorted(df_sales['ProductCategory'].unique().tolist())
+    product_categories = sorted(df_sales['Category'].unique().tolist())
     options = [{'label': category, 'value': category} for category in product_categories]
     
     # Set a default value, e.g., the first product or 'Apparel' if you prefer
@@ -3255,11 +3226,6 @@ def set_brand_sales_time_agg(monthly_clicks, quarterly_clicks, yearly_clicks):
 
 
 # Callback to generate 'product-brand-sales-chart'
-# Ensure you have plotly.graph_objects as go
-import plotly.graph_objects as go
-import plotly.express as px # Often useful for bar charts
-
-
 @app.callback(
     Output('product-brand-sales-chart', 'figure'),
     [Input('product-brand-product-dropdown', 'value'),
@@ -3275,6 +3241,12 @@ def update_product_brand_sales_chart(
     selected_month,
     stored_data_json
 ):
+    filters = (selected_product_category, selected_year, selected_quarter, selected_month)
+    return cached_figure(stored_data_json, 'product-brand-sales-chart', filters,
+                         lambda: product_brand_sales_figure(*filters, stored_data_json))
+
+
+def product_brand_sales_figure(selected_product_category, selected_year, selected_quarter, selected_month, stored_data_json):
     # Initialize an empty figure to return in case of no data
     empty_figure = go.Figure().update_layout(
         title="No data to display. Please adjust filters.",
@@ -3285,13 +3257,7 @@ def update_product_brand_sales_chart(
     if stored_data_json is None or 'sales' not in stored_data_json:
         return empty_figure.update_layout(title="No sales data loaded.")
 
-    df_sales = pd.read_json(io.StringIO(stored_data_json['sales']), orient='split')
-
-    if 'SaleDate' not in df_sales.columns:
-        return empty_figure.update_layout(title="Error: 'SaleDate' column missing in your data.")
-
-    df_sales['SaleDate'] = pd.to_datetime(df_sales['SaleDate'], errors='coerce')
-    df_sales.dropna(subset=['SaleDate'], inplace=True)
+    df_sales = get_sales_facts(stored_data_json)
 
     if df_sales.empty:
         return empty_figure.update_layout(title="Loaded sales data is empty after date processing.")
@@ -3299,19 +3265,17 @@ def update_product_brand_sales_chart(
     if selected_product_category is None:
         return empty_figure.update_layout(title="Please select a Product Category to view sales data.")
 
-    if 'Brand' not in df_sales.columns:
-        return empty_figure.update_layout(title="Error: 'Brand' column missing in your sales data.")
-
     # Apply product category filter first
-    filtered_df = df_sales[df_sales['ProductCategory'] == selected_product_category].copy()
+    filtered_df = df_sales[df_sales['Category'] == selected_product_category]
 
     # Apply time filters
     if selected_year is not None:
-        filtered_df = filtered_df[filtered_df['SaleDate'].dt.year == selected_year]
+        filtered_df = filtered_df[filtered_df['Year'] == selected_year]
     if selected_quarter is not None:
         filtered_df = filtered_df[filtered_df['SaleDate'].dt.quarter == selected_quarter]
     if selected_month is not None:
-        filtered_df = filtered_df[filtered_df['SaleDate'].dt.month == selected_month]
+        filtered_df = filtered_df[filtered_df['Month'] == selected_month]
+    filtered_df = filtered_df.copy() # A 'Period' column is added below; the fact table is shared
 
     # --- Crucial: If filtered_df is empty after all filters, return early ---
     if filtered_df.empty:
@@ -3350,41 +3314,14 @@ def update_product_brand_sales_chart(
     # Sort brands by TotalPrice within each Period for better visualization
     aggregated_df = aggregated_df.sort_values(by=['Period', 'TotalPrice'], ascending=[True, True])
 
-    # Create the horizontal bar chart
-    fig = px.bar(
-        aggregated_df,
-        y='Brand',
-        x='TotalPrice',
-        color='Brand',
-        facet_col=facet_col_name,
-        facet_col_wrap=1,
-        title=f"Sales by Brand for {selected_product_category} ({aggregation_level_title} Aggregation)",
-        labels={'TotalPrice': 'Total Sales (₹)', 'Brand': 'Brand'},
-        orientation='h',
-        height=800,
-        # Add text_auto for displaying values on bars. 'auto' tries to format nicely.
-        # You can also specify a format string like '$,.0f' for currency, or '.2s' for SI units.
-        text_auto=True,
-        # 'text' argument can be used if you need custom formatting beyond text_auto
-        # For example, to add '₹' symbol: text=aggregated_df['TotalPrice'].apply(lambda x: f"₹{x:,.0f}")
+    # Create the horizontal bar chart: one row of bars per period, values printed outside the bars
+    traces, facet_layout = horizontal_bar_facets(aggregated_df, 'Brand', 'TotalPrice', facet_col_name, 'Total Sales (₹)')
+    return build_figure(
+        'brand-sales', traces,
+        title={'text': f"Sales by Brand for {selected_product_category} ({aggregation_level_title} Aggregation)"},
+        **facet_layout
     )
 
-    # --- OPTIONAL: Adjust text properties for better visibility ---
-    fig.update_traces(textposition='outside') # Positions text outside the bars
-    fig.update_layout(uniformtext_minsize=8, uniformtext_mode='hide') # Helps with crowded bars
-
-    # Update layout for better readability
-    fig.update_layout(
-        margin={"t": 60, "b": 0, "l": 0, "r": 0},
-        xaxis_title='Total Sales (₹)',
-        yaxis_title=None,
-        hovermode="y unified"
-    )
-    fig.update_yaxes(matches=None, showticklabels=True, automargin=True)
-    fig.for_each_annotation(lambda a: a.update(text=a.text.split("=")[-1]))
-
-    return fig
-
 # New callback for year dropdown
 @app.callback(
     Output('product-brand-year-dropdown', 'options'),
@@ -3395,10 +3332,10 @@ def set_product_brand_year_options(stored_data_json):
     if stored_data_json is None or 'sales' not in stored_data_json:
         return [], None
 
-    df_sales = pd.read_json(io.StringIO(stored_data_json['sales']), orient='split')
+    df_sales = get_sales_facts(stored_data_json)
 
-    if 'Year' not in df_sales.columns:
-        print("Warning: 'Year' column not found in data for brand sales year dropdown.")
+    if df_sales.empty:
+        print("Warning: no sales data for brand sales year dropdown.")
         return [], None
 
     # Get unique years, sort them, and prepare options
@@ -3409,6 +3346,42 @@ def set_product_brand_year_options(stored_data_json):
     default_year = max(years) if years else None
 
     return options, default_year
-    
+
+
+# Callback for the promotion lift chart (lift per promotion, cached per dataset version)
+@app.callback(
+    Output('promotion-lift-chart', 'figure'),
+    Output('promotion-lift-kpi', 'children'),
+    Input('stored-data', 'data')
+)
+def update_promotion_lift_chart(stored_data_json):
+    if not stored_data_json:
+        return build_figure('promotion-lift', []), "No promotion data loaded."
+    summary = get_promotions(stored_data_json)['summary']
+    if summary.empty:
+        return build_figure('promotion-lift', []), "No promotion overlaps the sales history with a measurable baseline."
+
+    figure = cached_figure(stored_data_json, 'promotion-lift-chart', (), lambda: promotion_lift_figure(summary))
+    overall = (summary['PromoUnitsPerDay'].sum() / summary['BaselineUnitsPerDay'].sum() - 1) * 100
+    return figure, f"{len(summary)} promotions measured, overall lift {overall:+.1f}% units per day against the {BASELINE_DAYS} days before each promotion."
+
+
+def promotion_lift_figure(summary):
+    labels = [f"{name} ({start:%d %b %Y})" for name, start in zip(summary['PromotionName'], summary['PromotionStartDate'])]
+    hover = [f"{discount:.0f}% off, {'store-wide' if store_wide else product_id}<br>{products} products<br>"
+             f"{promo:,.1f} vs {baseline:,.1f} units/day"
+             for discount, store_wide, product_id, products, promo, baseline in zip(
+                 summary['DiscountPercentage'], summary['StoreWide'], summary['ProductID'], summary['Products'],
+                 summary['PromoUnitsPerDay'], summary['BaselineUnitsPerDay'])]
+    trace = {
+        'type': 'bar', 'orientation': 'h', 'x': summary['LiftPct'].round(1).tolist(), 'y': labels,
+        'marker': {'color': ['#28a745' if lift >= 0 else '#dc3545' for lift in summary['LiftPct']]},
+        'text': [f"{lift:+.1f}%" for lift in summary['LiftPct']], 'textposition': 'auto',
+        'hovertext': hover, 'hovertemplate': '%{y}<br>%{hovertext}<extra></extra>',
+    }
+    return build_figure('promotion-lift', [trace], height=max(250, 60 * len(labels)))
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    if not DEBUG_MODE or os.environ.get('WERKZEUG_RUN_MAIN') == 'true': # Not the debug reloader's monitor process
+        start_drop_folder_watcher(DATA_DIR)
+    app.run(debug=DEBUG_MODE)
@@ -0,0 +1,231 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from catalog import product_keys, shelf_life_days
+from demand import (SALES_SPIKE_FACTOR, UPWARD_TREND_FACTOR, HIGH_VOLUME_THRESHOLD,
+                    daily_demand_matrix, demand_signals)
+from order_cycles import ANNUAL_HOLDING_RATE, calculate_order_cycles
+from safety_stock import DEFAULT_SERVICE_LEVEL, catalog_lead_time_cv, catalog_lead_times, safety_stock_table
+
+# --- Replenishment Policy Backtester ---
+# Replays historical demand day by day under a candidate reorder policy and reports the
+# stockout days, holding cost and waste it would have produced. State is held as one array
+# per SKU, so each simulated day is a handful of vectorized operations over the whole catalog.
+#
+# Policies:
+#   'placeholder' - the reorder page's current rules (status + demand flags + calculate_reorder_qty_placeholder)
+#   'sS'          - order up to S = s + EOQ when inventory position <= s (s = service-level reorder level)
+#   'eoq'         - order a fixed EOQ when inventory position <= s
+#   'historical'  - no policy orders; receipts are the IN movements that actually happened
+#
+# Policy parameters (safety stock, EOQ) are estimated on the replay window itself, i.e. in-sample.
+
+POLICIES = ('placeholder', 'sS', 'eoq', 'historical')
+DEFAULT_REPLAY_DAYS = 365
+FALLBACK_LEAD_TIME_DAYS = 7
+
+
+def prepare_backtest(df_products, df_sales, df_inventory=None, df_purchases=None, end_date=None,
+                     num_days=DEFAULT_REPLAY_DAYS, demand_source='sales', service_level=DEFAULT_SERVICE_LEVEL):
+    """
+    Builds the arrays shared by every backtest run over the same history window.
+    demand_source: 'sales' (sales_data.csv quantities) or 'movements' (OUT movements).
+    Returns a context dict to pass to simulate_policy().
+    """
+    df_inventory = df_inventory if df_inventory is not None else pd.DataFrame()
+    df_purchases = df_purchases if df_purchases is not None else pd.DataFrame()
+    keys = product_keys(df_products)
+
+    if end_date is None:
+        if demand_source == 'movements' and not df_inventory.empty:
+            end_date = pd.to_datetime(df_inventory['MovementDate'], errors='coerce').max()
+        elif not df_sales.empty:
+            end_date = pd.to_datetime(df_sales['SaleDate'], errors='coerce').max()
+    end_date = pd.Timestamp(end_date if end_date is not None and not pd.isna(end_date) else pd.Timestamp.now()).normalize()
+
+    if demand_source == 'movements' and not df_inventory.empty:
+        outbound = df_inventory[df_inventory['MovementType'] == 'OUT']
+        demand = daily_demand_matrix(outbound, keys, end_date, num_days, date_col='MovementDate')
+    else:
+        demand = daily_demand_matrix(df_sales, keys, end_date, num_days)
+
+    receipts = np.zeros_like(demand)
+    if not df_inventory.empty and {'MovementType', 'MovementDate'}.issubset(df_inventory.columns):
+        inbound = df_inventory[df_inventory['MovementType'] == 'IN']
+        receipts = daily_demand_matrix(inbound, keys, end_date, num_days, date_col='MovementDate')
+
+    # Service-level reorder level and EOQ, estimated on the replay window (in-sample)
+    safety = safety_stock_table(keys, demand, catalog_lead_times(df_products),
+                                catalog_lead_time_cv(df_products, df_purchases), service_level)
+    cycles = calculate_order_cycles(df_products, safety['AvgDailyDemand'].to_numpy(), as_of=end_date)
+
+    def numeric(col, default=0.0):
+        if col not in df_products.columns:
+            return np.full(len(keys), default)
+        return pd.to_numeric(df_products[col], errors='coerce').fillna(default).to_numpy(dtype=float)
+
+    lead_time = np.where(numeric('LeadTimeDays') > 0, numeric('LeadTimeDays'), FALLBACK_LEAD_TIME_DAYS).astype(np.int64)
+    return {
+        'product_ids': keys,
+        'dates': pd.date_range(end=end_date, periods=num_days, freq='D'),
+        'demand': demand,
+        'historical_receipts': receipts,
+        'lead_time': lead_time,
+        'shelf_life': shelf_life_days(df_products),
+        'unit_cost': numeric('Cost'),
+        'reorder_point': numeric('ReorderPoint'),
+        'safety_stock': safety['SafetyStock'].to_numpy(),
+        'reorder_level': safety['ReorderLevel'].to_numpy(),
+        'eoq': np.nan_to_num(cycles['EOQ'].to_numpy(dtype=float)),
+    }
+
+
+def _placeholder_orders(context, day, on_hand, on_order, signals):
+    """Vectorized calculate_reorder_qty_placeholder: returns the order quantity for every SKU on `day`."""
+    demand_proxy = signals['AvgDailyDemand'][:, day]
+    target_stock = demand_proxy * context['lead_time'] + context['safety_stock']
+
+    out_of_stock = on_hand <= 0
+    low_stock = ~out_of_stock & (on_hand < context['reorder_point'])
+    demand_flag = signals['IsHighDemand'][:, day] | signals['IsUpwardTrend'][:, day] | signals['IsConsistentHighSales'][:, day]
+
+    qty = np.zeros_like(on_hand)
+    qty = np.where(demand_flag, np.maximum(0, target_stock), qty)
+    qty = np.where(low_stock, np.maximum(20, target_stock), qty)
+    qty = np.where(out_of_stock, np.maximum(50, target_stock * 2), qty)
+    # The live table is re-evaluated daily; only one open order per SKU is placed
+    return np.where(on_order > 0, 0, np.round(qty))
+
+
+def simulate_policy(context, policy='sS', initial_stock=None, holding_rate=ANNUAL_HOLDING_RATE,
+                    spike_factor=SALES_SPIKE_FACTOR, trend_factor=UPWARD_TREND_FACTOR,
+                    high_volume_threshold=HIGH_VOLUME_THRESHOLD):
+    """
+    Replays the context's demand under one policy. Days are stepped in an outer loop, SKUs are vectorized.
+    Expiry is tracked FIFO with cumulative receipts: units received on day r are wasted on day r + shelf life
+    if they haven't been sold by then.
+    Returns {'per_sku': DataFrame, 'summary': dict}.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown policy '{policy}'. Expected one of {POLICIES}.")
+
+    demand = context['demand']
+    n_items, n_days = demand.shape
+    lead_time = context['lead_time']
+    shelf_life = context['shelf_life']
+    daily_holding_cost = context['unit_cost'] * holding_rate / 365
+    sku = np.arange(n_items)
+
+    if initial_stock is None:
+        initial_stock = context['reorder_level'] + context['eoq'] # Start each SKU at a full cycle
+    on_hand = np.asarray(initial_stock, dtype=float).copy()
+    on_order = np.zeros(n_items)
+    arrivals = np.zeros((n_days + int(lead_time.max(initial=0)) + 1, n_items))
+    if policy == 'historical':
+        arrivals[:n_days] += context['historical_receipts'].T
+
+    # cumulative_receipts[k + 1] = units received up to and including day k; row 0 = opening stock
+    cumulative_receipts = np.zeros((n_days + 1, n_items))
+    cumulative_receipts[0] = on_hand
+    consumed = np.zeros(n_items)
+    wasted_total = np.zeros(n_items)
+
+    signals = demand_signals(demand, spike_factor, trend_factor, high_volume_threshold) if policy == 'placeholder' else None
+    order_up_to = context['reorder_level'] + context['eoq']
+
+    stockout_days = np.zeros(n_items, dtype=np.int64)
+    lost_units = np.zeros(n_items)
+    holding_cost = np.zeros(n_items)
+    orders = np.zeros(n_items, dtype=np.int64)
+
+    for day in range(n_days):
+        received = arrivals[day]
+        on_hand += received
+        on_order = np.maximum(on_order - received, 0)
+        cumulative_receipts[day + 1] = cumulative_receipts[day] + received
+
+        # FIFO expiry: everything received on or before day - shelf_life is now expired
+        expired_row = day - shelf_life + 1
+        expired_received = np.where(expired_row >= 0, cumulative_receipts[np.clip(expired_row, 0, None), sku], 0)
+        waste = np.clip(expired_received - consumed - wasted_total, 0, on_hand)
+        on_hand -= waste
+        wasted_total += waste
+
+        want = demand[:, day]
+        sold = np.minimum(want, on_hand)
+        short = want > on_hand
+        stockout_days += short
+        lost_units += want - sold
+        on_hand -= sold
+        consumed += sold
+        holding_cost += on_hand * daily_holding_cost
+
+        if policy == 'historical':
+            continue
+        position = on_hand + on_order
+        if policy == 'placeholder':
+            qty = _placeholder_orders(context, day, on_hand, on_order, signals)
+        elif policy == 'sS':
+            qty = np.where(position <= context['reorder_level'], order_up_to - position, 0)
+        else: # 'eoq'
+            qty = np.where(position <= context['reorder_level'], context['eoq'], 0)
+        qty = np.clip(qty, 0, None)
+
+        ordering = qty > 0
+        if ordering.any():
+            arrivals[day + lead_time[ordering], sku[ordering]] += qty[ordering]
+            on_order += qty
+            orders += ordering
+
+    total_demand = demand.sum(axis=1)
+    per_sku = pd.DataFrame({
+        'StockoutDays': stockout_days,
+        'LostUnits': lost_units,
+        'FillRate': np.where(total_demand > 0, 1 - lost_units / np.where(total_demand > 0, total_demand, 1), 1.0),
+        'HoldingCost': holding_cost,
+        'WasteUnits': wasted_total,
+        'WasteCost': wasted_total * context['unit_cost'],
+        'Orders': orders,
+    }, index=context['product_ids'])
+
+    summary = {
+        'policy': policy,
+        'days': n_days,
+        'stockout_days': int(stockout_days.sum()),
+        'skus_with_stockouts': int((stockout_days > 0).sum()),
+        'fill_rate': float(1 - lost_units.sum() / total_demand.sum()) if total_demand.sum() > 0 else 1.0,
+        'holding_cost': float(holding_cost.sum()),
+        'waste_units': float(wasted_total.sum()),
+        'waste_cost': float((wasted_total * context['unit_cost']).sum()),
+        'orders': int(orders.sum()),
+    }
+    return {'per_sku': per_sku, 'summary': summary}
+
+
+def run_backtest(df_products, df_sales, df_inventory=None, df_purchases=None, policy='sS',
+                 end_date=None, num_days=DEFAULT_REPLAY_DAYS, demand_source='sales', **policy_kwargs):
+    """Convenience wrapper: prepares the history window and replays a single policy."""
+    context = prepare_backtest(df_products, df_sales, df_inventory, df_purchases, end_date, num_days, demand_source)
+    return simulate_policy(context, policy, **policy_kwargs)
+
+
+def tune_placeholder(context, spike_factors=(1.2, 1.5, 2.0), trend_factors=(1.1, 1.2, 1.5),
+                     high_volume_thresholds=(2, 5, 10)):
+    """
+    Replays the placeholder policy for every combination of SALES_SPIKE_FACTOR, UPWARD_TREND_FACTOR
+    and HIGH_VOLUME_THRESHOLD candidates, reusing one prepared context.
+    Returns one summary row per combination, best (fewest stockout days, then lowest cost) first.
+    """
+    rows = []
+    for spike, trend, threshold in itertools.product(spike_factors, trend_factors, high_volume_thresholds):
+        summary = simulate_policy(context, 'placeholder', spike_factor=spike, trend_factor=trend,
+                                  high_volume_threshold=threshold)['summary']
+        rows.append({'SALES_SPIKE_FACTOR': spike, 'UPWARD_TREND_FACTOR': trend, 'HIGH_VOLUME_THRESHOLD': threshold,
+                     **{key: value for key, value in summary.items() if key != 'policy'}})
+    results = pd.DataFrame(rows)
+    if results.empty:
+        return results
+    results['total_cost'] = results['holding_cost'] + results['waste_cost']
+    return results.sort_values(['stockout_days', 'total_cost']).reset_index(drop=True)
@@ -0,0 +1,112 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# --- Product Attribute Helpers ---
+# Attributes that the CSVs don't carry directly but several analytics modules need.
+
+# Typical shelf life (days) of a fresh lot, by category. Used when a lot's own expiry is unknown.
+CATEGORY_SHELF_LIFE_DAYS = {
+    'Meat & Seafood': 5,
+    'Fruits & Vegetables': 7,
+    'Dairy & Bakery': 10,
+    'Snacks & Beverages': 180,
+    'Grocery & Staples': 270,
+    'Personal Care': 730,
+    'Health & Wellness': 730,
+    'Home & Kitchen': 1095,
+    'Utensils & Cookware': 1095,
+    'Apparel': 1095,
+    'Footwear': 1095,
+    'Electronics': 1095,
+}
+DEFAULT_SHELF_LIFE_DAYS = 365
+
+# kg per stocked unit when UnitOfMeasure is itself a mass / volume (volumes at ~1 kg per litre)
+UNIT_OF_MEASURE_KG = {'kg': 1.0, 'g': 0.001, 'liters': 1.0, 'ml': 0.001}
+# Typical kg per piece, by category, for count units (pcs, packs, sets...) without a pack size in the name
+CATEGORY_UNIT_WEIGHT_KG = {
+    'Meat & Seafood': 0.5,
+    'Fruits & Vegetables': 0.5,
+    'Dairy & Bakery': 0.5,
+    'Snacks & Beverages': 0.3,
+    'Grocery & Staples': 1.0,
+    'Personal Care': 0.2,
+    'Health & Wellness': 0.2,
+    'Home & Kitchen': 0.8,
+    'Utensils & Cookware': 1.2,
+    'Apparel': 0.4,
+    'Footwear': 0.9,
+    'Electronics': 0.3,
+}
+DEFAULT_UNIT_WEIGHT_KG = 0.5
+PACK_SIZE_PATTERN = r'(\d+(?:\.\d+)?)\s*(kg|g|ml|l)\b' # e.g. "(500g)", "(1kg)", "(200ml)", "(1L)"
+PACK_SIZE_KG = {'kg': 1.0, 'g': 0.001, 'l': 1.0, 'ml': 0.001}
+CAPACITY_NAMED_CATEGORIES = {'Utensils & Cookware', 'Electronics', 'Apparel', 'Footwear'} # "(3L)" is a size, not contents
+
+# kg CO2e per kg of product written off: embodied production/transport emissions plus disposal
+CATEGORY_EMISSION_FACTORS = {
+    'Meat & Seafood': 20.0,
+    'Dairy & Bakery': 3.2,
+    'Fruits & Vegetables': 0.9,
+    'Grocery & Staples': 1.8,
+    'Snacks & Beverages': 2.0,
+    'Personal Care': 3.0,
+    'Health & Wellness': 3.5,
+    'Home & Kitchen': 3.0,
+    'Utensils & Cookware': 6.0,
+    'Apparel': 15.0,
+    'Footwear': 14.0,
+    'Electronics': 40.0,
+}
+DEFAULT_EMISSION_FACTOR = 2.5
+# ₹ per kg to dispose of written-off stock (e-waste needs a certified recycler)
+DISPOSAL_COST_PER_KG = 6.0
+CATEGORY_DISPOSAL_COST_PER_KG = {'Electronics': 45.0}
+
+
+def category_factors(categories):
+    """Returns (kg CO2e per kg, ₹ disposal cost per kg) arrays for an array of category names."""
+    categories = pd.Series(categories)
+    emission = categories.map(CATEGORY_EMISSION_FACTORS).fillna(DEFAULT_EMISSION_FACTOR).to_numpy(dtype=float)
+    disposal = categories.map(CATEGORY_DISPOSAL_COST_PER_KG).fillna(DISPOSAL_COST_PER_KG).to_numpy(dtype=float)
+    return emission, disposal
+
+
+def shelf_life_days(df_products):
+    """Returns the shelf life (days) of a fresh lot for every product row, from its Category."""
+    if 'Category' not in df_products.columns:
+        return np.full(len(df_products), DEFAULT_SHELF_LIFE_DAYS, dtype=np.int64)
+    return df_products['Category'].map(CATEGORY_SHELF_LIFE_DAYS).fillna(DEFAULT_SHELF_LIFE_DAYS) \
+        .to_numpy(dtype=np.int64)
+
+
+def unit_weight_kg(df_products):
+    """
+    Returns kg per stocked unit for every product row: the pack size in ProductName (e.g. "Paneer (200g)"),
+    else a bare mass / volume unit of measure (kg, g, liters, ml), else the category default.
+    """
+    n_items = len(df_products)
+    category = df_products['Category'] if 'Category' in df_products.columns else pd.Series(None, index=df_products.index)
+    weight = category.map(CATEGORY_UNIT_WEIGHT_KG).fillna(DEFAULT_UNIT_WEIGHT_KG).to_numpy(dtype=float)
+    if n_items == 0:
+        return weight
+
+    if 'UnitOfMeasure' in df_products.columns:
+        uom_kg = df_products['UnitOfMeasure'].astype(str).str.strip().str.lower().map(UNIT_OF_MEASURE_KG)
+        weight = np.where(uom_kg.notna(), uom_kg.to_numpy(dtype=float), weight)
+
+    if 'ProductName' in df_products.columns: # A pack size names the unit that is stocked, whatever the unit of measure
+        pack = df_products['ProductName'].astype(str).str.extract(PACK_SIZE_PATTERN, flags=re.IGNORECASE)
+        pack_kg = pd.to_numeric(pack[0], errors='coerce') * pack[1].str.lower().map(PACK_SIZE_KG)
+        use_pack = pack_kg.notna().to_numpy() & ~category.isin(CAPACITY_NAMED_CATEGORIES).to_numpy()
+        weight = np.where(use_pack, pack_kg.to_numpy(dtype=float), weight)
+    return weight
+
+
+def product_keys(df_products):
+    """Returns a pd.Index of ProductIDs whose positions serve as integer product keys."""
+    if df_products.empty or 'ProductID' not in df_products.columns:
+        return pd.Index([], name='ProductID')
+    return pd.Index(df_products['ProductID'].to_numpy(), name='ProductID')
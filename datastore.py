@@ -0,0 +1,81 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# --- Dataset Versioning & Derived-Data Cache ---
+# Every table in data/ is re-read on each page change (see initialize_stored_data in app.py),
+# but the files themselves rarely change. Derived results (safety stock, indexes, rollups...)
+# are therefore cached per *dataset version* instead of being rebuilt inside every callback.
+
+MAX_CACHED_VERSIONS = 3 # Keep results for the last few dataset versions only
+
+_cache = OrderedDict() # version -> {key: value}
+_cache_lock = threading.Lock()
+
+
+def dataset_version(data_dir):
+    """
+    Returns a short token identifying the current contents of the data directory.
+    Built from the name, size and modification time of every CSV, so it changes whenever a file does.
+    """
+    signature = []
+    if os.path.isdir(data_dir):
+        for name in sorted(os.listdir(data_dir)):
+            if name.endswith('.csv'):
+                stat = os.stat(os.path.join(data_dir, name))
+                signature.append(f"{name}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.sha1('|'.join(signature).encode('utf-8')).hexdigest()[:12]
+
+
+def get_version(stored_data_json):
+    """Returns the dataset version recorded in the stored-data dict (None if unknown)."""
+    if not stored_data_json:
+        return None
+    return stored_data_json.get('version')
+
+
+def get_cached(version, key, builder):
+    """
+    Returns the cached value for (version, key), calling builder() to compute it on a miss.
+    When the version is unknown the result is computed every time and never cached.
+    """
+    if version is None:
+        return builder()
+
+    with _cache_lock:
+        entries = _cache.get(version)
+        if entries is not None and key in entries:
+            _cache.move_to_end(version)
+            return entries[key]
+
+    value = builder() # Computed outside the lock so slow builders don't block other callbacks
+
+    with _cache_lock:
+        entries = _cache.setdefault(version, {})
+        entries[key] = value
+        _cache.move_to_end(version)
+        while len(_cache) > MAX_CACHED_VERSIONS:
+            _cache.popitem(last=False)
+    return value
+
+
+def read_frame(stored_data_json, name, date_cols=()):
+    """
+    Parses one table out of the stored-data JSON, once per dataset version.
+    The returned DataFrame is shared between callers, so it must not be modified in place.
+    """
+    def build():
+        raw = stored_data_json.get(name) if stored_data_json else None
+        if not raw:
+            return pd.DataFrame()
+        df = pd.read_json(io.StringIO(raw), orient='split')
+        for col in date_cols:
+            if col in df.columns:
+                df[col] = pd.to_datetime(df[col], errors='coerce')
+        return df
+
+    return get_cached(get_version(stored_data_json), ('frame', name, tuple(date_cols)), build)
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+# --- Demand History Helpers ---
+# Shared by the safety stock, replenishment and forecasting code so every module
+# reads per-product sales the same way: one row per product, one column per day.
+
+# --- Global Constants for Demand Analysis ---
+# Used by the reorder page and by the backtester (which sweeps them to tune the reorder logic).
+SHORT_PERIOD_DAYS = 7
+LONG_PERIOD_DAYS = 30
+VERY_LONG_PERIOD_DAYS = 90
+SALES_SPIKE_FACTOR = 1.5
+UPWARD_TREND_FACTOR = 1.2
+HIGH_VOLUME_THRESHOLD = 5 # units per day for consistent high sales
+
+
+def daily_demand_matrix(df_sales, product_ids, end_date, num_days, date_col='SaleDate', qty_col='Quantity'):
+    """
+    Returns an (n_products, num_days) array of units sold per product per day,
+    covering the num_days days that end on end_date (inclusive).
+    Rows follow the order of product_ids; sales for unknown products or outside the window are ignored.
+    date_col / qty_col allow the same layout to be built from other tables (e.g. OUT movements).
+    """
+    product_index = pd.Index(product_ids)
+    n_products = len(product_index)
+
+    if num_days <= 0 or n_products == 0 or df_sales.empty or \
+            not {'ProductID', date_col, qty_col}.issubset(df_sales.columns):
+        return np.zeros((n_products, max(num_days, 0)))
+
+    window_start = pd.Timestamp(end_date).normalize() - pd.Timedelta(days=num_days - 1)
+    sale_dates = pd.to_datetime(df_sales[date_col], errors='coerce').dt.normalize()
+    day_offsets = (sale_dates - window_start).dt.days.to_numpy() # NaN for missing dates
+    product_codes = product_index.get_indexer(df_sales['ProductID'])
+    quantities = pd.to_numeric(df_sales[qty_col], errors='coerce').fillna(0).to_numpy(dtype=float)
+
+    valid = (product_codes >= 0) & (day_offsets >= 0) & (day_offsets < num_days)
+    flat_index = product_codes[valid] * num_days + day_offsets[valid].astype(np.int64)
+    totals = np.bincount(flat_index, weights=quantities[valid], minlength=n_products * num_days)
+    return totals.reshape(n_products, num_days)
+
+
+def trailing_sum(daily, window, end_offset=0):
+    """
+    Sum of the `window` days ending `end_offset` days before each day, for every day at once.
+    daily is (n_products, n_days); days before the start of the history count as zero.
+    """
+    cumulative = np.concatenate([np.zeros((daily.shape[0], 1)), np.cumsum(daily, axis=1)], axis=1)
+    n_days = daily.shape[1]
+    end = np.arange(n_days) + 1 - end_offset # Exclusive end index into cumulative
+    start = np.clip(end - window, 0, None)
+    end = np.clip(end, 0, None)
+    return cumulative[:, end] - cumulative[:, start]
+
+
+def demand_signals(daily, spike_factor=SALES_SPIKE_FACTOR, trend_factor=UPWARD_TREND_FACTOR,
+                   high_volume_threshold=HIGH_VOLUME_THRESHOLD, short_days=SHORT_PERIOD_DAYS,
+                   long_days=LONG_PERIOD_DAYS, very_long_days=VERY_LONG_PERIOD_DAYS):
+    """
+    Vectorized version of the reorder page's demand analysis, evaluated for every day of `daily`.
+    Windows match the original date filters: the "last" windows include the current day
+    (e.g. dates >= today - 7 days), the "previous" windows are the equally long spans before them.
+    Returns a dict of (n_products, n_days) arrays: AvgDailyDemand, IsHighDemand, IsUpwardTrend,
+    IsConsistentHighSales.
+    """
+    daily = np.asarray(daily, dtype=float)
+    avg_last_short = trailing_sum(daily, short_days + 1) / short_days
+    avg_prev_short = trailing_sum(daily, short_days, end_offset=short_days + 1) / short_days
+    avg_last_long = trailing_sum(daily, long_days + 1) / long_days
+    avg_prev_long = trailing_sum(daily, long_days, end_offset=long_days + 1) / long_days
+    avg_very_long = trailing_sum(daily, very_long_days + 1) / very_long_days
+
+    is_high_demand = (avg_last_short > high_volume_threshold) & (avg_prev_short > 0) & \
+                     (avg_last_short >= avg_prev_short * spike_factor)
+    is_upward_trend = ~is_high_demand & (avg_last_long > high_volume_threshold) & (avg_prev_long > 0) & \
+                      (avg_last_long >= avg_prev_long * trend_factor)
+    is_consistent = ~is_high_demand & ~is_upward_trend & (avg_very_long >= high_volume_threshold)
+
+    return {
+        'AvgDailyDemand': avg_last_long,
+        'IsHighDemand': is_high_demand,
+        'IsUpwardTrend': is_upward_trend,
+        'IsConsistentHighSales': is_consistent,
+    }
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+# --- Time Series Downsampling ---
+# Long daily series are reduced server-side with Largest-Triangle-Three-Buckets (LTTB) before they
+# are sent to the browser: the series is split into equal buckets and from each bucket the point
+# forming the largest triangle with the previously kept point and the next bucket's average is kept,
+# which preserves peaks and troughs far better than striding. Charts request full resolution for
+# the visible window only when the user zooms (see visible_range).
+
+CHART_WIDTH_PX = 600 # Nominal plot width of a half-width (md=6) trend card
+POINTS_PER_PIXEL = 1
+MAX_POINTS_PER_TRACE = CHART_WIDTH_PX * POINTS_PER_PIXEL
+
+
+def _numeric(x):
+    """Dates -> int64 nanoseconds, anything else -> float."""
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').astype(np.int64).astype(float)
+    return x.astype(float)
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Positions of the points LTTB keeps when reducing (x, y) to `threshold` points.
+    x must be sorted ascending. The first and last points are always kept.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x, y = _numeric(x), np.asarray(y, dtype=float)
+    bucket_edges = np.floor(np.arange(threshold - 1) * (n - 2) / (threshold - 2)).astype(np.int64) + 1
+    bucket_edges[-1] = n - 1 # Buckets cover points 1 .. n-2
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = bucket_edges[bucket], bucket_edges[bucket + 1]
+        if bucket + 2 < len(bucket_edges):
+            next_start, next_end = end, bucket_edges[bucket + 2]
+        else:
+            next_start, next_end = n - 1, n # The last bucket looks ahead to the final point
+        avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        area = np.abs((x[previous] - avg_x) * (y[start:end] - y[previous]) -
+                      (x[previous] - x[start:end]) * (avg_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        kept[bucket + 1] = previous
+    return kept
+
+
+def downsample_series(x, y, max_points=MAX_POINTS_PER_TRACE, window=None):
+    """
+    Returns (x, y) reduced to about max_points with LTTB. With window=(start, end), points inside the
+    window are kept at full resolution (or reduced to max_points if there are still too many) and the
+    overview points outside it are kept so panning out still shows the whole series.
+    """
+    x, y = np.asarray(x), np.asarray(y)
+    overview = lttb_indices(x, y, max_points)
+    if window is None:
+        return x[overview], y[overview]
+
+    start, end = window
+    if np.issubdtype(x.dtype, np.datetime64):
+        start, end = pd.Timestamp(start).to_datetime64(), pd.Timestamp(end).to_datetime64()
+    lo, hi = np.searchsorted(x, start, side='left'), np.searchsorted(x, end, side='right')
+    inside = np.arange(lo, hi)[lttb_indices(x[lo:hi], y[lo:hi], max_points)]
+    kept = np.union1d(overview[(overview < lo) | (overview >= hi)], inside)
+    return x[kept], y[kept]
+
+
+def visible_range(relayout_data, axis='xaxis'):
+    """
+    Reads the zoomed x range out of a dcc.Graph relayoutData dict as (start, end) Timestamps.
+    Returns 'reset' when the user double-clicked back to autorange, None when the axis range did not change.
+    """
+    if not relayout_data:
+        return None
+    if relayout_data.get(f'{axis}.autorange'):
+        return 'reset'
+    if f'{axis}.range[0]' in relayout_data and f'{axis}.range[1]' in relayout_data:
+        bounds = relayout_data[f'{axis}.range[0]'], relayout_data[f'{axis}.range[1]']
+    elif f'{axis}.range' in relayout_data:
+        bounds = relayout_data[f'{axis}.range']
+    else:
+        return None
+    start, end = pd.to_datetime(bounds[0], errors='coerce'), pd.to_datetime(bounds[1], errors='coerce')
+    if pd.isna(start) or pd.isna(end):
+        return None
+    return start, end
@@ -0,0 +1,176 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from catalog import unit_weight_kg
+from datastore import get_cached, get_version, read_frame
+from lots import get_lot_ledger
+
+# --- Sorted Expiry Index ---
+# Products sorted by expiry day (int32 days since 1970-01-01). Every dashboard window
+# ("expired", "expiring in N days", "expired between D1 and D2") is a contiguous slice of the
+# sorted array, found with two binary searches: O(log n + k) instead of a full-table mask.
+# Queries return row positions into the expiry stock frame (see expiry_stock_frame).
+
+EPOCH = np.datetime64('1970-01-01', 'D')
+
+# Expiry status codes (int8). Display strings are only built for the rows actually shown.
+STATUS_GOOD = 0
+STATUS_NEARING_EXPIRY = 1 # 8..30 days left, shown as 'Nearing Expiry (N Days)'
+STATUS_EXPIRING_SOON = 2 # 0..7 days left
+STATUS_EXPIRED = 3
+STATUS_LABELS = {
+    STATUS_GOOD: 'Good',
+    STATUS_NEARING_EXPIRY: 'Nearing Expiry ({days} Days)',
+    STATUS_EXPIRING_SOON: 'Expiring Soon',
+    STATUS_EXPIRED: 'Expired',
+}
+EXPIRING_SOON_DAYS = 7
+NEARING_EXPIRY_DAYS = 30
+NO_EXPIRY_DAYS = np.iinfo(np.int16).max # days_remaining for rows without an ExpiryDate
+
+
+def day_number(date):
+    """Converts a date / Timestamp / datetime64 to the index's int32 day number."""
+    return int((np.datetime64(pd.Timestamp(date).date(), 'D') - EPOCH).astype(np.int64))
+
+
+def build_expiry_index(df_products):
+    """
+    Builds the index for any frame with an ExpiryDate column. Rows without an ExpiryDate are left out.
+    Returns {'days': sorted int32 expiry days, 'rows': matching row positions, 'size': rows in the frame}.
+    """
+    if df_products.empty or 'ExpiryDate' not in df_products.columns:
+        return {'days': np.empty(0, dtype=np.int32), 'rows': np.empty(0, dtype=np.int64), 'size': len(df_products)}
+
+    expiry = pd.to_datetime(df_products['ExpiryDate'], errors='coerce').to_numpy(dtype='datetime64[D]')
+    rows = np.flatnonzero(~np.isnat(expiry))
+    days = (expiry[rows] - EPOCH).astype(np.int32)
+    order = np.argsort(days, kind='stable')
+    return {'days': days[order], 'rows': rows[order], 'size': len(df_products)}
+
+
+def _bounds(index, start, end):
+    """Slice [lo, hi) of the sorted arrays holding start <= expiry day < end. None leaves a side open."""
+    days = index['days']
+    lo = 0 if start is None else int(np.searchsorted(days, day_number(start), side='left'))
+    hi = len(days) if end is None else int(np.searchsorted(days, day_number(end), side='left'))
+    return lo, max(lo, hi)
+
+
+def rows_between(index, start, end):
+    """Row positions with start <= expiry day < end, in expiry order. Either bound may be None (open)."""
+    lo, hi = _bounds(index, start, end)
+    return index['rows'][lo:hi]
+
+
+def expired(index, today):
+    """Rows that expired before today."""
+    return rows_between(index, None, today)
+
+
+def expiring_within(index, today, days):
+    """Rows expiring from today up to and including today + days."""
+    return rows_between(index, today, pd.Timestamp(today) + pd.Timedelta(days=days + 1))
+
+
+def expired_between(index, start, end):
+    """Rows whose expiry date falls in [start, end)."""
+    return rows_between(index, start, end)
+
+
+def count_between(index, start, end):
+    """Number of rows with start <= expiry day < end, without materialising them."""
+    lo, hi = _bounds(index, start, end)
+    return hi - lo
+
+
+def expiry_status(index, today, soon_days=EXPIRING_SOON_DAYS, nearing_days=NEARING_EXPIRY_DAYS):
+    """
+    Returns (status codes int8, days remaining int16) aligned with the products rows.
+    Each status is a contiguous slice of the sorted index, so codes are assigned slice by slice.
+    """
+    today_day = day_number(today)
+    codes = np.full(index['size'], STATUS_GOOD, dtype=np.int8)
+    days_remaining = np.full(index['size'], NO_EXPIRY_DAYS, dtype=np.int16)
+    days_remaining[index['rows']] = np.clip(index['days'].astype(np.int64) - today_day, -NO_EXPIRY_DAYS, NO_EXPIRY_DAYS)
+
+    soon_start, nearing_start, nearing_end = np.searchsorted(
+        index['days'], [today_day, today_day + soon_days + 1, today_day + nearing_days + 1], side='left')
+    rows = index['rows']
+    codes[rows[:soon_start]] = STATUS_EXPIRED
+    codes[rows[soon_start:nearing_start]] = STATUS_EXPIRING_SOON
+    codes[rows[nearing_start:nearing_end]] = STATUS_NEARING_EXPIRY
+    return codes, days_remaining
+
+
+def status_labels(codes, days_remaining):
+    """Builds the display strings for a handful of rows (e.g. the visible table page)."""
+    return [STATUS_LABELS[code].format(days=days) for code, days in zip(codes.tolist(), days_remaining.tolist())]
+
+
+def status_overview(codes, quantity):
+    """Row counts and unit totals per status code in a single bincount pass each."""
+    n_codes = len(STATUS_LABELS)
+    counts = np.bincount(codes, minlength=n_codes)
+    units = np.bincount(codes, weights=quantity, minlength=n_codes)
+    if np.issubdtype(np.asarray(quantity).dtype, np.integer):
+        units = np.rint(units).astype(np.int64)
+    return counts, units
+
+
+def get_expiry_status(stored_data_json):
+    """Returns (codes, days_remaining) for the stored dataset, cached per dataset version and day."""
+    today = pd.Timestamp(datetime.now().date())
+    _, index = get_expiry_index(stored_data_json)
+    return get_cached(get_version(stored_data_json), ('expiry_status', today), lambda: expiry_status(index, today))
+
+
+def expiry_stock_frame(df_products, ledger):
+    """
+    Rows the expiry views work on: one per lot that is still on hand or was written off at expiry
+    (quantity = units remaining / wasted), or one per product row when there is no purchase history.
+    Columns: StockID, ProductID, ProductName, quantity, ExpiryDate, Weight (kg).
+    """
+    columns = ['StockID', 'ProductID', 'ProductName', 'quantity', 'ExpiryDate', 'Weight']
+    if df_products.empty:
+        return pd.DataFrame(columns=columns)
+    # kg per unit: the products' Weight column (set by load_data) or derived from units of measure
+    unit_weight = pd.Series(pd.to_numeric(df_products['Weight'], errors='coerce').to_numpy()
+                            if 'Weight' in df_products.columns else unit_weight_kg(df_products),
+                            index=df_products['ProductID'].to_numpy())
+    unit_weight = unit_weight[~unit_weight.index.duplicated()]
+
+    if ledger.empty:
+        stock = df_products.assign(StockID=df_products['ProductID'])
+        quantity = pd.to_numeric(stock['quantity'], errors='coerce').fillna(0).to_numpy() \
+            if 'quantity' in stock.columns else np.zeros(len(stock))
+        stock['Weight'] = quantity * unit_weight.reindex(stock['ProductID']).fillna(0).to_numpy()
+        return stock[[col for col in columns if col in stock.columns]].reset_index(drop=True)
+
+    lots = ledger[(ledger['Remaining'] > 0) | (ledger['Wasted'] > 0)]
+    quantity = np.rint(np.where(lots['Wasted'] > 0, lots['Wasted'], lots['Remaining'])).astype(np.int64)
+    return pd.DataFrame({
+        'StockID': lots['LotID'].to_numpy(),
+        'ProductID': lots['ProductID'].to_numpy(),
+        'ProductName': lots['ProductName'].to_numpy(),
+        'quantity': quantity,
+        'ExpiryDate': lots['ExpiryDate'].to_numpy(),
+        'Weight': quantity * unit_weight.reindex(lots['ProductID']).fillna(0).to_numpy(),
+    })
+
+
+def get_expiry_index(stored_data_json):
+    """
+    Returns (df_stock, index) for the stored dataset, built once per dataset version and day.
+    df_stock is the lot-level expiry stock frame; it is shared, so callers must not modify it in place.
+    """
+    today = datetime.now().date()
+
+    def build():
+        df_stock = expiry_stock_frame(read_frame(stored_data_json, 'products', ('ExpiryDate',)),
+                                      get_lot_ledger(stored_data_json))
+        return df_stock, build_expiry_index(df_stock)
+
+    return get_cached(get_version(stored_data_json), ('expiry_index', today), build)
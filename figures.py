@@ -0,0 +1,118 @@
+import plotly.graph_objects as go
+from plotly.colors import qualitative
+
+from datastore import get_cached, get_version
+
+# --- Lightweight Figure Builder ---
+# Hot callbacks build their figures here instead of through plotly.express: traces are plain
+# dicts, go.Figure is created with property validation off, the static part of each layout comes
+# from FIGURE_LAYOUTS, and the finished figure dict is memoized per (chart id, inputs, dataset
+# version), so re-rendering a chart the user has already seen is a cache lookup.
+
+CHART_COLORS = qualitative.Plotly # Same default colour sequence plotly.express uses
+FACET_ROW_SPACING = 0.07 # plotly.express default for wrapped facets
+FONT = {'family': "Inter, sans-serif"}
+
+FIGURE_LAYOUTS = {
+    'dashboard-sales': {
+        'margin': {'l': 20, 'r': 20, 't': 20, 'b': 20},
+        'plot_bgcolor': 'white', 'paper_bgcolor': 'white',
+        'xaxis': {'title': {'text': None}, 'showgrid': False, 'showline': False, 'zeroline': False},
+        'yaxis': {'title': {'text': None}, 'showgrid': True, 'gridcolor': '#e0e0e0', 'showline': False,
+                  'zeroline': False, 'showticklabels': True},
+        'hovermode': 'x unified', 'font': FONT,
+    },
+    'dashboard-waste': {
+        'margin': {'l': 0, 'r': 0, 't': 0, 'b': 0},
+        'plot_bgcolor': 'white', 'paper_bgcolor': 'white',
+        'xaxis': {'title': {'text': None}, 'showgrid': False, 'showline': False, 'zeroline': False},
+        'yaxis': {'title': {'text': None}, 'showgrid': False, 'showline': False, 'zeroline': False,
+                  'showticklabels': False},
+        'hovermode': 'x unified', 'font': FONT,
+    },
+    'sustainability-monthly': {
+        'margin': {'l': 0, 'r': 0, 't': 10, 'b': 0},
+        'plot_bgcolor': 'white', 'paper_bgcolor': 'white',
+        'xaxis': {'title': {'text': None}, 'categoryorder': 'array'},
+        'yaxis': {'title': {'text': 'kg CO2e'}},
+        'legend': {'title': {'text': 'Location'}, 'tracegroupgap': 0},
+        'barmode': 'stack', 'hovermode': 'x unified', 'font': FONT,
+    },
+    'brand-sales': {
+        'height': 800,
+        'barmode': 'relative',
+        'legend': {'title': {'text': 'Brand'}, 'tracegroupgap': 0},
+        'uniformtext': {'minsize': 8, 'mode': 'hide'}, # Hide bar labels that do not fit
+        'margin': {'t': 60, 'b': 0, 'l': 0, 'r': 0},
+        'hovermode': 'y unified',
+    },
+    'carousel-insight': {
+        'margin': {'l': 40, 'r': 10, 't': 10, 'b': 30},
+        'plot_bgcolor': 'white', 'paper_bgcolor': 'white',
+        'xaxis': {'title': {'text': None}, 'showgrid': False},
+        'yaxis': {'showgrid': True, 'gridcolor': '#e0e0e0'},
+        'showlegend': False, 'font': FONT,
+    },
+    'promotion-lift': {
+        'margin': {'l': 0, 'r': 20, 't': 10, 'b': 30},
+        'plot_bgcolor': 'white', 'paper_bgcolor': 'white',
+        'xaxis': {'title': {'text': 'Lift in units per day (%)'}, 'showgrid': True, 'gridcolor': '#e0e0e0',
+                  'zeroline': True, 'zerolinecolor': '#adb5bd'},
+        'yaxis': {'title': {'text': None}, 'autorange': 'reversed', 'automargin': True},
+        'showlegend': False, 'font': FONT,
+    },
+}
+
+
+def build_figure(layout_name, traces, **layout):
+    """Figure dict from trace dicts and a FIGURE_LAYOUTS template; keyword arguments override template keys."""
+    return go.Figure(data=traces, layout=dict(FIGURE_LAYOUTS[layout_name], **layout), _validate=False).to_dict()
+
+
+def cached_figure(stored_data_json, chart_id, inputs, builder):
+    """Returns builder()'s figure for (chart_id, inputs), built once per dataset version."""
+    return get_cached(get_version(stored_data_json), ('figure', chart_id, tuple(inputs)), builder)
+
+
+def horizontal_bar_facets(df, category_col, value_col, facet_col, value_label):
+    """
+    Traces and layout for horizontal bars (one colour per category) faceted into stacked rows by facet_col,
+    first facet on top, sharing the value axis - the layout px.bar(orientation='h', facet_col_wrap=1) produces.
+    Returns (traces, layout dict).
+    """
+    facets = list(dict.fromkeys(df[facet_col]))
+    categories = list(dict.fromkeys(df[category_col]))
+    n_rows = len(facets)
+    row_height = (1 - FACET_ROW_SPACING * (n_rows - 1)) / n_rows
+
+    layout, annotations, axis_of = {}, [], {}
+    for row, facet in enumerate(facets):
+        number = n_rows - row # Bottom row gets x / y, which carry the value-axis tick labels
+        suffix = '' if number == 1 else str(number)
+        top = 1 - row * (row_height + FACET_ROW_SPACING)
+        axis_of[facet] = suffix
+        layout[f'xaxis{suffix}'] = {'anchor': f'y{suffix}', 'domain': [0.0, 1.0]}
+        if suffix:
+            layout[f'xaxis{suffix}'].update({'matches': 'x', 'showticklabels': False})
+        layout[f'yaxis{suffix}'] = {'anchor': f'x{suffix}', 'domain': [max(top - row_height, 0.0), top],
+                                    'categoryorder': 'array', 'categoryarray': categories[::-1],
+                                    'showticklabels': True, 'automargin': True}
+        annotations.append({'text': str(facet), 'showarrow': False, 'x': 0.5, 'xanchor': 'center', 'xref': 'paper',
+                            'y': top, 'yanchor': 'bottom', 'yref': 'paper'})
+    layout['xaxis']['title'] = {'text': value_label}
+    layout['annotations'] = annotations
+
+    traces = []
+    for position, (category, rows) in enumerate(df.groupby(category_col, sort=False)):
+        for facet_position, (facet, facet_rows) in enumerate(rows.groupby(facet_col, sort=False)):
+            suffix = axis_of[facet]
+            traces.append({
+                'type': 'bar', 'orientation': 'h',
+                'x': facet_rows[value_col].to_numpy(), 'y': facet_rows[category_col].to_numpy(),
+                'name': str(category), 'legendgroup': str(category), 'showlegend': facet_position == 0,
+                'marker': {'color': CHART_COLORS[position % len(CHART_COLORS)]},
+                'xaxis': f'x{suffix}', 'yaxis': f'y{suffix}',
+                'texttemplate': '%{x}', 'textposition': 'outside',
+                'hovertemplate': f'{category_col}=%{{y}}<br>{facet_col}={facet}<br>{value_label}=%{{x}}<extra></extra>',
+            })
+    return traces, layout
@@ -0,0 +1,327 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from catalog import product_keys
+from datastore import get_version
+from sales_facts import build_sales_facts, sales_rollup
+
+try: # Optional: without watchdog the drop folder is polled
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+# --- Streaming Sales Ingestion ---
+# Sale transactions arrive in batches (HTTP POST to /api/sales/batch, or .csv / .json files dropped
+# into data/incoming/). Each accepted batch is appended to sales_data.csv, with one stock-out row
+# per sale in inventory_movements.csv, so the next full load contains it. Until then the batch is
+# kept in memory with its own rollup (daily revenue, category profit, units sold): the dashboard
+# adds the rollups of batches newer than its stored data to the rollup of that data, which costs
+# O(batch) per batch instead of a reload. Live batches are held per server process, at most
+# MAX_LIVE_BATCHES of them; a dashboard whose stored data trails the stream by more than
+# RELOAD_PENDING_BATCHES reloads it (see reload_needed), so no batch it still needs is evicted.
+
+SALES_FILE = 'sales_data.csv'
+INVENTORY_FILE = 'inventory_movements.csv'
+PRODUCTS_FILE = 'products_and_suppliers_combined.csv'
+SALES_COLUMNS = ['SaleID', 'SaleDate', 'ProductID', 'ProductCategory', 'Brand', 'Quantity', 'UnitPrice',
+                 'TotalPrice', 'LocationID', 'Profit']
+REQUIRED_COLUMNS = ['SaleID', 'SaleDate', 'ProductID', 'Quantity', 'LocationID'] # Plus UnitPrice or TotalPrice
+SALE_MOVEMENT_PREFIX = 'MOVE-' # Stock-out movement written for each sale: MOVE-<SaleID>
+DROP_FOLDER = 'incoming' # Under data/; write files under a temporary name (.tmp / .part) and rename into place
+DROP_FILE_TYPES = ('.csv', '.json')
+PROCESSED_FOLDER = 'processed'
+FAILED_FOLDER = 'failed'
+POLL_SECONDS = 2 # Drop-folder scan interval when watchdog is not installed
+MAX_LIVE_BATCHES = 1000 # Batches kept in memory for dashboards whose data predates them
+RELOAD_PENDING_BATCHES = MAX_LIVE_BATCHES // 2 # Pending batches past which a dashboard reloads its stored data
+
+_ingest_lock = threading.Lock()
+_stream = {
+    'sequence': 0, # Number of batches accepted by this process
+    'batches': deque(maxlen=MAX_LIVE_BATCHES), # {'sequence', 'rows', 'rollup', 'movements'}
+    'sale_ids': set(), # SaleIDs in the sales CSV, so a re-sent batch is not appended twice
+    'sale_ids_state': None, # (path, size, mtime) of the sales CSV the set was read from
+    'catalog': None, # (products file mtime, products frame)
+    'watcher': None,
+}
+
+
+def _numeric(df, col):
+    if col not in df.columns:
+        return pd.Series(np.nan, index=df.index)
+    return pd.to_numeric(df[col], errors='coerce')
+
+
+def _catalog(data_dir):
+    """ProductID / Category / Cost from the products CSV, re-read only when the file changes."""
+    path = os.path.join(data_dir, PRODUCTS_FILE)
+    mtime = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+    cached = _stream['catalog']
+    if cached is None or cached[0] != mtime:
+        df_products = pd.read_csv(path, usecols=['ProductID', 'Category', 'Cost']) if mtime else pd.DataFrame()
+        _stream['catalog'] = cached = (mtime, df_products)
+    return cached[1]
+
+
+def _file_state(path):
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return path, stat.st_size, stat.st_mtime_ns
+
+
+def _known_sale_ids(data_dir):
+    """SaleIDs already in the sales CSV, re-read whenever the file changed other than through ingest_sales."""
+    path = os.path.join(data_dir, SALES_FILE)
+    state = _file_state(path)
+    if _stream['sale_ids_state'] != state or state is None:
+        sale_ids = pd.read_csv(path, usecols=lambda col: col == 'SaleID', dtype=str) if state else pd.DataFrame()
+        _stream['sale_ids'] = set(sale_ids['SaleID'].dropna().str.strip()) if 'SaleID' in sale_ids.columns else set()
+        _stream['sale_ids_state'] = state
+    return _stream['sale_ids']
+
+
+def sales_records(payload):
+    """Sale records from a decoded JSON payload: a list of records or {"sales": [...]}."""
+    if isinstance(payload, dict):
+        payload = payload.get('sales')
+    if not isinstance(payload, list):
+        raise ValueError('Expected a list of sale records or {"sales": [...]}')
+    return payload
+
+
+def parse_sales_batch(records, df_products, known_sale_ids=()):
+    """
+    Validates sale records (list of dicts or DataFrame) and fills in what the catalog knows:
+    ProductCategory, the missing one of UnitPrice / TotalPrice, and Profit = TotalPrice - Quantity * Cost.
+    Returns (accepted rows in SALES_COLUMNS order, [{'SaleID', 'error'} for each rejected row]).
+    Raises ValueError when the batch itself is malformed (not a table, required columns missing).
+    """
+    df = records if isinstance(records, pd.DataFrame) else pd.DataFrame.from_records(records)
+    missing = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if df.empty:
+        return pd.DataFrame(columns=SALES_COLUMNS), []
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
+    if 'UnitPrice' not in df.columns and 'TotalPrice' not in df.columns:
+        raise ValueError("Each sale needs a UnitPrice or a TotalPrice")
+    df = df.reset_index(drop=True)
+
+    sale_id = df['SaleID'].astype('string').str.strip()
+    sale_date = pd.to_datetime(df['SaleDate'], errors='coerce', format='mixed').dt.normalize() # Sales are daily
+    quantity = _numeric(df, 'Quantity')
+    unit_price, total_price = _numeric(df, 'UnitPrice'), _numeric(df, 'TotalPrice')
+    unit_price = unit_price.fillna(total_price / quantity)
+    total_price = total_price.fillna(unit_price * quantity)
+
+    checks = [ # First failing check is reported
+        (sale_id.isna() | (sale_id == ''), 'missing SaleID'),
+        (df['ProductID'].isna(), 'missing ProductID'),
+        (df['LocationID'].isna(), 'missing LocationID'),
+        (sale_date.isna(), 'invalid SaleDate'),
+        (~(quantity > 0), 'Quantity must be a positive number'),
+        (~(total_price >= 0), 'invalid UnitPrice / TotalPrice'),
+        (sale_id.duplicated(), 'duplicate SaleID in batch'),
+        (sale_id.map(known_sale_ids.__contains__).astype(bool), 'SaleID already ingested'),
+    ]
+    error = pd.Series('', index=df.index)
+    for failed, message in reversed(checks):
+        error = error.mask(failed.fillna(True).to_numpy(dtype=bool), message)
+    ok = (error == '').to_numpy()
+    rejected = [{'SaleID': None if pd.isna(i) else str(i), 'error': e} for i, e in zip(sale_id[~ok], error[~ok])]
+
+    df, quantity = df[ok], quantity[ok]
+    keys = product_keys(df_products).get_indexer(df['ProductID']) if not df_products.empty else np.full(len(df), -1)
+    known = keys >= 0
+    category = df['ProductCategory'] if 'ProductCategory' in df.columns else pd.Series(np.nan, index=df.index, dtype=object)
+    if known.any():
+        category = category.fillna(pd.Series(np.where(known, df_products['Category'].to_numpy()[keys], None), index=df.index))
+        cost = pd.to_numeric(df_products['Cost'], errors='coerce').to_numpy()[keys]
+        profit = np.where(known, total_price[ok] - quantity * cost, np.nan)
+    else:
+        profit = np.full(len(df), np.nan)
+    if (quantity % 1 == 0).all():
+        quantity = quantity.astype('int64')
+
+    rows = pd.DataFrame({
+        'SaleID': sale_id[ok].to_numpy(dtype=object),
+        'SaleDate': sale_date[ok].to_numpy(),
+        'ProductID': df['ProductID'].to_numpy(),
+        'ProductCategory': category.to_numpy(),
+        'Brand': df['Brand'].to_numpy() if 'Brand' in df.columns else None,
+        'Quantity': quantity.to_numpy(),
+        'UnitPrice': unit_price[ok].to_numpy(),
+        'TotalPrice': total_price[ok].to_numpy(),
+        'LocationID': df['LocationID'].to_numpy(),
+        'Profit': profit,
+    })
+    return rows, rejected
+
+
+def _stock_movements(rows):
+    """One stock-out movement per ingested sale."""
+    return pd.DataFrame({
+        'MovementID': SALE_MOVEMENT_PREFIX + rows['SaleID'],
+        'MovementDate': rows['SaleDate'],
+        'ProductID': rows['ProductID'],
+        'MovementType': 'OUT',
+        'Quantity': rows['Quantity'],
+        'LocationID': rows['LocationID'],
+    })
+
+
+def _append_csv(path, rows):
+    """Appends rows to a CSV in the file's own column order and line endings (creates it if missing)."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        rows.to_csv(path, index=False, date_format='%Y-%m-%d')
+        return
+    with open(path, 'rb') as f:
+        header = f.readline()
+        f.seek(-1, os.SEEK_END)
+        needs_newline = f.read(1) != b'\n'
+    line_end = '\r\n' if header.endswith(b'\r\n') else '\n'
+    columns = header.decode('utf-8-sig').strip().split(',')
+    text = rows.reindex(columns=columns).to_csv(header=False, index=False, lineterminator=line_end,
+                                                 date_format='%Y-%m-%d')
+    with open(path, 'a', encoding='utf-8', newline='') as f:
+        f.write((line_end if needs_newline else '') + text)
+
+
+def ingest_sales(records, data_dir):
+    """
+    Validates a batch of sales, appends the accepted rows to the sales and inventory CSVs and publishes
+    the batch to live dashboards. Returns {'accepted', 'rejected', 'sequence'}.
+    Raises ValueError for a malformed batch; nothing is written in that case.
+    """
+    with _ingest_lock:
+        df_products = _catalog(data_dir)
+        rows, rejected = parse_sales_batch(records, df_products, _known_sale_ids(data_dir))
+        if not rows.empty:
+            sales_path = os.path.join(data_dir, SALES_FILE)
+            _append_csv(sales_path, rows)
+            movements = _stock_movements(rows)
+            _append_csv(os.path.join(data_dir, INVENTORY_FILE), movements)
+            _stream['sequence'] += 1
+            _stream['sale_ids'].update(rows['SaleID'])
+            _stream['sale_ids_state'] = _file_state(sales_path) # Our own append: the set is already up to date
+            _stream['batches'].append({
+                'sequence': _stream['sequence'],
+                'rows': len(rows),
+                'rollup': sales_rollup(build_sales_facts(rows, df_products)),
+                'movements': movements, # Applied to per-location stock (location_stock.py)
+            })
+        return {'accepted': len(rows), 'rejected': rejected, 'sequence': _stream['sequence']}
+
+
+def ingestion_paused():
+    """Lock to hold while reading the sales and inventory CSVs, so a batch lands in both reads or neither."""
+    return _ingest_lock
+
+
+def stream_sequence():
+    """Sequence number of the latest accepted batch (0 before the first one)."""
+    return _stream['sequence']
+
+
+def reload_needed(loaded_sequence):
+    """
+    True when stored data loaded at loaded_sequence (its 'stream_sequence') should be reloaded: more than
+    RELOAD_PENDING_BATCHES batches arrived since, so the live batches it still needs are about to be evicted
+    (or already were).
+    """
+    return _stream['sequence'] - (loaded_sequence or 0) > RELOAD_PENDING_BATCHES
+
+
+def pending_sales(stored_data_json):
+    """Batches accepted after the stored dataset was loaded (see 'stream_sequence' in load_data), oldest first."""
+    if get_version(stored_data_json) is None:
+        return []
+    loaded = stored_data_json.get('stream_sequence', 0)
+    return [batch for batch in list(_stream['batches']) if batch['sequence'] > loaded]
+
+
+# --- Drop Folder ---
+
+def ingest_drop_file(path, data_dir):
+    """Ingests one dropped .csv / .json file, then moves it to processed/ (or failed/, with a .error note)."""
+    folder, name = os.path.split(path)
+    claimed = os.path.join(folder, PROCESSED_FOLDER, name)
+    os.makedirs(os.path.dirname(claimed), exist_ok=True)
+    try:
+        os.replace(path, claimed) # Claim the file first so a second scan cannot ingest it again
+    except FileNotFoundError:
+        return None
+    try:
+        if name.lower().endswith('.json'):
+            with open(claimed, encoding='utf-8') as f:
+                records = sales_records(json.load(f))
+        else:
+            records = pd.read_csv(claimed)
+        result = ingest_sales(records, data_dir)
+    except (ValueError, OSError) as e:
+        failed = os.path.join(folder, FAILED_FOLDER, name)
+        os.makedirs(os.path.dirname(failed), exist_ok=True)
+        os.replace(claimed, failed)
+        with open(failed + '.error', 'w', encoding='utf-8') as f:
+            f.write(str(e))
+        print(f"Warning: could not ingest {name}: {e}")
+        return None
+    print(f"Ingested {name}: {result['accepted']} sales accepted, {len(result['rejected'])} rejected.")
+    return result
+
+
+def scan_drop_folder(data_dir):
+    """Ingests every complete batch file waiting in data/incoming/, oldest first."""
+    folder = os.path.join(data_dir, DROP_FOLDER)
+    if not os.path.isdir(folder):
+        return
+    waiting = []
+    for entry in os.scandir(folder):
+        if entry.is_file() and entry.name.lower().endswith(DROP_FILE_TYPES) and not entry.name.startswith('.'):
+            try:
+                waiting.append((entry.stat().st_mtime_ns, entry.path))
+            except FileNotFoundError: # Claimed by a concurrent scan
+                continue
+    for _, path in sorted(waiting):
+        ingest_drop_file(path, data_dir)
+
+
+def _poll_drop_folder(data_dir):
+    while True:
+        try:
+            scan_drop_folder(data_dir)
+        except OSError as e:
+            print(f"Warning: drop folder scan failed: {e}")
+        time.sleep(POLL_SECONDS)
+
+
+def start_drop_folder_watcher(data_dir):
+    """
+    Starts watching data/incoming/ for batch files (watchdog when installed, a polling thread otherwise).
+    Safe to call more than once per process (cheap once started); files already waiting are ingested straight away.
+    """
+    if _stream['watcher'] is not None:
+        return _stream['watcher']
+    with _ingest_lock:
+        if _stream['watcher'] is not None:
+            return _stream['watcher']
+        os.makedirs(os.path.join(data_dir, DROP_FOLDER), exist_ok=True)
+        if Observer is not None:
+            handler = FileSystemEventHandler()
+            handler.on_created = handler.on_moved = handler.on_closed = lambda event: scan_drop_folder(data_dir)
+            watcher = Observer()
+            watcher.schedule(handler, os.path.join(data_dir, DROP_FOLDER), recursive=False)
+            watcher.daemon = True
+        else:
+            watcher = threading.Thread(target=_poll_drop_folder, args=(data_dir,), daemon=True)
+        watcher.start()
+        _stream['watcher'] = watcher
+    scan_drop_folder(data_dir)
+    return watcher
@@ -0,0 +1,213 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from catalog import DEFAULT_UNIT_WEIGHT_KG, product_keys, unit_weight_kg
+from datastore import get_cached, get_version, read_frame
+
+# --- Per-Location Stock & Capacity ---
+# On-hand units per (location, product) are the running sum of inventory movements (IN adds, OUT
+# subtracts), held as a dense locations x products matrix filled with one np.bincount. Catalog
+# products keep their catalog position as product key; ProductIDs the catalog lacks get keys after
+# it (with default attributes), and unseen locations or products grow the matrix. When a new dataset
+# version only appends movements (old MovementIDs a prefix of the new ones, which is what ingest.py
+# writes), just the new rows are added to the previous matrix. Weight per unit comes from
+# catalog.unit_weight_kg; capacity utilization converts stocked kg to floor area at
+# STORAGE_KG_PER_SQM against Capacity_sqm in locations.csv. Every location's partition (stock rows
+# and KPIs) is precomputed once per version, so the stock table and dashboard filters are lookups.
+
+ALL_LOCATIONS = 'all' # Partition summed over every location (the filters' "All Locations" value)
+STORAGE_KG_PER_SQM = 100.0 # Stocked kg per sqm of floor, aisles and handling space included
+LOW_STOCK_UNITS = 20 # On hand at or below this (and above OUT_OF_STOCK_UNITS): 'Low Stock'
+OUT_OF_STOCK_UNITS = 0
+UNKNOWN_LABEL = 'Unknown' # Category / supplier of products missing from the catalog
+UNKNOWN_UNIT = 'units' # Unit of measure of products missing from the catalog (movements count units)
+STOCK_COLUMNS = ['ProductID', 'ProductName', 'Category', 'Supplier', 'UnitOfMeasure', 'OnHand', 'WeightKg',
+                 'UtilizationPct', 'STATUS']
+
+_stock_lock = threading.Lock()
+_last_stock = {} # Most recent matrix and the movement IDs / products JSON it was built from, for incremental appends
+
+
+def stock_status(quantity):
+    """'In Stock' / 'Low Stock' / 'Out of Stock' for an array of on-hand quantities."""
+    quantity = np.asarray(quantity, dtype=float)
+    return np.select([quantity <= OUT_OF_STOCK_UNITS, quantity <= LOW_STOCK_UNITS],
+                     ['Out of Stock', 'Low Stock'], 'In Stock').astype(object)
+
+
+def capacity_text(kpis):
+    """e.g. '62% of 800 sqm used (49,180 kg)' for a partition's KPIs."""
+    if pd.isna(kpis['UtilizationPct']):
+        return f"{kpis['WeightKg']:,.0f} kg, capacity unknown"
+    return f"{kpis['UtilizationPct']:.0f}% of {kpis['CapacitySqm']:,.0f} sqm used ({kpis['WeightKg']:,.0f} kg)"
+
+
+def _codes(index, values):
+    """Positions of values in index, appending values it does not hold yet. Returns (codes, index)."""
+    codes = index.get_indexer(values)
+    unseen = codes < 0
+    if unseen.any():
+        index = index.append(pd.Index(pd.unique(values[unseen]), name=index.name))
+        codes = index.get_indexer(values)
+    return codes, index
+
+
+def empty_stock(df_products):
+    """
+    Stock with no movements applied: {'locations', 'products' (pd.Index), 'units' (on hand) and
+    'moves' (movement counts), both locations x products}.
+    """
+    products = product_keys(df_products)
+    return {'locations': pd.Index([], name='LocationID', dtype=object), 'products': products,
+            'units': np.zeros((0, len(products))), 'moves': np.zeros((0, len(products)), dtype=np.int64)}
+
+
+def apply_movements(stock, df_movements):
+    """Returns stock with df_movements added (IN adds, OUT subtracts). The given stock is not modified."""
+    needed = {'ProductID', 'MovementType', 'Quantity', 'LocationID'}
+    if df_movements.empty or not needed <= set(df_movements.columns):
+        return stock
+
+    location_ids = df_movements['LocationID'].fillna(UNKNOWN_LABEL).astype(str).to_numpy()
+    location_codes, locations = _codes(stock['locations'], location_ids)
+    product_codes, products = _codes(stock['products'], df_movements['ProductID'].fillna(UNKNOWN_LABEL).to_numpy())
+    sign = np.select([df_movements['MovementType'].to_numpy() == 'IN', df_movements['MovementType'].to_numpy() == 'OUT'],
+                     [1.0, -1.0], 0.0)
+    quantity = pd.to_numeric(df_movements['Quantity'], errors='coerce').fillna(0).to_numpy(dtype=float) * sign
+
+    shape = (len(locations), len(products))
+    cells = location_codes * shape[1] + product_codes
+    result = {'locations': locations, 'products': products}
+    for name, added in (('units', np.bincount(cells, weights=quantity, minlength=shape[0] * shape[1])),
+                        ('moves', np.bincount(cells, minlength=shape[0] * shape[1]))):
+        grown = np.zeros(shape, dtype=stock[name].dtype) # Previous cells; new locations / products start empty
+        grown[:stock[name].shape[0], :stock[name].shape[1]] = stock[name]
+        result[name] = grown + added.reshape(shape)
+    return result
+
+
+def _product_attributes(products, df_products):
+    """Name, category, supplier, unit of measure and kg per unit for every product key of the stock matrix."""
+    catalog = pd.DataFrame(index=product_keys(df_products))
+    for column, sources in (('ProductName', ['ProductName']), ('Category', ['Category']),
+                            ('Supplier', ['Supplier', 'SupplierName']), ('UnitOfMeasure', ['UnitOfMeasure'])):
+        source = next((name for name in sources if name in df_products.columns), None)
+        catalog[column] = df_products[source].to_numpy() if source and len(catalog) else None
+    catalog['UnitWeightKg'] = unit_weight_kg(df_products) if len(catalog) else []
+
+    attributes = catalog.reindex(products)
+    attributes['ProductName'] = attributes['ProductName'].fillna(pd.Series(products, index=products))
+    attributes[['Category', 'Supplier']] = attributes[['Category', 'Supplier']].fillna(UNKNOWN_LABEL)
+    attributes['UnitOfMeasure'] = attributes['UnitOfMeasure'].fillna(UNKNOWN_UNIT)
+    attributes['UnitWeightKg'] = attributes['UnitWeightKg'].fillna(DEFAULT_UNIT_WEIGHT_KG)
+    return attributes.rename_axis('ProductID').reset_index()
+
+
+def location_partitions(stock, df_products, df_locations):
+    """
+    Precomputed views per LocationID plus ALL_LOCATIONS: {'name', 'stock' (STOCK_COLUMNS for the products
+    with movements there), 'kpis' (Units, WeightKg, CapacitySqm, UsedSqm, UtilizationPct, Products, LowStock, OutOfStock)}.
+    """
+    attributes = _product_attributes(stock['products'], df_products)
+    unit_weight = attributes['UnitWeightKg'].to_numpy()
+    locations = df_locations.drop_duplicates('LocationID').set_index('LocationID') \
+        if 'LocationID' in df_locations.columns else pd.DataFrame()
+    capacity = pd.to_numeric(locations['Capacity_sqm'], errors='coerce').reindex(stock['locations']).to_numpy(dtype=float) \
+        if 'Capacity_sqm' in locations.columns else np.full(len(stock['locations']), np.nan)
+    names = locations['LocationName'].reindex(stock['locations']).fillna(pd.Series(stock['locations'], index=stock['locations'])) \
+        if 'LocationName' in locations.columns else pd.Series(stock['locations'], index=stock['locations'])
+
+    views = [(location_id, names[location_id], stock['units'][i], stock['moves'][i], capacity[i])
+             for i, location_id in enumerate(stock['locations'])]
+    views.append((ALL_LOCATIONS, 'All Locations', stock['units'].sum(axis=0), stock['moves'].sum(axis=0),
+                  np.nansum(capacity) if np.isfinite(capacity).any() else np.nan))
+
+    partitions = {}
+    for location_id, name, units, moves, capacity_sqm in views:
+        present = moves > 0
+        on_hand = units[present]
+        weight = np.maximum(on_hand, 0) * unit_weight[present] # Overdrawn stock takes no space
+        capacity_kg = capacity_sqm * STORAGE_KG_PER_SQM if capacity_sqm > 0 else np.nan
+        rows = attributes[present].reset_index(drop=True)
+        rows['OnHand'], rows['WeightKg'] = on_hand, weight
+        rows['UtilizationPct'] = weight / capacity_kg * 100
+        rows['STATUS'] = stock_status(on_hand)
+        partitions[location_id] = {
+            'name': name,
+            'stock': rows[STOCK_COLUMNS],
+            'kpis': {
+                'Units': float(on_hand.sum()),
+                'WeightKg': float(weight.sum()),
+                'CapacitySqm': float(capacity_sqm),
+                'UsedSqm': float(weight.sum() / STORAGE_KG_PER_SQM),
+                'UtilizationPct': float(weight.sum() / capacity_kg * 100),
+                'Products': int((on_hand > OUT_OF_STOCK_UNITS).sum()),
+                'LowStock': int(((on_hand > OUT_OF_STOCK_UNITS) & (on_hand <= LOW_STOCK_UNITS)).sum()),
+                'OutOfStock': int((on_hand <= OUT_OF_STOCK_UNITS).sum()),
+            },
+        }
+    return partitions
+
+
+def catalog_on_hand(partition, df_products):
+    """
+    Splits a partition's on-hand units into those of catalog products (pd.Series indexed by ProductID)
+    and the ProductIDs its movements use that the catalog does not hold (a data-quality issue, not stock items).
+    """
+    rows = partition['stock'] if partition is not None else pd.DataFrame(columns=STOCK_COLUMNS)
+    known = rows['ProductID'].isin(product_keys(df_products))
+    return rows.loc[known].set_index('ProductID')['OnHand'], rows.loc[~known, 'ProductID'].tolist()
+
+
+def unmatched_text(unmatched):
+    """e.g. '150 movement ProductIDs match no catalog product (PROD0001, PROD0002, PROD0003, ...).'"""
+    if not unmatched:
+        return ""
+    shown = ', '.join(map(str, unmatched[:3])) + (', ...' if len(unmatched) > 3 else '')
+    return f"{len(unmatched)} movement ProductIDs match no catalog product ({shown})."
+
+
+def _appended_rows(previous, movement_ids):
+    """Number of leading movements already in the previous stock, or None if they are not a prefix."""
+    if previous['movement_ids'] is None or movement_ids is None or len(previous['movement_ids']) > len(movement_ids):
+        return None
+    if not np.array_equal(movement_ids[:len(previous['movement_ids'])], previous['movement_ids']):
+        return None
+    return len(previous['movement_ids'])
+
+
+def get_location_stock(stored_data_json):
+    """
+    Returns the stock matrix for the stored dataset, built once per dataset version (shared; do not modify).
+    A version that only appended movements to the previous one is built from it by adding the new rows.
+    """
+    def build():
+        df_inventory = read_frame(stored_data_json, 'inventory', ('MovementDate',))
+        df_products = read_frame(stored_data_json, 'products')
+        products_json = stored_data_json.get('products') if stored_data_json else None
+        movement_ids = df_inventory['MovementID'].to_numpy() if 'MovementID' in df_inventory.columns else None
+        with _stock_lock:
+            previous = _last_stock.get('state')
+            start = None
+            if previous is not None and previous['products_json'] == products_json:
+                start = _appended_rows(previous, movement_ids)
+            if start is None:
+                stock = apply_movements(empty_stock(df_products), df_inventory)
+            else:
+                stock = apply_movements(previous['stock'], df_inventory.iloc[start:])
+            _last_stock['state'] = {'stock': stock, 'products_json': products_json, 'movement_ids': movement_ids}
+        return stock
+
+    return get_cached(get_version(stored_data_json), ('location_stock',), build)
+
+
+def get_location_partitions(stored_data_json):
+    """
+    Returns location_partitions for the stored dataset, built once per dataset version. Streamed sales
+    batches (see ingest.py) are applied on top by the dashboard (apply_movements on get_location_stock).
+    """
+    return get_cached(get_version(stored_data_json), ('location_partitions',),
+                      lambda: location_partitions(get_location_stock(stored_data_json), read_frame(stored_data_json, 'products'),
+                                                  read_frame(stored_data_json, 'locations')))
@@ -0,0 +1,141 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from catalog import shelf_life_days
+from datastore import get_cached, get_version, read_frame
+
+# --- Lot Ledger (FEFO) ---
+# Every purchase in purchase_history.csv becomes a lot expiring PurchaseDate + category shelf life.
+# Consumption (OUT movements, or sales when the movements don't reference catalog products) is
+# matched to lots first-expired-first-out. Since a product's lots share one shelf life, FEFO order
+# is receipt order and the matching reduces to cumulative sums:
+#   C_k  = units received in a product's lots 1..k (in expiry order)
+#   Q(t) = units the product consumed up to and including day t
+#   W_k  = units written off in lots 1..k = max(W_k-1, C_k - Q(expiry_k)) for expired lots
+# so waste is a per-product running maximum and what is left of a live lot is clip(C_k - Q(today) - W, 0, qty_k).
+# Consumption that runs ahead of receipts is charged to the next lot received.
+
+LOT_COLUMNS = ['LotID', 'ProductID', 'ProductName', 'ReceivedDate', 'ExpiryDate',
+               'Quantity', 'Consumed', 'Wasted', 'Remaining']
+
+
+def _days(values):
+    """Dates -> int64 day numbers (NaT -> min int64)."""
+    return pd.to_datetime(values, errors='coerce').to_numpy(dtype='datetime64[D]').astype(np.int64)
+
+
+def segment_cummax(values, groups, span):
+    """Running maximum of non-negative values restarting at each group (groups sorted ascending)."""
+    offset = groups.astype(float) * span
+    return np.maximum.accumulate(values + offset) - offset
+
+
+def build_lot_ledger(df_products, df_purchases, df_consumption, as_of=None,
+                     date_col='MovementDate', qty_col='Quantity'):
+    """
+    Builds the lot ledger as of a date. df_consumption holds one row per outbound event
+    (ProductID, date_col, qty_col). Lots received after as_of are left out.
+    Returns one row per lot (LOT_COLUMNS), sorted by ProductID order then expiry.
+    """
+    if df_products.empty or df_purchases.empty or 'ProductID' not in df_purchases.columns:
+        return pd.DataFrame(columns=LOT_COLUMNS)
+
+    as_of_day = _days([as_of if as_of is not None else datetime.now().date()])[0]
+    product_index = pd.Index(df_products['ProductID'].to_numpy())
+    shelf_life = shelf_life_days(df_products)
+
+    # Lots, sorted by (product, expiry)
+    codes = product_index.get_indexer(df_purchases['ProductID'])
+    received = _days(df_purchases['PurchaseDate'])
+    quantity = pd.to_numeric(df_purchases['QuantityPurchased'], errors='coerce').fillna(0).to_numpy(dtype=float)
+    valid = (codes >= 0) & (received != np.iinfo(np.int64).min) & (received <= as_of_day) & (quantity > 0)
+    lot_pos = np.flatnonzero(valid)
+    codes, received, quantity = codes[lot_pos], received[lot_pos], quantity[lot_pos]
+    expiry = received + shelf_life[codes]
+    order = np.lexsort((received, expiry, codes))
+    lot_pos, codes, received, quantity, expiry = lot_pos[order], codes[order], received[order], quantity[order], expiry[order]
+
+    # Per-product cumulative receipts C_k
+    cum_received = np.cumsum(quantity)
+    group_start = np.r_[True, codes[1:] != codes[:-1]] if len(codes) else np.zeros(0, dtype=bool)
+    start_of_group = np.maximum.accumulate(np.where(group_start, np.arange(len(codes)), 0))
+    received_before_group = (cum_received - quantity)[start_of_group]
+    C = cum_received - received_before_group
+
+    # Consumption events keyed by (product, day) for cumulative lookups Q(product, day)
+    if df_consumption is not None and not df_consumption.empty:
+        c_codes = product_index.get_indexer(df_consumption['ProductID'])
+        c_days = _days(df_consumption[date_col])
+        c_qty = pd.to_numeric(df_consumption[qty_col], errors='coerce').fillna(0).to_numpy(dtype=float)
+        keep = (c_codes >= 0) & (c_days != np.iinfo(np.int64).min) & (c_days <= as_of_day)
+        c_codes, c_days, c_qty = c_codes[keep], c_days[keep], c_qty[keep]
+    else:
+        c_codes, c_days, c_qty = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+
+    min_day = min(received.min(initial=as_of_day), c_days.min(initial=as_of_day))
+    span = max(expiry.max(initial=as_of_day), as_of_day) - min_day + 2
+    keys = c_codes * span + (c_days - min_day)
+    key_order = np.argsort(keys, kind='stable')
+    keys = keys[key_order]
+    cum_consumed = np.r_[0.0, np.cumsum(c_qty[key_order])]
+
+    def consumed_through(product_codes, days):
+        """Q(product, day): units consumed by each product up to and including each day."""
+        upto = np.searchsorted(keys, product_codes * span + (np.minimum(days, as_of_day) - min_day), side='right')
+        before = np.searchsorted(keys, product_codes * span, side='left')
+        return cum_consumed[upto] - cum_consumed[before]
+
+    # Waste: running maximum of C_k - Q(expiry_k) over each product's expired lots
+    is_expired = expiry < as_of_day
+    excess = np.where(is_expired, np.clip(C - consumed_through(codes, expiry), 0, None), 0.0)
+    W = segment_cummax(excess, codes, float(C.max(initial=0)) + 1)
+    W_prev = np.where(group_start, 0.0, np.r_[0.0, W[:-1]])
+    wasted = np.where(is_expired, W - W_prev, 0.0)
+
+    # Live lots: what FEFO has not yet consumed (expired waste counts as consumed supply)
+    position = consumed_through(codes, np.full(len(codes), as_of_day)) + W
+    remaining = np.where(is_expired, 0.0, np.clip(C - position, 0, quantity))
+
+    epoch = np.datetime64('1970-01-01', 'D')
+    names = df_products['ProductName'].to_numpy()[codes] if 'ProductName' in df_products.columns else product_index[codes]
+    lot_ids = df_purchases['PurchaseID'].to_numpy()[lot_pos] if 'PurchaseID' in df_purchases.columns else lot_pos
+    return pd.DataFrame({
+        'LotID': lot_ids,
+        'ProductID': product_index.to_numpy()[codes],
+        'ProductName': names,
+        'ReceivedDate': pd.to_datetime(epoch + received.astype('timedelta64[D]')),
+        'ExpiryDate': pd.to_datetime(epoch + expiry.astype('timedelta64[D]')),
+        'Quantity': quantity,
+        'Consumed': quantity - wasted - remaining,
+        'Wasted': wasted,
+        'Remaining': remaining,
+    })
+
+
+def consumption_frame(stored_data_json):
+    """
+    Outbound events used to drain lots: OUT movements when they reference catalog products,
+    otherwise sales. Returns (frame, date column, quantity column).
+    """
+    df_products = read_frame(stored_data_json, 'products')
+    df_inventory = read_frame(stored_data_json, 'inventory', ('MovementDate',))
+    if not df_inventory.empty and not df_products.empty:
+        outbound = df_inventory[df_inventory['MovementType'] == 'OUT']
+        if outbound['ProductID'].isin(df_products['ProductID']).any():
+            return outbound, 'MovementDate', 'Quantity'
+    return read_frame(stored_data_json, 'sales', ('SaleDate',)), 'SaleDate', 'Quantity'
+
+
+def get_lot_ledger(stored_data_json):
+    """Returns the lot ledger for the stored dataset, cached per dataset version and day."""
+    today = datetime.now().date()
+
+    def build():
+        df_consumption, date_col, qty_col = consumption_frame(stored_data_json)
+        return build_lot_ledger(read_frame(stored_data_json, 'products'),
+                                read_frame(stored_data_json, 'purchases', ('PurchaseDate',)),
+                                df_consumption, as_of=today, date_col=date_col, qty_col=qty_col)
+
+    return get_cached(get_version(stored_data_json), ('lot_ledger', today), build)
@@ -0,0 +1,162 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from datastore import get_cached, get_version, read_frame
+from demand import daily_demand_matrix
+from expiry_index import get_expiry_index
+from predicted_waste import ACTION_DISCOUNT, get_predicted_waste
+from scenario_planner import PRICE_ELASTICITY
+
+# --- Markdown Optimizer ---
+# For every item predicted to expire unsold, picks the discount that maximizes the revenue it is
+# expected to recover before expiry:
+#   units_sold(d) = min(stock, demand left before expiry * (1 - d) ** elasticity)
+#   revenue(d)    = units_sold(d) * price * (1 - d)
+# evaluated as one (items x discount levels) grid. Elasticities come from the sales lift seen
+# during past promotion windows, shrunk towards the planner's default when there are few windows.
+
+DISCOUNT_LEVELS = np.round(np.arange(0, 0.55, 0.05), 2) # 0%, 5%, ... 50%
+BASELINE_DAYS = 28 # Sales before a promotion starts, used as its no-discount baseline
+PRIOR_WINDOWS = 5 # Weight of PRICE_ELASTICITY, in promotion windows, when shrinking estimates
+MIN_ELASTICITY = -5.0
+MAX_ELASTICITY = 0.0 # Discounts never lower demand
+REVENUE_TOLERANCE = 0.01 # Take the smallest discount within 1% of the best revenue
+MIN_UPLIFT_SHARE = 0.02 # Don't mark down for less than a 2% gain over full price
+
+
+def _promotion_observations(df_sales, df_products, df_promotions):
+    """
+    One (category, ln(1 - discount), ln(lift)) observation per promotion window and category.
+    Store-wide promotions (no ProductID) are measured on category totals, targeted ones on the product.
+    """
+    needed = {'DiscountPercentage', 'PromotionStartDate', 'PromotionEndDate'}
+    if df_sales.empty or df_products.empty or df_promotions.empty or not needed.issubset(df_promotions.columns):
+        return pd.DataFrame(columns=['Category', 'x', 'y'])
+
+    start = pd.to_datetime(df_promotions['PromotionStartDate'], errors='coerce')
+    end = pd.to_datetime(df_promotions['PromotionEndDate'], errors='coerce')
+    discount = pd.to_numeric(df_promotions['DiscountPercentage'], errors='coerce') / 100
+    first_day = pd.to_datetime(df_sales['SaleDate'], errors='coerce').min().normalize()
+    last_day = pd.to_datetime(df_sales['SaleDate'], errors='coerce').max().normalize()
+    # Keep windows whose baseline and promotion both fall inside the sales history
+    valid = (start - pd.Timedelta(days=BASELINE_DAYS) >= first_day) & (end <= last_day) & (end >= start) & \
+        (discount > 0) & (discount < 1)
+    if not valid.any():
+        return pd.DataFrame(columns=['Category', 'x', 'y'])
+
+    num_days = (last_day - first_day).days + 1
+    product_ids = df_products['ProductID'].to_numpy()
+    categories = df_products['Category'].fillna('Unknown').to_numpy() if 'Category' in df_products.columns \
+        else np.full(len(product_ids), 'Unknown', dtype=object)
+    daily = daily_demand_matrix(df_sales, product_ids, last_day, num_days) # products x days
+    cum = np.concatenate([np.zeros((len(product_ids), 1)), np.cumsum(daily, axis=1)], axis=1)
+    category_codes, category_names = pd.factorize(categories)
+    category_cum = np.zeros((len(category_names), num_days + 1))
+    np.add.at(category_cum, category_codes, cum)
+
+    promo_product = df_promotions['ProductID'] if 'ProductID' in df_promotions.columns \
+        else pd.Series(np.nan, index=df_promotions.index)
+    product_row = pd.Index(product_ids).get_indexer(promo_product.fillna(''))
+    rows = []
+    for i in np.flatnonzero(valid.to_numpy()):
+        s = (start.iloc[i] - first_day).days
+        e = (end.iloc[i] - first_day).days + 1
+        if pd.isna(promo_product.iloc[i]): # Store-wide: every category
+            series, names = category_cum, category_names
+        elif product_row[i] >= 0:
+            series, names = cum[[product_row[i]]], [categories[product_row[i]]]
+        else:
+            continue # Targets a product that isn't in the catalog
+        promo_rate = (series[:, e] - series[:, s]) / (e - s)
+        base_rate = (series[:, s] - series[:, s - BASELINE_DAYS]) / BASELINE_DAYS
+        ok = (promo_rate > 0) & (base_rate > 0)
+        for name, lift in zip(np.asarray(names)[ok], (promo_rate / np.where(ok, base_rate, 1))[ok]):
+            rows.append({'Category': name, 'x': np.log(1 - discount.iloc[i]), 'y': np.log(lift)})
+    return pd.DataFrame(rows, columns=['Category', 'x', 'y'])
+
+
+def estimate_elasticity(df_sales, df_products, df_promotions, prior=PRICE_ELASTICITY, prior_windows=PRIOR_WINDOWS):
+    """
+    Price elasticity per product category from promotion windows: the log-log slope of lift against
+    price factor (fit through the origin), shrunk towards `prior` by prior_windows pseudo-observations.
+    Returns a Series indexed by Category; categories without observations get the prior.
+    """
+    categories = df_products['Category'].fillna('Unknown').unique() if 'Category' in df_products.columns else []
+    observations = _promotion_observations(df_sales, df_products, df_promotions)
+    if observations.empty:
+        return pd.Series(prior, index=pd.Index(categories, name='Category'), dtype=float)
+
+    observations['xy'] = observations['x'] * observations['y']
+    observations['xx'] = observations['x'] ** 2
+    sums = observations.groupby('Category')[['xy', 'xx']].sum().reindex(categories).fillna(0)
+    # Shrinkage: prior_windows pseudo-observations at a typical discount, all lying on the prior slope
+    typical_xx = observations['xx'].mean() * prior_windows
+    elasticity = (sums['xy'] + prior * typical_xx) / (sums['xx'] + typical_xx)
+    return elasticity.clip(MIN_ELASTICITY, MAX_ELASTICITY).rename_axis('Category')
+
+
+def optimize_markdowns(available_demand, stock, price, elasticity, discount_levels=DISCOUNT_LEVELS):
+    """
+    Grid search over discount levels for every item at once.
+    All inputs are aligned 1-D arrays (demand left before expiry, units in stock, full price, elasticity).
+    Returns a DataFrame with BestDiscount, ExpectedUnitsSold, ExpectedRevenue, FullPriceRevenue and RevenueUplift.
+    """
+    available_demand = np.asarray(available_demand, dtype=float)[:, None]
+    stock = np.asarray(stock, dtype=float)[:, None]
+    price = np.asarray(price, dtype=float)[:, None]
+    elasticity = np.asarray(elasticity, dtype=float)[:, None]
+    levels = np.asarray(discount_levels, dtype=float)[None, :]
+
+    units = np.minimum(stock, available_demand * (1 - levels) ** elasticity) # items x levels
+    revenue = units * price * (1 - levels)
+    # Smallest discount that gets (almost) the best revenue, and only if it beats full price by enough
+    near_best = revenue >= revenue.max(axis=1, keepdims=True, initial=0) * (1 - REVENUE_TOLERANCE)
+    best = np.argmax(near_best, axis=1)
+    rows = np.arange(len(best))
+    best[revenue[rows, best] < revenue[:, 0] * (1 + MIN_UPLIFT_SHARE)] = 0
+    return pd.DataFrame({
+        'BestDiscount': levels[0, best],
+        'ExpectedUnitsSold': units[rows, best],
+        'ExpectedRevenue': revenue[rows, best],
+        'FullPriceRevenue': revenue[:, 0],
+        'RevenueUplift': revenue[rows, best] - revenue[:, 0],
+    })
+
+
+def get_markdown_plan(stored_data_json):
+    """
+    Markdown recommendation for every expiry stock row predicted to expire unsold, indexed by StockID.
+    Cached per dataset version and day.
+    """
+    today = datetime.now().date()
+
+    def build():
+        df_products = read_frame(stored_data_json, 'products')
+        df_stock, _ = get_expiry_index(stored_data_json)
+        predicted = get_predicted_waste(stored_data_json)
+        columns = ['ProductID', 'Elasticity', 'BestDiscount', 'ExpectedUnitsSold', 'ExpectedRevenue',
+                   'FullPriceRevenue', 'RevenueUplift']
+        if df_stock.empty or predicted.empty:
+            return pd.DataFrame(columns=columns)
+
+        at_risk = (predicted['Action'] == ACTION_DISCOUNT).to_numpy()
+        candidates = df_stock[at_risk]
+        product_info = df_products.set_index('ProductID')
+        price = pd.to_numeric(product_info['Price'], errors='coerce').reindex(candidates['ProductID']).fillna(0).to_numpy() \
+            if 'Price' in product_info.columns else np.zeros(len(candidates))
+        elasticity_by_category = estimate_elasticity(read_frame(stored_data_json, 'sales', ('SaleDate',)), df_products,
+                                                     read_frame(stored_data_json, 'promotions'))
+        category = product_info['Category'].reindex(candidates['ProductID']).fillna('Unknown') \
+            if 'Category' in product_info.columns else pd.Series('Unknown', index=candidates.index)
+        elasticity = elasticity_by_category.reindex(category).fillna(PRICE_ELASTICITY).to_numpy()
+
+        plan = optimize_markdowns(predicted['AvailableDemand'].to_numpy()[at_risk],
+                                  candidates['quantity'].to_numpy(), price, elasticity)
+        plan.insert(0, 'Elasticity', elasticity)
+        plan.insert(0, 'ProductID', candidates['ProductID'].to_numpy())
+        plan.index = pd.Index(candidates['StockID'].to_numpy(), name='StockID')
+        return plan[columns]
+
+    return get_cached(get_version(stored_data_json), ('markdown_plan', today), build)
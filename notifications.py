@@ -0,0 +1,322 @@
+import heapq
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from datastore import get_version, read_frame
+from demand import LONG_PERIOD_DAYS, daily_demand_matrix
+from expiry_index import expiring_within, get_expiry_index
+from waste_rollup import get_waste_rollup, monthly_waste
+
+# --- Notification Engine ---
+# Declarative rules (NOTIFICATION_RULES) turn the stored tables into alerts keyed by (type, subject),
+# so re-firing a rule updates its alert instead of duplicating it. Each alert has a TTL and a rank.
+# Every live alert stays in the deduplicated entries map, so an alert that drops out of the top comes
+# back once higher-ranked ones resolve. The sorted 'top' view holds the MAX_NOTIFICATIONS highest-ranked
+# alerts plus each type's best MAX_PER_TYPE, so the dashboard reads its top N from the head of the
+# list without re-ranking anything and no type is crowded out of it.
+# Product rules are re-evaluated only for products touched since the previous dataset version:
+# catalog rows that changed, and products in newly appended sales, movements or purchases. A new
+# day, or a table that was rewritten rather than appended to, triggers one full evaluation.
+# Daily rules (expiring lots, waste spikes) read small indexed structures and always run in full.
+
+MAX_NOTIFICATIONS = 50 # Bound on the sorted top view; lower-ranked alerts wait in the entries map
+DASHBOARD_NOTIFICATIONS = 6
+MAX_PER_TYPE = 2 # Per-type cap when reading the top N, so one busy rule does not fill the panel
+EXPIRING_WITHIN_DAYS = 7
+URGENT_EXPIRY_DAYS = 2
+LATE_DELIVERY_TOLERANCE = 1.0 # Overdue once a product waits its lead time + this many usual reorder intervals
+WASTE_SPIKE_FACTOR = 1.5 # Month-to-date waste above 1.5x the average of the previous months
+WASTE_SPIKE_BASELINE_MONTHS = 3
+MIN_WASTE_SPIKE_KG = 1.0
+
+# Priorities: higher is more urgent
+PRIORITY_OUT_OF_STOCK = 5
+PRIORITY_URGENT = 4
+PRIORITY_WARNING = 3
+PRIORITY_INFO = 2
+
+_engine_lock = threading.Lock()
+_engine = {} # Evaluation state carried across dataset versions (see refresh_notifications)
+
+
+# --- Rules ---
+# A rule takes the evaluation context and the product positions to check, and returns
+# (checked subjects, alerts). Existing alerts of that type for checked subjects that do not fire again are resolved.
+
+def _alert(rule_type, subject, priority, urgency, text, time_text):
+    return {'type': rule_type, 'subject': subject, 'rank': (priority, urgency), 'text': text, 'time': time_text}
+
+
+def low_stock_rule(context, positions):
+    """Stock at or below the product's reorder point; out of stock ranks highest."""
+    products = context['products']
+    quantity = context['quantity'][positions]
+    reorder_point = context['reorder_point'][positions]
+    alerts = []
+    for pos, qty in zip(positions[quantity <= reorder_point], quantity[quantity <= reorder_point]):
+        name = products['ProductName'].iat[pos]
+        if qty <= 0:
+            alerts.append(_alert('low_stock', context['product_ids'][pos], PRIORITY_OUT_OF_STOCK, 0,
+                                 f"Item {name} is out of stock!", "0 units left"))
+        else:
+            alerts.append(_alert('low_stock', context['product_ids'][pos], PRIORITY_WARNING, -qty,
+                                 f"Item {name} is low in stock: {qty:,.0f} units left!", f"{qty:,.0f} units left"))
+    return context['product_ids'][positions], alerts
+
+
+def stockout_risk_rule(context, positions):
+    """Stock above the reorder point that will not cover demand for the supplier lead time."""
+    quantity = context['quantity'][positions]
+    lead_time = context['lead_time'][positions]
+    rate = daily_demand_matrix(context['sales'], context['product_ids'][positions], context['today'],
+                               LONG_PERIOD_DAYS).mean(axis=1) if len(positions) else np.zeros(0)
+    days_cover = np.divide(quantity, rate, out=np.full(len(positions), np.inf), where=rate > 0)
+    at_risk = (quantity > context['reorder_point'][positions]) & (days_cover < lead_time)
+    alerts = [
+        _alert('stockout_risk', context['product_ids'][pos], PRIORITY_URGENT, -cover,
+               f"{context['products']['ProductName'].iat[pos]} may run out in {cover:.0f} days "
+               f"(lead time {lead:.0f} days).", f"{cover:.0f} days cover")
+        for pos, cover, lead in zip(positions[at_risk], days_cover[at_risk], lead_time[at_risk])
+    ]
+    return context['product_ids'][positions], alerts
+
+
+def late_supplier_rule(context, positions):
+    """
+    Suppliers with products at or below their reorder point that have waited longer than lead time plus
+    their usual reorder interval since the last purchase. purchase_history.csv has no receipt dates, so an
+    overdue reorder stands in for a late delivery. Suppliers of the touched products are re-checked in full.
+    """
+    supplier_ids = context['supplier_ids']
+    suppliers = pd.unique(supplier_ids[positions])
+    members = np.flatnonzero(np.isin(supplier_ids, suppliers))
+    waiting = context['today_day'] - context['last_purchase_day'][members]
+    allowed = context['lead_time'][members] + LATE_DELIVERY_TOLERANCE * context['reorder_interval'][members]
+    late = (context['quantity'][members] <= context['reorder_point'][members]) & (waiting > allowed)
+
+    days_late = pd.Series((waiting - allowed)[late]).groupby(supplier_ids[members][late])
+    alerts = [
+        _alert('late_supplier', supplier, PRIORITY_WARNING, days.max(),
+               f"{context['supplier_names'].get(supplier, supplier)}: replenishment overdue for "
+               f"{len(days)} product(s).", f"{days.max():,.0f} days late")
+        for supplier, days in days_late
+    ]
+    return suppliers, alerts
+
+
+def expiring_rule(context, positions):
+    """Lots expiring within EXPIRING_WITHIN_DAYS, soonest first (see expiry_index.expiring_within)."""
+    df_stock, index = context['expiry']
+    today = context['today']
+    rows = df_stock.iloc[expiring_within(index, today, EXPIRING_WITHIN_DAYS)]
+    alerts = []
+    for stock_id, name, expiry in zip(rows['StockID'], rows['ProductName'], rows['ExpiryDate']):
+        days_left = (expiry - today).days
+        priority = PRIORITY_URGENT if days_left <= URGENT_EXPIRY_DAYS else PRIORITY_WARNING
+        alerts.append(_alert('expiring', stock_id, priority, -days_left,
+                             f"Item {name} expiring in {days_left} days!", f"{days_left} days left"))
+    return None, alerts # None: every subject of this type is checked
+
+
+def waste_spike_rule(context, positions):
+    """Categories whose month-to-date waste is well above their recent monthly average."""
+    rollup = context['waste_rollup']
+    if rollup.empty:
+        return None, []
+    month = context['today'].to_period('M')
+    alerts = []
+    for category, cells in rollup.groupby(level='Category'):
+        monthly = monthly_waste(cells, month, WASTE_SPIKE_BASELINE_MONTHS + 1)
+        current, baseline = monthly.iloc[-1], monthly.iloc[:-1].mean()
+        if current >= MIN_WASTE_SPIKE_KG and current > WASTE_SPIKE_FACTOR * baseline:
+            alerts.append(_alert('waste', category, PRIORITY_INFO, current,
+                                 f"Waste spike in {category}: {current:,.0f} kg this month vs "
+                                 f"{baseline:,.0f} kg monthly average.", "This month"))
+    return None, alerts
+
+
+NOTIFICATION_RULES = [
+    {'type': 'low_stock', 'scope': 'product', 'ttl': timedelta(hours=24), 'evaluate': low_stock_rule},
+    {'type': 'stockout_risk', 'scope': 'product', 'ttl': timedelta(hours=24), 'evaluate': stockout_risk_rule},
+    {'type': 'late_supplier', 'scope': 'product', 'ttl': timedelta(hours=24), 'evaluate': late_supplier_rule},
+    {'type': 'expiring', 'scope': 'daily', 'ttl': timedelta(hours=24), 'evaluate': expiring_rule},
+    {'type': 'waste', 'scope': 'daily', 'ttl': timedelta(days=3), 'evaluate': waste_spike_rule},
+]
+
+
+# --- Evaluation ---
+
+def _column(df, col, default=0.0):
+    if col not in df.columns:
+        return np.full(len(df), default)
+    return pd.to_numeric(df[col], errors='coerce').fillna(default).to_numpy(dtype=float)
+
+
+def _purchase_history(df_purchases, product_index):
+    """Per product: day number of the last purchase and the mean gap between purchases (0 if unknown)."""
+    n_products = len(product_index)
+    last_day = np.full(n_products, np.iinfo(np.int64).max) # "never purchased" is never late
+    interval = np.zeros(n_products)
+    if df_purchases.empty or 'PurchaseDate' not in df_purchases.columns:
+        return last_day, interval
+    codes = product_index.get_indexer(df_purchases['ProductID'])
+    days = df_purchases['PurchaseDate'].to_numpy(dtype='datetime64[D]').astype(np.int64)
+    valid = (codes >= 0) & ~pd.isna(df_purchases['PurchaseDate']).to_numpy()
+    codes, days = codes[valid], days[valid]
+    if len(codes) == 0:
+        return last_day, interval
+    first = np.full(n_products, np.iinfo(np.int64).max)
+    np.minimum.at(first, codes, days)
+    last = np.full(n_products, np.iinfo(np.int64).min)
+    np.maximum.at(last, codes, days)
+    count = np.bincount(codes, minlength=n_products)
+    purchased = count > 0
+    last_day[purchased] = last[purchased]
+    interval[count > 1] = (last - first)[count > 1] / (count[count > 1] - 1)
+    return last_day, interval
+
+
+def _context(stored_data_json, today):
+    df_products = read_frame(stored_data_json, 'products')
+    product_ids = df_products['ProductID'].to_numpy() if not df_products.empty else np.array([], dtype=object)
+    supplier_col = 'Supplier' if 'Supplier' in df_products.columns else 'SupplierName'
+    supplier_ids = df_products['SupplierID'].to_numpy() if 'SupplierID' in df_products.columns \
+        else np.full(len(df_products), 'Unknown', dtype=object)
+    supplier_names = dict(zip(supplier_ids, df_products[supplier_col])) if supplier_col in df_products.columns else {}
+    last_purchase_day, reorder_interval = _purchase_history(
+        read_frame(stored_data_json, 'purchases', ('PurchaseDate',)), pd.Index(product_ids))
+    return {
+        'today': today,
+        'today_day': int((np.datetime64(today.date(), 'D') - np.datetime64('1970-01-01', 'D')).astype(np.int64)),
+        'products': df_products,
+        'product_ids': product_ids,
+        'quantity': _column(df_products, 'quantity'),
+        'reorder_point': _column(df_products, 'ReorderPoint'),
+        'lead_time': _column(df_products, 'LeadTimeDays'),
+        'supplier_ids': supplier_ids,
+        'supplier_names': supplier_names,
+        'last_purchase_day': last_purchase_day,
+        'reorder_interval': reorder_interval,
+        'sales': read_frame(stored_data_json, 'sales', ('SaleDate',)),
+        'expiry': get_expiry_index(stored_data_json),
+        'waste_rollup': get_waste_rollup(stored_data_json),
+    }
+
+
+def _row_ids(stored_data_json):
+    """Row identifiers of the append-only tables, used to find rows added since the previous version."""
+    ids = {}
+    for table, id_col, date_cols in (('sales', 'SaleID', ('SaleDate',)), ('inventory', 'MovementID', ('MovementDate',)),
+                                     ('purchases', 'PurchaseID', ('PurchaseDate',))):
+        df = read_frame(stored_data_json, table, date_cols)
+        ids[table] = df[id_col].to_numpy() if id_col in df.columns else None
+    return ids
+
+
+def _touched_products(state, stored_data_json, product_hash, row_ids):
+    """
+    Positions of products whose rules need re-evaluating since the state's last version,
+    or None when the change cannot be expressed as appended rows / changed catalog rows.
+    """
+    previous_hash = state['product_hash']
+    common = previous_hash.index.intersection(product_hash.index)
+    touched_ids = set(product_hash.index.difference(previous_hash.index))
+    touched_ids.update(common[previous_hash.reindex(common).to_numpy() != product_hash.reindex(common).to_numpy()])
+
+    for table, date_cols in (('sales', ('SaleDate',)), ('inventory', ('MovementDate',)), ('purchases', ('PurchaseDate',))):
+        old, new = state['row_ids'][table], row_ids[table]
+        if old is None or new is None or len(old) > len(new) or not np.array_equal(new[:len(old)], old):
+            return None
+        if len(new) > len(old):
+            df = read_frame(stored_data_json, table, date_cols)
+            touched_ids.update(df['ProductID'].iloc[len(old):].tolist())
+
+    return np.flatnonzero(product_hash.index.isin(list(touched_ids)))
+
+
+def _apply(entries, rule, checked, alerts, now):
+    """Upserts fired alerts (deduplicated by type and subject) and resolves checked subjects that did not fire."""
+    fired = {(alert['type'], alert['subject']) for alert in alerts}
+    checked = None if checked is None else set(np.asarray(checked).tolist())
+    for key in [key for key in entries if key[0] == rule['type'] and key not in fired]:
+        if checked is None or key[1] in checked:
+            del entries[key]
+    for alert in alerts:
+        key = (alert['type'], alert['subject'])
+        created = entries[key]['created'] if key in entries else now
+        entries[key] = dict(alert, created=created, expires=now + rule['ttl'])
+
+
+def _top_view(entries):
+    """The MAX_NOTIFICATIONS highest-ranked alerts plus each type's best MAX_PER_TYPE, most urgent first."""
+    rank = lambda alert: alert['rank']
+    by_type = {}
+    for alert in entries.values():
+        by_type.setdefault(alert['type'], []).append(alert)
+    top = {(alert['type'], alert['subject']): alert for alert in heapq.nlargest(MAX_NOTIFICATIONS, entries.values(), key=rank)}
+    for alerts in by_type.values():
+        top.update({(alert['type'], alert['subject']): alert for alert in heapq.nlargest(MAX_PER_TYPE, alerts, key=rank)})
+    return sorted(top.values(), key=rank, reverse=True)
+
+
+def refresh_notifications(stored_data_json):
+    """
+    Brings the notification queue up to date with the stored dataset and returns the engine state.
+    Cheap when nothing changed: the version and day are compared before anything is evaluated.
+    """
+    now = datetime.now()
+    today = pd.Timestamp(now.date())
+    version = get_version(stored_data_json)
+
+    with _engine_lock:
+        if version is not None and _engine.get('version') == version and _engine.get('day') == today:
+            return _engine
+
+        df_products = read_frame(stored_data_json, 'products')
+        product_hash = pd.Series(pd.util.hash_pandas_object(df_products, index=False).to_numpy(),
+                                 index=df_products['ProductID'].to_numpy()) if not df_products.empty else pd.Series(dtype='uint64')
+        row_ids = _row_ids(stored_data_json)
+        context = _context(stored_data_json, today)
+
+        touched = None
+        if _engine.get('day') == today and version is not None:
+            touched = _touched_products(_engine, stored_data_json, product_hash, row_ids)
+        entries = _engine.get('entries', {}) if touched is not None else {}
+        if touched is None:
+            touched = np.arange(len(df_products))
+        else: # Products removed from the catalog take their alerts with them
+            removed = set(_engine['product_hash'].index.difference(product_hash.index).tolist())
+            for key in [key for key in entries if key[1] in removed]:
+                del entries[key]
+
+        for rule in NOTIFICATION_RULES:
+            checked, alerts = rule['evaluate'](context, touched if rule['scope'] == 'product' else None)
+            _apply(entries, rule, checked, alerts, now)
+
+        _engine.update({
+            'version': version, 'day': today, 'product_hash': product_hash, 'row_ids': row_ids,
+            'entries': entries, 'top': _top_view(entries),
+            'evaluated': len(touched),
+        })
+        return _engine
+
+
+def get_notifications(stored_data_json, top_n=DASHBOARD_NOTIFICATIONS, max_per_type=MAX_PER_TYPE):
+    """
+    Returns the top_n live notifications (dicts with 'type', 'text', 'time'), most urgent first,
+    with at most max_per_type of each type (None for no cap).
+    """
+    state = refresh_notifications(stored_data_json)
+    now = datetime.now()
+    notifications, per_type = [], {}
+    for alert in state['top']:
+        if alert['expires'] <= now or (max_per_type is not None and per_type.get(alert['type'], 0) >= max_per_type):
+            continue
+        per_type[alert['type']] = per_type.get(alert['type'], 0) + 1
+        notifications.append(alert)
+        if len(notifications) == top_n:
+            break
+    return notifications
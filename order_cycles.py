@@ -0,0 +1,182 @@
+import heapq
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from datastore import get_cached, get_version, read_frame
+from safety_stock import get_safety_stock
+
+# --- EOQ & Joint Replenishment Cycles ---
+# Economic order quantity per SKU:  EOQ = sqrt(2 * D * s / h)
+# SKUs that share a supplier are ordered together on a common base cycle T (the classic
+# joint replenishment problem). Each SKU is ordered every k * T days, k being a power of two,
+# so one supplier order (fixed cost S) covers every SKU that is due. Supplier order days are
+# staggered (schedule_supplier_offsets) and expanded into a calendar with a heap (order_calendar);
+# each SKU carries its supplier's next joint order date and how many SKUs that order covers.
+
+ANNUAL_HOLDING_RATE = 0.25 # Yearly holding cost as a share of unit Cost
+ITEM_ORDER_COST = 150.0 # ₹ per SKU line added to an order
+SUPPLIER_ORDER_COST = 1000.0 # ₹ per supplier order (transport, receiving, paperwork)
+MAX_CYCLE_MULTIPLIER = 64 # Slowest SKUs are ordered at most every 64 base cycles
+MAX_CYCLE_DAYS = 365
+JRP_ITERATIONS = 3 # Multiplier / base-cycle refinement passes (converges in 2-3)
+DAYS_PER_YEAR = 365
+
+
+def _round_to_power_of_two(ratio):
+    """Rounds positive ratios to the nearest power of two (in log space), never below 1."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        exponent = np.rint(np.log2(np.where(ratio > 0, ratio, 1)))
+    return np.clip(2.0 ** exponent, 1, MAX_CYCLE_MULTIPLIER)
+
+
+def calculate_order_cycles(df_products, daily_demand, as_of=None,
+                           holding_rate=ANNUAL_HOLDING_RATE, item_order_cost=ITEM_ORDER_COST,
+                           supplier_order_cost=SUPPLIER_ORDER_COST):
+    """
+    Computes EOQ and a joint review cycle for every SKU in one vectorized pass.
+    daily_demand is aligned with df_products rows (units per day).
+    Returns a DataFrame indexed by ProductID; SKUs without demand or cost get NaN cycles.
+    """
+    columns = ['SupplierID', 'AnnualDemand', 'EOQ', 'CycleDays', 'SupplierCycleDays', 'CycleMultiplier',
+               'ReviewCycleDays', 'OrderQty', 'NextOrderDate', 'NextJointOrderDate', 'JointOrderItems', 'CycleLabel']
+    if df_products.empty or 'ProductID' not in df_products.columns:
+        return pd.DataFrame(columns=columns)
+
+    as_of = pd.Timestamp(as_of if as_of is not None else datetime.now().date())
+    n_items = len(df_products)
+    supplier_col = 'SupplierID' if 'SupplierID' in df_products.columns else 'Supplier'
+    supplier_ids = df_products[supplier_col].fillna('Unknown').to_numpy() if supplier_col in df_products.columns \
+        else np.full(n_items, 'Unknown', dtype=object)
+    supplier_codes, supplier_index = pd.factorize(supplier_ids)
+    n_suppliers = len(supplier_index)
+
+    annual_demand = np.asarray(daily_demand, dtype=float) * DAYS_PER_YEAR
+    unit_cost = pd.to_numeric(df_products.get('Cost'), errors='coerce').fillna(0).to_numpy(dtype=float) \
+        if 'Cost' in df_products.columns else np.zeros(n_items)
+    holding_cost = holding_rate * unit_cost
+    active = (annual_demand > 0) & (holding_cost > 0)
+
+    # Individual EOQ and cycle (years) for active SKUs
+    with np.errstate(divide='ignore', invalid='ignore'):
+        eoq = np.where(active, np.sqrt(2 * annual_demand * item_order_cost / holding_cost), np.nan)
+        item_cycle = np.where(active, eoq / annual_demand, np.nan)
+
+    # Joint replenishment: alternate between base cycle per supplier and power-of-two multipliers
+    dh = np.where(active, annual_demand * holding_cost, 0.0)
+    multiplier = np.ones(n_items)
+    base_cycle = np.full(n_suppliers, np.nan)
+    for _ in range(JRP_ITERATIONS):
+        order_cost = supplier_order_cost + np.bincount(supplier_codes, weights=np.where(active, item_order_cost / multiplier, 0), minlength=n_suppliers)
+        holding = np.bincount(supplier_codes, weights=multiplier * dh, minlength=n_suppliers)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            base_cycle = np.where(holding > 0, np.sqrt(2 * order_cost / holding), np.nan)
+            multiplier = np.where(active, _round_to_power_of_two(item_cycle / base_cycle[supplier_codes]), 1.0)
+
+    base_cycle_days = np.clip(np.rint(base_cycle * DAYS_PER_YEAR), 1, MAX_CYCLE_DAYS)
+    item_base_days = base_cycle_days[supplier_codes]
+    review_days = np.where(active, np.clip(item_base_days * multiplier, 1, MAX_CYCLE_DAYS), np.nan)
+
+    # Stagger supplier order days so they don't all land on the same day
+    offsets = schedule_supplier_offsets(base_cycle_days)
+    next_order = as_of + pd.to_timedelta(np.where(active, offsets[supplier_codes], np.nan), unit='D')
+
+    result = pd.DataFrame({
+        'SupplierID': supplier_ids,
+        'AnnualDemand': annual_demand,
+        'EOQ': eoq,
+        'CycleDays': item_cycle * DAYS_PER_YEAR,
+        'SupplierCycleDays': np.where(active, item_base_days, np.nan),
+        'CycleMultiplier': np.where(active, multiplier, np.nan),
+        'ReviewCycleDays': review_days,
+        'OrderQty': annual_demand / DAYS_PER_YEAR * review_days,
+        'NextOrderDate': next_order,
+    }, index=pd.Index(df_products['ProductID'].to_numpy(), name='ProductID'))
+
+    # Next joint order per supplier: the first entry of its order calendar (every supplier orders within one cycle)
+    next_joint = order_calendar(result, horizon_days=MAX_CYCLE_DAYS, as_of=as_of).drop_duplicates('SupplierID') \
+        .set_index('SupplierID')
+    has_cycle = result['ReviewCycleDays'].notna().to_numpy()
+    result['NextJointOrderDate'] = result['SupplierID'].map(next_joint['OrderDate']).where(has_cycle)
+    result['JointOrderItems'] = result['SupplierID'].map(next_joint['ItemsDue']).where(has_cycle)
+
+    labels = pd.Series('N/A', index=result.index)
+    if has_cycle.any():
+        cycle_text = result.loc[has_cycle, 'ReviewCycleDays'].astype(int).astype(str)
+        next_text = result.loc[has_cycle, 'NextJointOrderDate'].dt.strftime('%d %b')
+        items_text = result.loc[has_cycle, 'JointOrderItems'].astype(int).astype(str)
+        labels[has_cycle] = 'Every ' + cycle_text + ' days (next ' + next_text + ', joint order of ' + items_text + ' SKUs)'
+    result['CycleLabel'] = labels
+    return result
+
+
+def schedule_supplier_offsets(cycle_days, horizon_days=MAX_CYCLE_DAYS):
+    """
+    Picks a first-order day (0 <= offset < cycle) for every supplier so the number of
+    supplier orders per day stays as even as possible over the horizon.
+    Suppliers with the shortest cycles (most orders) are placed first.
+    """
+    cycle_days = np.asarray(cycle_days, dtype=float)
+    offsets = np.zeros(len(cycle_days))
+    daily_load = np.zeros(int(horizon_days))
+
+    for supplier in np.argsort(cycle_days, kind='stable'):
+        if not np.isfinite(cycle_days[supplier]):
+            continue
+        cycle = int(cycle_days[supplier])
+        # Load seen by each candidate offset = orders already placed on its recurring days
+        padded = np.zeros(-(-len(daily_load) // cycle) * cycle)
+        padded[:len(daily_load)] = daily_load
+        candidate_load = padded.reshape(-1, cycle).sum(axis=0)
+        offset = int(np.argmin(candidate_load))
+        daily_load[offset::cycle] += 1
+        offsets[supplier] = offset
+    return offsets
+
+
+def order_calendar(cycles_df, horizon_days=30, as_of=None):
+    """
+    Expands the joint cycles into an order calendar for the next horizon_days.
+    Uses a heap of (next order day, supplier) so each supplier order is produced in date order.
+    Returns a DataFrame with OrderDate, SupplierID and the number of SKUs due on that order.
+    """
+    if cycles_df.empty:
+        return pd.DataFrame(columns=['OrderDate', 'SupplierID', 'ItemsDue'])
+
+    as_of = pd.Timestamp(as_of if as_of is not None else datetime.now().date())
+    active = cycles_df.dropna(subset=['ReviewCycleDays'])
+    if active.empty:
+        return pd.DataFrame(columns=['OrderDate', 'SupplierID', 'ItemsDue'])
+
+    suppliers = active.groupby('SupplierID').agg(
+        BaseDays=('SupplierCycleDays', 'first'),
+        FirstOrder=('NextOrderDate', 'min'),
+    )
+    multipliers = {supplier: group['CycleMultiplier'].to_numpy() for supplier, group in active.groupby('SupplierID')}
+
+    heap = [((row.FirstOrder - as_of).days, supplier, 0) for supplier, row in suppliers.iterrows()]
+    heapq.heapify(heap)
+    calendar = []
+    while heap:
+        day, supplier, cycle_number = heapq.heappop(heap)
+        if day >= horizon_days:
+            continue
+        # A SKU with multiplier k is due on every k-th supplier cycle
+        items_due = int(np.count_nonzero(cycle_number % multipliers[supplier] == 0))
+        calendar.append({'OrderDate': as_of + pd.Timedelta(days=day), 'SupplierID': supplier, 'ItemsDue': items_due})
+        heapq.heappush(heap, (day + int(suppliers.at[supplier, 'BaseDays']), supplier, cycle_number + 1))
+    return pd.DataFrame(calendar, columns=['OrderDate', 'SupplierID', 'ItemsDue'])
+
+
+def get_order_cycles(stored_data_json):
+    """Returns the EOQ / joint cycle table for the stored dataset, cached per dataset version and day."""
+    today = datetime.now().date()
+
+    def build():
+        df_products = read_frame(stored_data_json, 'products')
+        demand = get_safety_stock(stored_data_json)['AvgDailyDemand']
+        daily_demand = demand.reindex(df_products['ProductID']).fillna(0).to_numpy() if not df_products.empty else []
+        return calculate_order_cycles(df_products, daily_demand, as_of=today)
+
+    return get_cached(get_version(stored_data_json), ('order_cycles', today), build)
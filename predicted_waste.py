@@ -0,0 +1,92 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from datastore import get_cached, get_version
+from demand import VERY_LONG_PERIOD_DAYS, daily_demand_matrix
+from expiry_index import get_expiry_index
+from lots import consumption_frame, segment_cummax
+
+# --- Predicted Waste ---
+# Projects each product's recent demand rate forward against the remaining shelf life of its stock.
+# A product's lots sell first-expired-first-out, so with R_k = units in its lots 1..k (expiry order)
+# and D_k = rate * sellable days left for lot k, the units that will still be unsold when lot k expires are
+#   W_k = max(W_k-1, R_k - D_k),   predicted waste of lot k = W_k - W_k-1
+# (the same running-maximum form as the lot ledger), computed for the whole catalog at once.
+
+ACTION_DISPOSE = 'Dispose'
+ACTION_DISCOUNT = 'Discount'
+ACTION_HOLD = 'Hold'
+
+
+def predict_waste(df_stock, daily_rate, today=None):
+    """
+    Estimates unsold units at expiry for every stock row (lot or product).
+    df_stock needs ProductID, quantity and ExpiryDate; daily_rate is a Series of units/day indexed by ProductID.
+    Returns a DataFrame aligned with df_stock: DaysLeft, DailyDemand, AvailableDemand, PredictedSold,
+    PredictedWaste, WasteShare, Action.
+    """
+    columns = ['DaysLeft', 'DailyDemand', 'AvailableDemand', 'PredictedSold', 'PredictedWaste', 'WasteShare', 'Action']
+    if df_stock.empty:
+        return pd.DataFrame(columns=columns)
+
+    today = pd.Timestamp(today if today is not None else datetime.now().date())
+    quantity = pd.to_numeric(df_stock['quantity'], errors='coerce').fillna(0).to_numpy(dtype=float)
+    expiry = pd.to_datetime(df_stock['ExpiryDate'], errors='coerce')
+    days_left = (expiry - today).dt.days.to_numpy(dtype=float) # NaN when the expiry is unknown
+    rate = pd.Series(daily_rate).reindex(df_stock['ProductID']).fillna(0).to_numpy(dtype=float)
+
+    expired = days_left < 0
+    live = np.flatnonzero(~np.isnan(days_left) & ~expired)
+    codes, _ = pd.factorize(df_stock['ProductID'].to_numpy()[live])
+    order = np.lexsort((days_left[live], codes))
+    live, codes = live[order], codes[order]
+
+    # Cumulative stock per product (expiry order) vs cumulative demand up to each lot's expiry
+    group_start = np.r_[True, codes[1:] != codes[:-1]] if len(codes) else np.zeros(0, dtype=bool)
+    cum_stock = np.cumsum(quantity[live])
+    start_of_group = np.maximum.accumulate(np.where(group_start, np.arange(len(codes)), 0))
+    R = cum_stock - (cum_stock - quantity[live])[start_of_group]
+    D = rate[live] * (days_left[live] + 1) # The expiry day itself is still sellable
+    W = segment_cummax(np.clip(R - D, 0, None), codes, float(R.max(initial=0)) + 1)
+    W_prev = np.where(group_start, 0.0, np.r_[0.0, W[:-1]])
+
+    predicted_waste = np.where(expired, quantity, 0.0)
+    predicted_waste[live] = W - W_prev
+    predicted_waste = np.rint(predicted_waste)
+
+    # Demand left for each lot up to its expiry once earlier-expiring lots have sold what they will
+    available_demand = np.zeros(len(df_stock))
+    available_demand[live] = np.clip(D - (R - quantity[live] - W_prev), 0, None)
+
+    action = np.full(len(df_stock), ACTION_HOLD, dtype=object)
+    action[predicted_waste > 0] = ACTION_DISCOUNT
+    action[expired] = ACTION_DISPOSE
+    return pd.DataFrame({
+        'DaysLeft': days_left,
+        'DailyDemand': rate,
+        'AvailableDemand': available_demand,
+        'PredictedSold': quantity - predicted_waste,
+        'PredictedWaste': predicted_waste,
+        'WasteShare': np.divide(predicted_waste, quantity, out=np.zeros(len(quantity)), where=quantity > 0),
+        'Action': action,
+    }, index=df_stock.index)
+
+
+def get_predicted_waste(stored_data_json, history_days=VERY_LONG_PERIOD_DAYS):
+    """
+    Returns predict_waste() for the expiry stock frame (see expiry_index.get_expiry_index),
+    using the last history_days of consumption as the demand rate. Cached per dataset version and day.
+    """
+    today = pd.Timestamp(datetime.now().date())
+
+    def build():
+        df_stock, _ = get_expiry_index(stored_data_json)
+        product_ids = df_stock['ProductID'].unique() if not df_stock.empty else np.array([])
+        df_consumption, date_col, qty_col = consumption_frame(stored_data_json)
+        daily = daily_demand_matrix(df_consumption, product_ids, today, history_days, date_col=date_col, qty_col=qty_col)
+        daily_rate = pd.Series(daily.mean(axis=1) if daily.size else np.zeros(len(product_ids)), index=product_ids)
+        return predict_waste(df_stock, daily_rate, today)
+
+    return get_cached(get_version(stored_data_json), ('predicted_waste', today, history_days), build)
@@ -0,0 +1,286 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from datastore import get_cached, get_version, read_frame
+from sales_facts import get_sales_facts
+
+# --- Promotion Interval Index ---
+# Promotions are date ranges, either for one ProductID or store-wide (no ProductID). Each product
+# with its own promotions, plus one store-wide group, gets its promotion calendar cut into disjoint
+# day segments with the winning promotion of each segment precomputed (product promotions beat
+# store-wide ones, then the higher discount). Segment starts are stored as sorted (group, day) keys,
+# so tagging every sale with its active promotion is a single np.searchsorted over all sales.
+# Lift compares units per day under a promotion with the product's units per day on the
+# promotion-free days of the BASELINE_DAYS before it; both come from cumulative sums, so each
+# (product, promotion) pair costs a few array lookups whatever the window lengths.
+# Per-product lift rests on few units, so the lift applied to demand is shrunk towards the lift of
+# the promotions themselves (pooled over all products) and capped.
+
+BASELINE_DAYS = 28 # Days before a promotion whose promotion-free days set the baseline
+MIN_BASELINE_DAYS = 7 # Fewer promotion-free baseline days: lift is not reported
+UPCOMING_PROMOTION_DAYS = 30 # Promotions starting within this many days are flagged on the reorder page
+MIN_FLAG_LIFT_PCT = 10.0 # Store-wide promotions only flag products whose past lift reached this
+MIN_LIFT_UNITS = 5 # A (product, promotion) pair needs this many baseline and promotion units to count
+PRIOR_UNITS = 20.0 # Weight of the promotion-level lift, in expected units, when shrinking a product's lift
+MAX_LIFT_MULTIPLIER = 2.0 # Expected demand under a promotion is at most this multiple of the baseline
+_GROUP_STRIDE = 2 ** 32 # (group, day) keys are group * stride + day + offset
+_DAY_OFFSET = 2 ** 31 # Keeps days before 1970 non-negative inside a key
+LIFT_COLUMNS = ['ProductID', 'PromotionID', 'PromotionName', 'DiscountPercentage', 'PromoDays', 'PromoUnits',
+                'PromoUnitsPerDay', 'BaselineUnits', 'BaselineUnitsPerDay', 'LiftPct']
+
+
+def _days(dates):
+    """Dates as int64 days since 1970-01-01 (dates must not be missing)."""
+    return pd.to_datetime(dates).to_numpy(dtype='datetime64[D]').astype(np.int64)
+
+
+def _keys(groups, days):
+    return np.asarray(groups, dtype=np.int64) * _GROUP_STRIDE + (np.asarray(days, dtype=np.int64) + _DAY_OFFSET)
+
+
+def build_promotion_index(df_promotions):
+    """
+    Interval index over the promotions table: 'promotions' (valid rows, positions used as promotion
+    codes), 'group_products' (ProductIDs with their own promotions, group code = position + 1) and, per
+    segment, 'keys' (sorted (group, first day) keys), 'winner' (promotion code or -1) and
+    'covered_before' (promoted days of the group before the segment).
+    """
+    columns = ['PromotionID', 'PromotionName', 'ProductID', 'DiscountPercentage', 'PromotionStartDate', 'PromotionEndDate']
+    empty = {'promotions': pd.DataFrame(columns=columns + ['StoreWide']), 'group_products': pd.Index([]),
+             'keys': np.array([], dtype=np.int64), 'winner': np.array([], dtype=np.int64),
+             'covered_before': np.array([], dtype=np.int64)}
+    if df_promotions.empty or not {'PromotionStartDate', 'PromotionEndDate'} <= set(df_promotions.columns):
+        return empty
+
+    promotions = df_promotions.reindex(columns=columns).copy()
+    promotions['PromotionStartDate'] = pd.to_datetime(promotions['PromotionStartDate'], errors='coerce').dt.normalize()
+    promotions['PromotionEndDate'] = pd.to_datetime(promotions['PromotionEndDate'], errors='coerce').dt.normalize()
+    promotions = promotions[promotions['PromotionEndDate'] >= promotions['PromotionStartDate']].reset_index(drop=True)
+    if promotions.empty:
+        return empty
+    product = promotions['ProductID'].astype('string').str.strip()
+    promotions['StoreWide'] = (product.isna() | (product == '')).to_numpy()
+    promotions['DiscountPercentage'] = pd.to_numeric(promotions['DiscountPercentage'], errors='coerce').fillna(0)
+
+    starts = _days(promotions['PromotionStartDate'])
+    ends = _days(promotions['PromotionEndDate'])
+    # Precedence, lowest first: store-wide before product promotions, then discount, then the later start
+    precedence = np.lexsort((starts, promotions['DiscountPercentage'].to_numpy(), ~promotions['StoreWide'].to_numpy()))
+    store_wide = precedence[promotions['StoreWide'].to_numpy()[precedence]]
+    specific = promotions.loc[~promotions['StoreWide'], 'ProductID']
+    group_products = pd.Index(specific.unique())
+    members = [store_wide] + [precedence[np.isin(precedence, store_wide) | (promotions['ProductID'].to_numpy()[precedence] == product_id)]
+                              for product_id in group_products]
+
+    keys, winners, covered = [], [], []
+    for group, rows in enumerate(members):
+        if not len(rows):
+            continue
+        bounds = np.unique(np.concatenate([starts[rows], ends[rows] + 1]))
+        winner = np.full(len(bounds), -1, dtype=np.int64)
+        for row in rows: # Ascending precedence, so the strongest promotion is written last
+            winner[np.searchsorted(bounds, starts[row]):np.searchsorted(bounds, ends[row] + 1)] = row
+        lengths = np.diff(bounds, append=bounds[-1]) * (winner >= 0)
+        keys.append(_keys(np.full(len(bounds), group), bounds))
+        winners.append(winner)
+        covered.append(np.concatenate([[0], np.cumsum(lengths)[:-1]]))
+
+    return {'promotions': promotions, 'group_products': group_products, 'keys': np.concatenate(keys),
+            'winner': np.concatenate(winners), 'covered_before': np.concatenate(covered)}
+
+
+def product_groups(index, product_ids):
+    """Promotion group of each product: its own calendar if it has product promotions, else the store-wide one."""
+    return index['group_products'].get_indexer(pd.Index(product_ids)) + 1
+
+
+def _locate(index, groups, days):
+    """Segment position of each (group, day) and whether it lies inside that group's calendar."""
+    keys = _keys(groups, days)
+    if not len(index['keys']):
+        return np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=bool), keys
+    positions = np.searchsorted(index['keys'], keys, side='right') - 1
+    inside = positions >= 0
+    positions = np.maximum(positions, 0)
+    inside &= index['keys'][positions] // _GROUP_STRIDE == np.asarray(groups, dtype=np.int64)
+    return positions, inside, keys
+
+
+def _active(index, groups, days):
+    positions, inside, _ = _locate(index, groups, days)
+    return np.where(inside, index['winner'][positions] if len(index['winner']) else -1, -1)
+
+
+def _promoted_days_before(index, groups, days):
+    """Promoted days of each group before `days`; differences give promoted days over a range."""
+    positions, inside, keys = _locate(index, groups, days)
+    if not len(index['keys']):
+        return np.zeros(len(keys), dtype=np.int64)
+    covered = index['covered_before'][positions] + (keys - index['keys'][positions]) * (index['winner'][positions] >= 0)
+    return np.where(inside, covered, 0)
+
+
+def active_promotions(index, product_ids, dates):
+    """Position in index['promotions'] of the promotion active for each (product, date), -1 when none."""
+    return _active(index, product_groups(index, product_ids), _days(dates))
+
+
+def promotion_lift(facts, index):
+    """
+    Lift per (product, promotion) from sales facts: units per day while the promotion was the active one for
+    the product, against units per day on the promotion-free days of the BASELINE_DAYS before it.
+    """
+    promotions = index['promotions']
+    if facts.empty or promotions.empty:
+        return pd.DataFrame(columns=LIFT_COLUMNS)
+
+    product_codes, product_ids = pd.factorize(facts['ProductID'])
+    groups_by_product = product_groups(index, product_ids)
+    days = _days(facts['SaleDate'])
+    quantity = pd.to_numeric(facts['Quantity'], errors='coerce').fillna(0).to_numpy(dtype=float)
+    promo = _active(index, groups_by_product[product_codes], days)
+    first_day, end_day = days.min(), days.max() + 1 # Sales history covers [first_day, end_day)
+
+    # Days each promotion was the active one in each group, within the sales history
+    segment_start = index['keys'] % _GROUP_STRIDE - _DAY_OFFSET
+    segment_end = np.append(segment_start[1:], segment_start[-1]) # A group's last segment is never active
+    segment_group = index['keys'] // _GROUP_STRIDE
+    clipped = np.clip(segment_end, first_day, end_day) - np.clip(segment_start, first_day, end_day)
+    active = index['winner'] >= 0
+    promo_days = pd.Series(clipped[active]).groupby([segment_group[active], index['winner'][active]]).sum()
+    promo_days = promo_days[promo_days > 0].rename_axis(['Group', 'Promotion']).rename('PromoDays').reset_index()
+
+    # Candidate pairs: every product with every promotion active for it within the history
+    pairs = pd.DataFrame({'Product': np.arange(len(product_ids)), 'Group': groups_by_product})
+    pairs = pairs.merge(promo_days, on='Group')
+    if pairs.empty:
+        return pd.DataFrame(columns=LIFT_COLUMNS)
+    tagged = promo >= 0
+    promo_units = pd.Series(quantity[tagged]).groupby([product_codes[tagged], promo[tagged]]).sum()
+    pair_index = pd.MultiIndex.from_arrays([pairs['Product'], pairs['Promotion']])
+    pairs['PromoUnits'] = promo_units.reindex(pair_index).fillna(0).to_numpy()
+
+    # Baseline from cumulative promotion-free units per product, keyed like the promotion segments
+    untagged = ~tagged
+    unit_keys = _keys(product_codes[untagged], days[untagged])
+    order = np.argsort(unit_keys, kind='stable')
+    unit_keys = unit_keys[order]
+    cumulative_units = np.concatenate([[0.0], np.cumsum(quantity[untagged][order])])
+    def units_before(products, day):
+        return cumulative_units[np.searchsorted(unit_keys, _keys(products, day), side='left')]
+
+    start = _days(promotions['PromotionStartDate'])[pairs['Promotion'].to_numpy()]
+    window_end = np.clip(start, first_day, end_day)
+    window_start = np.clip(start - BASELINE_DAYS, first_day, end_day)
+    groups = pairs['Group'].to_numpy()
+    products = pairs['Product'].to_numpy()
+    baseline_days = (window_end - window_start) - (_promoted_days_before(index, groups, window_end)
+                                                   - _promoted_days_before(index, groups, window_start))
+    baseline_units = units_before(products, window_end) - units_before(products, window_start)
+
+    promo_rate = pairs['PromoUnits'].to_numpy() / pairs['PromoDays'].to_numpy()
+    baseline_rate = np.where(baseline_days >= MIN_BASELINE_DAYS, baseline_units / np.maximum(baseline_days, 1), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lift = np.where(baseline_rate > 0, (promo_rate / baseline_rate - 1) * 100, np.nan)
+    promotion_rows = promotions.iloc[pairs['Promotion'].to_numpy()]
+    return pd.DataFrame({
+        'ProductID': product_ids[products],
+        'PromotionID': promotion_rows['PromotionID'].to_numpy(),
+        'PromotionName': promotion_rows['PromotionName'].to_numpy(),
+        'DiscountPercentage': promotion_rows['DiscountPercentage'].to_numpy(),
+        'PromoDays': pairs['PromoDays'].to_numpy(),
+        'PromoUnits': pairs['PromoUnits'].to_numpy(),
+        'PromoUnitsPerDay': promo_rate,
+        'BaselineUnits': baseline_units,
+        'BaselineUnitsPerDay': baseline_rate,
+        'LiftPct': lift,
+    }, columns=LIFT_COLUMNS)
+
+
+def promotion_summary(lift, promotions):
+    """Per promotion: products measured and overall lift (summed promotion rate over summed baseline rate)."""
+    measured = lift[lift['BaselineUnitsPerDay'] > 0]
+    totals = measured.groupby('PromotionID')[['PromoUnitsPerDay', 'BaselineUnitsPerDay']].sum()
+    summary = promotions.set_index('PromotionID')[['PromotionName', 'ProductID', 'DiscountPercentage',
+                                                   'PromotionStartDate', 'PromotionEndDate', 'StoreWide']]
+    summary = summary.join(totals, how='inner')
+    summary['Products'] = measured.groupby('PromotionID').size().reindex(summary.index).to_numpy()
+    summary['LiftPct'] = (summary['PromoUnitsPerDay'] / summary['BaselineUnitsPerDay'] - 1) * 100
+    return summary.sort_values('PromotionStartDate')
+
+
+def expected_lift(lift, summary):
+    """
+    Expected lift (%) per ProductID from its past promotions with at least MIN_LIFT_UNITS baseline and promotion
+    units: promotion units over baseline-expected units, with PRIOR_UNITS pseudo-units at the lift of the same
+    promotions across all products, capped at MAX_LIFT_MULTIPLIER.
+    """
+    measured = lift[(lift['BaselineUnits'] >= MIN_LIFT_UNITS) & (lift['PromoUnits'] >= MIN_LIFT_UNITS)
+                    & (lift['BaselineUnitsPerDay'] > 0)]
+    if measured.empty:
+        return pd.Series(dtype=float, index=pd.Index([], name='ProductID'), name='ExpectedLiftPct')
+    baseline_expected = measured['BaselineUnitsPerDay'] * measured['PromoDays'] # Units without the promotion
+    promotion_multiplier = 1 + measured['PromotionID'].map(summary['LiftPct']).fillna(0).to_numpy() / 100
+    sums = pd.DataFrame({'ProductID': measured['ProductID'], 'actual': measured['PromoUnits'],
+                         'expected': baseline_expected, 'prior': baseline_expected * promotion_multiplier})
+    sums = sums.groupby('ProductID')[['actual', 'expected', 'prior']].sum()
+    prior = sums['prior'] / sums['expected'] # The product's promotions, pooled over all products
+    multiplier = (sums['actual'] + PRIOR_UNITS * prior) / (sums['expected'] + PRIOR_UNITS)
+    return ((multiplier.clip(0, MAX_LIFT_MULTIPLIER) - 1) * 100).rename('ExpectedLiftPct')
+
+
+def upcoming_promotions(index, expected, product_ids, today, horizon_days=UPCOMING_PROMOTION_DAYS):
+    """
+    Products with a promotion starting within horizon_days of today, indexed by ProductID: the earliest such
+    promotion and the product's expected lift (expected_lift). Product promotions always flag their
+    product; store-wide ones flag only products whose expected lift is at least MIN_FLAG_LIFT_PCT.
+    """
+    columns = ['PromotionID', 'PromotionName', 'PromotionStartDate', 'ExpectedLiftPct']
+    promotions = index['promotions']
+    today = pd.Timestamp(today).normalize()
+    upcoming = promotions[(promotions['PromotionStartDate'] >= today)
+                          & (promotions['PromotionStartDate'] <= today + pd.Timedelta(days=horizon_days))]
+    if upcoming.empty or not len(product_ids):
+        return pd.DataFrame(columns=columns, index=pd.Index([], name='ProductID'))
+
+    product_ids = pd.Index(product_ids)
+    specific = upcoming[~upcoming['StoreWide']]
+    store_wide = upcoming[upcoming['StoreWide']]
+    flagged_ids = product_ids[expected.reindex(product_ids).to_numpy() >= MIN_FLAG_LIFT_PCT]
+    flagged = pd.concat([
+        specific[specific['ProductID'].isin(product_ids)],
+        store_wide.loc[store_wide.index.repeat(len(flagged_ids))].assign(ProductID=np.tile(flagged_ids, len(store_wide))),
+    ])
+    flagged = flagged.sort_values(['PromotionStartDate', 'StoreWide']).drop_duplicates('ProductID').set_index('ProductID')
+    flagged['ExpectedLiftPct'] = expected.reindex(flagged.index)
+    return flagged[columns]
+
+
+def get_promotions(stored_data_json):
+    """
+    Returns the promotion engine for the stored dataset, built once per dataset version:
+    'index' (build_promotion_index), 'lift' (promotion_lift per product and promotion), 'summary' and
+    'expected_lift' (per ProductID).
+    """
+    def build():
+        index = build_promotion_index(read_frame(stored_data_json, 'promotions'))
+        lift = promotion_lift(get_sales_facts(stored_data_json), index)
+        summary = promotion_summary(lift, index['promotions'])
+        return {'index': index, 'lift': lift, 'summary': summary, 'expected_lift': expected_lift(lift, summary)}
+
+    return get_cached(get_version(stored_data_json), ('promotions',), build)
+
+
+def get_upcoming_promotions(stored_data_json):
+    """Returns upcoming_promotions for the catalog, cached per dataset version and day."""
+    today = datetime.now().date()
+
+    def build():
+        promotions = get_promotions(stored_data_json)
+        df_products = read_frame(stored_data_json, 'products')
+        product_ids = df_products['ProductID'].unique() if 'ProductID' in df_products.columns else []
+        return upcoming_promotions(promotions['index'], promotions['expected_lift'], product_ids, today)
+
+    return get_cached(get_version(stored_data_json), ('upcoming_promotions', today), build)
@@ -0,0 +1,147 @@
+from datetime import datetime
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from datastore import get_cached, get_version, read_frame
+from demand import daily_demand_matrix
+
+# --- Service-Level Safety Stock ---
+# Replaces the flat SAFETY_STOCK_BUFFER percentage with the standard formula
+#   SS = z * sqrt(L * sigma_d^2 + d^2 * sigma_L^2)
+# where d / sigma_d are the mean and standard deviation of daily demand and
+# L / sigma_L the mean and standard deviation of the supplier lead time.
+
+DEFAULT_SERVICE_LEVEL = 0.95 # Probability of not stocking out during a replenishment cycle
+DEMAND_HISTORY_DAYS = 90 # Same window as VERY_LONG_PERIOD_DAYS in the reorder logic
+MAX_LEAD_TIME_CV = 1.0 # Cap on lead-time coefficient of variation (std / mean)
+DEFAULT_LEAD_TIME_DAYS = 7 # Lead time when neither the product, its supplier nor the catalog has one
+
+
+def service_level_z(service_level):
+    """Converts a target service level (e.g. 0.95) into its standard normal z-score."""
+    service_level = min(max(float(service_level), 0.5), 0.9999)
+    return NormalDist().inv_cdf(service_level)
+
+
+def lead_time_variability(df_purchases, product_ids, supplier_ids=None):
+    """
+    Estimates the lead-time coefficient of variation for every product.
+
+    purchase_history.csv only records order dates (no receipt dates), so the spread of each
+    product's reorder intervals is used as the proxy: CV = std / mean of the gaps between
+    consecutive purchases. Products with fewer than two gaps borrow their supplier's median
+    CV, then the catalog median.
+    """
+    product_index = pd.Index(product_ids)
+    n_products = len(product_index)
+    cv = np.full(n_products, np.nan)
+
+    if n_products and not df_purchases.empty and {'ProductID', 'PurchaseDate'}.issubset(df_purchases.columns):
+        codes = product_index.get_indexer(df_purchases['ProductID'])
+        days = pd.to_datetime(df_purchases['PurchaseDate'], errors='coerce').to_numpy(dtype='datetime64[D]').astype(np.int64)
+        valid = (codes >= 0) & ~pd.isna(df_purchases['PurchaseDate']).to_numpy()
+        codes, days = codes[valid], days[valid]
+
+        order = np.lexsort((days, codes)) # Sort by product, then date
+        codes, days = codes[order], days[order]
+        same_product = codes[1:] == codes[:-1]
+        gap_codes = codes[1:][same_product]
+        gaps = np.diff(days)[same_product].astype(float)
+
+        count = np.bincount(gap_codes, minlength=n_products)
+        total = np.bincount(gap_codes, weights=gaps, minlength=n_products)
+        total_sq = np.bincount(gap_codes, weights=gaps * gaps, minlength=n_products)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = total / count
+            variance = (total_sq - count * mean * mean) / (count - 1)
+            std = np.sqrt(np.clip(variance, 0, None))
+            cv = np.where((count >= 2) & (mean > 0), std / mean, np.nan)
+
+    cv_series = pd.Series(cv)
+    if supplier_ids is not None and cv_series.isna().any():
+        supplier_median = cv_series.groupby(np.asarray(supplier_ids)).transform('median')
+        cv_series = cv_series.fillna(supplier_median)
+    cv_series = cv_series.fillna(cv_series.median()).fillna(0)
+    return np.clip(cv_series.to_numpy(), 0, MAX_LEAD_TIME_CV)
+
+
+def safety_stock_table(product_ids, daily_demand, lead_time, lead_time_cv, service_level=DEFAULT_SERVICE_LEVEL):
+    """
+    Applies the safety stock formula to a (n_products, n_days) demand matrix.
+    Returns a DataFrame indexed by ProductID with demand, lead-time and safety stock figures (in units).
+    """
+    daily_demand = np.asarray(daily_demand, dtype=float)
+    n_days = daily_demand.shape[1]
+    daily_mean = daily_demand.mean(axis=1) if n_days > 0 else np.zeros(len(product_ids))
+    daily_std = daily_demand.std(axis=1, ddof=1) if n_days > 1 else np.zeros(len(product_ids))
+    lead_time = np.asarray(lead_time, dtype=float)
+    lead_time_std = lead_time * np.asarray(lead_time_cv, dtype=float)
+
+    z = service_level_z(service_level)
+    safety_stock = z * np.sqrt(lead_time * daily_std ** 2 + daily_mean ** 2 * lead_time_std ** 2)
+
+    return pd.DataFrame({
+        'AvgDailyDemand': daily_mean,
+        'DemandStdDev': daily_std,
+        'LeadTimeDays': lead_time,
+        'LeadTimeStdDev': lead_time_std,
+        'SafetyStock': safety_stock,
+        'ReorderLevel': daily_mean * lead_time + safety_stock,
+    }, index=pd.Index(product_ids, name='ProductID'))
+
+
+def calculate_safety_stock(df_products, df_sales, df_purchases, service_level=DEFAULT_SERVICE_LEVEL,
+                           as_of=None, history_days=DEMAND_HISTORY_DAYS):
+    """
+    Computes safety stock for the whole catalog in one array pass.
+    Returns a DataFrame indexed by ProductID with demand, lead-time and safety stock figures (in units).
+    """
+    columns = ['AvgDailyDemand', 'DemandStdDev', 'LeadTimeDays', 'LeadTimeStdDev', 'SafetyStock', 'ReorderLevel']
+    if df_products.empty or 'ProductID' not in df_products.columns:
+        return pd.DataFrame(columns=columns)
+
+    product_ids = df_products['ProductID'].to_numpy()
+    as_of = pd.Timestamp(as_of if as_of is not None else datetime.now().date())
+    demand = daily_demand_matrix(df_sales, product_ids, as_of, history_days)
+    return safety_stock_table(product_ids, demand, catalog_lead_times(df_products),
+                              catalog_lead_time_cv(df_products, df_purchases), service_level)
+
+
+def catalog_lead_times(df_products):
+    """
+    Returns LeadTimeDays for every product row. Missing or invalid (negative) values borrow their
+    supplier's median lead time, then the catalog median, then DEFAULT_LEAD_TIME_DAYS.
+    """
+    if 'LeadTimeDays' not in df_products.columns:
+        return np.full(len(df_products), float(DEFAULT_LEAD_TIME_DAYS))
+    lead_time = pd.to_numeric(df_products['LeadTimeDays'], errors='coerce')
+    lead_time = lead_time.where(lead_time >= 0)
+    if 'SupplierID' in df_products.columns:
+        lead_time = lead_time.fillna(lead_time.groupby(df_products['SupplierID']).transform('median'))
+    catalog_median = lead_time.median()
+    return lead_time.fillna(catalog_median if pd.notna(catalog_median) else DEFAULT_LEAD_TIME_DAYS).to_numpy(dtype=float)
+
+
+def catalog_lead_time_cv(df_products, df_purchases):
+    """Returns the lead-time coefficient of variation for every product row (see lead_time_variability)."""
+    supplier_ids = df_products['SupplierID'].to_numpy() if 'SupplierID' in df_products.columns else None
+    return lead_time_variability(df_purchases, df_products['ProductID'].to_numpy(), supplier_ids)
+
+
+def get_safety_stock(stored_data_json, service_level=DEFAULT_SERVICE_LEVEL):
+    """
+    Returns the safety stock table for the stored dataset, cached per dataset version and day.
+    Shared by the reorder table and the stock details modal.
+    """
+    today = datetime.now().date()
+
+    def build():
+        df_products = read_frame(stored_data_json, 'products')
+        df_sales = read_frame(stored_data_json, 'sales', date_cols=('SaleDate',))
+        df_purchases = read_frame(stored_data_json, 'purchases', date_cols=('PurchaseDate',))
+        return calculate_safety_stock(df_products, df_sales, df_purchases, service_level, as_of=today)
+
+    return get_cached(get_version(stored_data_json), ('safety_stock', service_level, today), build)
@@ -0,0 +1,154 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from catalog import product_keys
+from datastore import get_cached, get_version, read_frame
+
+# --- Sales Fact Table ---
+# Sales rows pre-joined to product attributes by integer product key (position in the products
+# table), with profit computed once as TotalPrice - Quantity * Cost. Category, profit, seasonal and
+# brand views read this table instead of merging sales with products in every callback.
+# When a new dataset version only appends sales rows (same products, old SaleIDs a prefix of the
+# new ones), just the appended rows are joined and added to the previous table.
+# sales_rollup condenses the table to daily totals; rollups of separate batches add up, which is
+# how streamed sales (ingest.py) reach the dashboard without rebuilding anything.
+
+FACT_COLUMNS = ['SaleID', 'SaleDate', 'ProductKey', 'ProductID', 'Category', 'Brand', 'LocationID',
+                'Quantity', 'UnitPrice', 'TotalPrice', 'Cost', 'Profit', 'Year', 'Month', 'Season']
+UNKNOWN_CATEGORY = 'Unknown'
+SEASON_BY_MONTH = np.array(['', 'Winter', 'Winter', 'Spring', 'Spring', 'Spring', 'Summer', 'Summer', 'Summer',
+                            'Autumn', 'Autumn', 'Autumn', 'Winter'], dtype=object) # Indexed by month 1..12
+
+_facts_lock = threading.Lock()
+_last_facts = {} # Most recent table and the products JSON it was joined against, for incremental appends
+
+
+def _numeric(df, col):
+    if col not in df.columns:
+        return np.zeros(len(df))
+    return pd.to_numeric(df[col], errors='coerce').fillna(0).to_numpy(dtype=float)
+
+
+def build_sales_facts(df_sales, df_products):
+    """Joins sales rows to product Category / Cost by integer key. Rows without a SaleDate are dropped."""
+    if df_sales.empty or 'SaleDate' not in df_sales.columns:
+        return pd.DataFrame(columns=FACT_COLUMNS)
+
+    sale_date = pd.to_datetime(df_sales['SaleDate'], errors='coerce')
+    df_sales = df_sales[sale_date.notna().to_numpy()]
+    sale_date = sale_date[sale_date.notna()]
+
+    keys = product_keys(df_products).get_indexer(df_sales['ProductID']).astype(np.int32)
+    known = keys >= 0
+    if 'Cost' in df_products.columns:
+        cost = np.where(known, pd.to_numeric(df_products['Cost'], errors='coerce').fillna(0).to_numpy()[keys], 0.0)
+    else:
+        cost = np.zeros(len(df_sales))
+    if 'Category' in df_products.columns:
+        category = np.where(known, df_products['Category'].fillna(UNKNOWN_CATEGORY).to_numpy()[keys], None)
+    else:
+        category = np.full(len(df_sales), None, dtype=object)
+    if 'ProductCategory' in df_sales.columns: # Category as recorded on the sale for products not in the catalog
+        category = np.where(pd.isna(category), df_sales['ProductCategory'].to_numpy(), category)
+    category = pd.Series(category).fillna(UNKNOWN_CATEGORY).to_numpy()
+
+    quantity = _numeric(df_sales, 'Quantity')
+    total_price = _numeric(df_sales, 'TotalPrice')
+    profit = total_price - quantity * cost
+    if 'Profit' in df_sales.columns: # No catalog cost: keep the profit recorded on the sale, if any
+        recorded = pd.to_numeric(df_sales['Profit'], errors='coerce').to_numpy(dtype=float)
+        profit = np.where(~known & ~np.isnan(recorded), recorded, profit)
+
+    month = sale_date.dt.month.to_numpy()
+    return pd.DataFrame({
+        'SaleID': df_sales['SaleID'].to_numpy() if 'SaleID' in df_sales.columns else np.arange(len(df_sales)),
+        'SaleDate': sale_date.to_numpy(),
+        'ProductKey': keys,
+        'ProductID': df_sales['ProductID'].to_numpy(),
+        'Category': category,
+        'Brand': df_sales['Brand'].to_numpy() if 'Brand' in df_sales.columns else UNKNOWN_CATEGORY,
+        'LocationID': df_sales['LocationID'].to_numpy() if 'LocationID' in df_sales.columns else None,
+        'Quantity': quantity,
+        'UnitPrice': _numeric(df_sales, 'UnitPrice'),
+        'TotalPrice': total_price,
+        'Cost': cost,
+        'Profit': profit,
+        'Year': sale_date.dt.year.to_numpy(),
+        'Month': month,
+        'Season': SEASON_BY_MONTH[month],
+    })
+
+
+def append_sales_facts(facts, df_new_sales, df_products):
+    """Returns facts extended with the fact rows for df_new_sales (only the new rows are joined)."""
+    new_facts = build_sales_facts(df_new_sales, df_products)
+    if facts is None or facts.empty:
+        return new_facts
+    if new_facts.empty:
+        return facts
+    return pd.concat([facts, new_facts], ignore_index=True)
+
+
+def _appended_rows(previous, df_sales):
+    """Number of leading sales rows already in the previous fact table, or None if they are not a prefix."""
+    sale_ids = previous['sale_ids']
+    if sale_ids is None or 'SaleID' not in df_sales.columns or len(sale_ids) > len(df_sales):
+        return None
+    if not np.array_equal(df_sales['SaleID'].to_numpy()[:len(sale_ids)], sale_ids):
+        return None
+    return len(sale_ids)
+
+
+def get_sales_facts(stored_data_json):
+    """
+    Returns the sales fact table for the stored dataset, built once per dataset version.
+    The table is shared between callers, so it must not be modified in place.
+    """
+    def build():
+        df_sales = read_frame(stored_data_json, 'sales')
+        df_products = read_frame(stored_data_json, 'products')
+        products_json = stored_data_json.get('products') if stored_data_json else None
+        with _facts_lock:
+            previous = _last_facts.get('state')
+            start = None
+            if previous is not None and previous['products_json'] == products_json and not df_sales.empty:
+                start = _appended_rows(previous, df_sales)
+            if start is None:
+                facts = build_sales_facts(df_sales, df_products)
+            else:
+                facts = append_sales_facts(previous['facts'], df_sales.iloc[start:], df_products)
+            sale_ids = df_sales['SaleID'].to_numpy() if 'SaleID' in df_sales.columns else None
+            _last_facts['state'] = {'facts': facts, 'products_json': products_json, 'sale_ids': sale_ids}
+        return facts
+
+    return get_cached(get_version(stored_data_json), ('sales_facts',), build)
+
+
+def sales_rollup(facts):
+    """Daily revenue, daily profit by category and total units sold - what the dashboard sales tiles read."""
+    sale_day = facts['SaleDate'].dt.normalize()
+    return {
+        'daily_sales': facts['TotalPrice'].groupby(sale_day).sum(),
+        'category_profit': facts['Profit'].groupby([sale_day, facts['Category']]).sum(), # (day, category) index
+        'units_sold': float(facts['Quantity'].sum()),
+    }
+
+
+def combine_rollups(rollups):
+    """Adds rollups together; cost grows with the number of days and categories covered, not with sales rows."""
+    rollups = list(rollups)
+    if len(rollups) == 1:
+        return rollups[0]
+    return {
+        'daily_sales': pd.concat([r['daily_sales'] for r in rollups]).groupby(level=0).sum(),
+        'category_profit': pd.concat([r['category_profit'] for r in rollups]).groupby(level=[0, 1]).sum(),
+        'units_sold': sum(r['units_sold'] for r in rollups),
+    }
+
+
+def get_sales_rollup(stored_data_json):
+    """Returns sales_rollup of the stored dataset's fact table, built once per dataset version."""
+    return get_cached(get_version(stored_data_json), ('sales_rollup',),
+                      lambda: sales_rollup(get_sales_facts(stored_data_json)))
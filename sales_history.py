@@ -0,0 +1,56 @@
+import os
+
+import pandas as pd
+
+# --- Out-of-Core Sales History ---
+# Every consumer of the sales table (fact table, rollups, demand matrices, safety stock, location
+# shares...) only sums Quantity / TotalPrice / Profit by day, product, location, category or brand.
+# Sales files above OUT_OF_CORE_MIN_BYTES are therefore streamed in chunks and condensed to one row
+# per (day, product, location, category, brand) as they are read, so memory follows the size of that
+# daily aggregate rather than the number of transactions. The aggregate keeps the sales columns
+# (plus Transactions), so downstream code reads it like the raw table; SaleID is dropped, which makes
+# the append-detecting engines (sales_facts, notifications) rebuild instead of extending.
+
+OUT_OF_CORE_MIN_BYTES = 256 * 1024 * 1024 # Smaller files are read whole
+SALES_CHUNK_ROWS = 500_000
+COMPACT_EVERY_CHUNKS = 8 # Merge partial aggregates after this many chunks to bound memory
+GROUP_COLUMNS = ['SaleDate', 'ProductID', 'LocationID', 'ProductCategory', 'Brand']
+SUM_COLUMNS = ['Quantity', 'TotalPrice', 'Profit', 'Transactions']
+
+
+def _aggregate(df):
+    """Sums SUM_COLUMNS over the GROUP_COLUMNS present in df (missing keys are kept as their own group)."""
+    keys = [col for col in GROUP_COLUMNS if col in df.columns]
+    sums = [col for col in SUM_COLUMNS if col in df.columns]
+    return df.groupby(keys, dropna=False, sort=False)[sums].sum(min_count=1).reset_index()
+
+
+def aggregate_sales_csv(path, chunk_rows=SALES_CHUNK_ROWS):
+    """
+    Reads a sales CSV chunk by chunk into daily rows per (product, location, category, brand) with summed
+    Quantity / TotalPrice / Profit, a Transactions count and UnitPrice as the revenue-weighted mean price.
+    Rows without a valid SaleDate are dropped. Returns the aggregate sorted by SaleDate.
+    """
+    partials = []
+    reader = pd.read_csv(path, chunksize=chunk_rows, usecols=lambda col: col not in ('SaleID', 'UnitPrice'))
+    for chunk in reader:
+        chunk['SaleDate'] = pd.to_datetime(chunk['SaleDate'], errors='coerce').dt.normalize()
+        chunk = chunk[chunk['SaleDate'].notna()].assign(Transactions=1)
+        partials.append(_aggregate(chunk))
+        if len(partials) >= COMPACT_EVERY_CHUNKS:
+            partials = [_aggregate(pd.concat(partials, ignore_index=True))]
+
+    if not partials:
+        return pd.DataFrame(columns=GROUP_COLUMNS + ['UnitPrice'] + SUM_COLUMNS)
+    daily = _aggregate(pd.concat(partials, ignore_index=True)) if len(partials) > 1 else partials[0]
+    quantity = daily['Quantity'].where(daily['Quantity'] != 0)
+    daily.insert(daily.columns.get_loc('TotalPrice'), 'UnitPrice', daily['TotalPrice'] / quantity)
+    return daily.sort_values('SaleDate', kind='stable').reset_index(drop=True)
+
+
+def read_sales_csv(path):
+    """The sales table for load_data: the raw rows, or the daily aggregate for files too large to hold."""
+    if os.path.getsize(path) >= OUT_OF_CORE_MIN_BYTES:
+        print(f"Sales file is {os.path.getsize(path) / 1024 ** 2:,.0f} MB; loading it as daily aggregates.")
+        return aggregate_sales_csv(path)
+    return pd.read_csv(path)
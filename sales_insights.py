@@ -0,0 +1,187 @@
+import itertools
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from datastore import get_cached, get_version, read_frame
+from sales_facts import SEASON_BY_MONTH, get_sales_facts
+
+# --- Sales Insight Miner ---
+# Finds category x season x city x holiday slices whose daily units differ significantly from the
+# rest of their context (e.g. Apparel in Mumbai: Winter against the other seasons). Raw sales are
+# condensed once into a cube of per-day sufficient statistics (days, sum, sum of squares) for the
+# grouping sets (Category | all, City | all) x Season x Holiday. Seasons and holidays partition the
+# calendar, and cities partition city-days, so any slice and its complement are sums of cube cells;
+# days without sales count as zeros through the calendar day counts. One task per (category, focus
+# dimension) runs Welch tests for all of its slices; tasks run in parallel across cores when the
+# cube is large. p-values are adjusted for the number of tests (Benjamini-Hochberg) before ranking.
+
+ALL = '(all)' # Cube label for "summed over this dimension"
+HOLIDAY, REGULAR_DAY = 'Holiday', 'Regular day'
+FOCUS_DIMENSIONS = ['Season', 'City', 'Holiday'] # Compared within each category (and across all categories)
+FALSE_DISCOVERY_RATE = 0.05
+MIN_SHIFT_PCT = 10.0 # Smaller shifts are not reported, however significant
+MIN_SLICE_DAYS = 14 # Slices observed on fewer days are not tested
+TOP_INSIGHTS = 10
+MIN_PARALLEL_CELLS = 200_000 # Below this cube size the process pool costs more than it saves
+INSIGHT_COLUMNS = ['Category', 'Focus', 'Value', 'Context', 'DaysIn', 'DaysOut', 'MeanIn', 'MeanOut', 'ShiftPct',
+                   'T', 'PValue', 'Profile']
+
+
+def t_p_values(t, dof):
+    """
+    Two-sided p-values of t statistics with `dof` degrees of freedom. t is mapped to a standard normal z
+    (Bailey's approximation), which keeps slices of a few weeks from looking more significant than they are.
+    """
+    t, dof = np.asarray(t, dtype=float), np.asarray(dof, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = t * (1 - 1 / (4 * dof)) / np.sqrt(1 + t ** 2 / (2 * dof))
+    return np.array([math.erfc(abs(value) / math.sqrt(2)) for value in z.ravel()]).reshape(z.shape)
+
+
+def benjamini_hochberg(p_values):
+    """Benjamini-Hochberg adjusted p-values; NaN p-values are not counted as tests and stay NaN."""
+    p_values = np.asarray(p_values, dtype=float)
+    adjusted = np.full(p_values.shape, np.nan)
+    tested = np.flatnonzero(~np.isnan(p_values.ravel()))
+    if len(tested):
+        order = tested[np.argsort(p_values.ravel()[tested])]
+        ranked = p_values.ravel()[order] * len(tested) / np.arange(1, len(tested) + 1)
+        adjusted.ravel()[order] = np.minimum(np.minimum.accumulate(ranked[::-1])[::-1], 1)
+    return adjusted
+
+
+def build_sales_cube(facts, df_locations, df_holidays):
+    """
+    Per-day sufficient statistics of units sold, indexed by (Category, City, Season, Holiday) with ALL rows for
+    all categories and all cities: Days (calendar days in the cell), Sum and SumSq of the daily units.
+    """
+    columns = ['Days', 'Sum', 'SumSq']
+    if facts.empty:
+        return pd.DataFrame(columns=columns)
+
+    day = facts['SaleDate'].dt.normalize()
+    if not df_locations.empty and {'LocationID', 'City'} <= set(df_locations.columns):
+        city = facts['LocationID'].map(df_locations.drop_duplicates('LocationID').set_index('LocationID')['City'])
+    else:
+        city = facts['LocationID']
+    daily = facts['Quantity'].groupby([facts['Category'], city.fillna(ALL).rename('City'), day.rename('Date')]).sum()
+
+    # Day attributes: Season by month (as on the fact table), Holiday from holidays.csv
+    calendar = pd.DataFrame({'Date': pd.date_range(day.min(), day.max(), freq='D')})
+    calendar['Season'] = SEASON_BY_MONTH[calendar['Date'].dt.month.to_numpy()]
+    holidays = pd.to_datetime(df_holidays['HolidayDate'], errors='coerce').dt.normalize() \
+        if 'HolidayDate' in df_holidays.columns else pd.Series(dtype='datetime64[ns]')
+    calendar['Holiday'] = np.where(calendar['Date'].isin(holidays), HOLIDAY, REGULAR_DAY)
+    day_counts = calendar.groupby(['Season', 'Holiday']).size().rename('Days')
+
+    # Grouping sets: the daily series of every (category | all, city | all) pair, condensed per day class
+    frames = []
+    for by_category, by_city in itertools.product((True, False), repeat=2):
+        levels = [level for level, keep in (('Category', by_category), ('City', by_city)) if keep] + ['Date']
+        series = daily.groupby(level=levels).sum().reset_index()
+        series['Category'] = series['Category'] if by_category else ALL
+        series['City'] = series['City'] if by_city else ALL
+        frames.append(series)
+    series = pd.concat(frames, ignore_index=True).merge(calendar, on='Date')
+    series['SumSq'] = series['Quantity'] ** 2
+    sums = series.groupby(['Category', 'City', 'Season', 'Holiday'])[['Quantity', 'SumSq']].sum().rename(columns={'Quantity': 'Sum'})
+
+    # Full grid, so (category, city, day class) cells without any sales count their days as zeros
+    pairs = sums.index.droplevel(['Season', 'Holiday']).unique()
+    grid = pd.MultiIndex.from_tuples([pair + day_class for pair in pairs for day_class in day_counts.index],
+                                     names=['Category', 'City', 'Season', 'Holiday'])
+    cube = sums.reindex(grid, fill_value=0.0)
+    cube.insert(0, 'Days', day_counts.reindex(grid.droplevel(['Category', 'City'])).to_numpy())
+    return cube[columns].sort_index()
+
+
+def _shift_tests(task):
+    """
+    Welch tests of every slice of one category along one focus dimension against the rest of its context.
+    Runs in a worker process, so it only takes plain data: (category, focus, cube rows of that category).
+    """
+    category, focus, cells = task
+    others = [dimension for dimension in FOCUS_DIMENSIONS if dimension != focus]
+    results = []
+    for fixed in itertools.chain.from_iterable(itertools.combinations(others, size) for size in range(len(others) + 1)):
+        fixed = list(fixed)
+        # City series are not additive across cities within a day: use the ALL series unless City is the focus or fixed
+        if focus == 'City' or 'City' in fixed:
+            data = cells[cells.index.get_level_values('City') != ALL]
+        else:
+            data = cells[cells.index.get_level_values('City') == ALL]
+        inside = data.groupby(level=fixed + [focus]).sum()
+        totals = data.groupby(level=fixed).sum().reindex(inside.index.droplevel(focus)).to_numpy() if fixed \
+            else data.sum().to_numpy()[None, :]
+        outside = totals - inside.to_numpy()
+
+        n1, n0 = inside['Days'].to_numpy(float), outside[:, 0].astype(float)
+        m1 = np.divide(inside['Sum'].to_numpy(), n1, out=np.zeros_like(n1), where=n1 > 0)
+        m0 = np.divide(outside[:, 1], n0, out=np.zeros_like(n0), where=n0 > 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            v1 = (inside['SumSq'].to_numpy() - n1 * m1 ** 2) / (n1 - 1)
+            v0 = (outside[:, 2] - n0 * m0 ** 2) / (n0 - 1)
+            a, b = np.maximum(v1, 0) / n1, np.maximum(v0, 0) / n0
+            t = (m1 - m0) / np.sqrt(a + b)
+            dof = (a + b) ** 2 / (a ** 2 / (n1 - 1) + b ** 2 / (n0 - 1)) # Welch-Satterthwaite
+            shift = np.where(m0 > 0, (m1 / m0 - 1) * 100, np.nan)
+        testable = (n1 >= MIN_SLICE_DAYS) & (n0 >= MIN_SLICE_DAYS) & np.isfinite(t) & np.isfinite(dof) & np.isfinite(shift)
+        if focus == 'Holiday': # Regular days against holidays is the same test mirrored
+            testable &= inside.index.get_level_values(focus) == HOLIDAY
+
+        # Mean daily units of every focus value in each context, for charts
+        keys = [key if isinstance(key, tuple) else (key,) for key in inside.index]
+        means = inside['Sum'].to_numpy() / np.where(n1 > 0, n1, np.nan)
+        profiles = {}
+        for key, mean in zip(keys, means):
+            profiles.setdefault(key[:-1], {})[key[-1]] = mean
+        for i in np.flatnonzero(testable):
+            results.append({
+                'Category': category, 'Focus': focus, 'Value': keys[i][-1], 'Context': dict(zip(fixed, keys[i][:-1])),
+                'DaysIn': int(n1[i]), 'DaysOut': int(n0[i]), 'MeanIn': m1[i], 'MeanOut': m0[i], 'ShiftPct': shift[i],
+                'T': t[i], 'Dof': dof[i], 'Profile': profiles[keys[i][:-1]],
+            })
+    return results
+
+
+def mine_sales_insights(cube, top=TOP_INSIGHTS, max_workers=None):
+    """
+    Tests every category x focus-dimension slice of the cube against its context and returns the top
+    significant shifts (after Benjamini-Hochberg adjustment), one per (Category, Focus, Value), strongest first.
+    """
+    if cube.empty:
+        return pd.DataFrame(columns=INSIGHT_COLUMNS)
+
+    tasks = [(category, focus, cube.xs(category, level='Category'))
+             for category in cube.index.get_level_values('Category').unique() for focus in FOCUS_DIMENSIONS]
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if max_workers > 1 and len(cube) >= MIN_PARALLEL_CELLS:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(_shift_tests, tasks))
+    else:
+        results = [_shift_tests(task) for task in tasks]
+
+    tests = pd.DataFrame([row for rows in results for row in rows])
+    if tests.empty:
+        return pd.DataFrame(columns=INSIGHT_COLUMNS)
+    # Two-sided p-values, then Benjamini-Hochberg across all tests
+    tests['PValue'] = t_p_values(tests['T'], tests['Dof'])
+    adjusted = benjamini_hochberg(tests['PValue'])
+    significant = tests[(adjusted <= FALSE_DISCOVERY_RATE) & (tests['ShiftPct'].abs() >= MIN_SHIFT_PCT)]
+    significant = significant.iloc[np.argsort(significant['PValue'].to_numpy(), kind='stable')]
+    return significant.drop_duplicates(['Category', 'Focus', 'Value']).head(top)[INSIGHT_COLUMNS].reset_index(drop=True)
+
+
+def get_sales_insights(stored_data_json):
+    """Returns the top mined insights for the stored dataset, mined once per dataset version."""
+    def build():
+        cube = build_sales_cube(get_sales_facts(stored_data_json), read_frame(stored_data_json, 'locations'),
+                                read_frame(stored_data_json, 'holidays', ('HolidayDate',)))
+        return mine_sales_insights(cube)
+
+    return get_cached(get_version(stored_data_json), ('sales_insights',), build)
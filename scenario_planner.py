@@ -0,0 +1,277 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from datastore import read_frame
+from order_cycles import get_order_cycles
+from safety_stock import get_safety_stock
+from weather_demand import get_weather_sensitivity, weather_demand_multipliers
+
+# --- Monte Carlo Scenario Planner ---
+# Simulates thousands of demand / stock trajectories per SKU under a scenario made of
+#   * price changes      {ProductID or Category: +0.10 for +10%}
+#   * promotion campaigns rows shaped like promotions.csv (empty ProductID = store-wide)
+#   * supplier delays    {SupplierID: extra lead-time days}
+#   * weather changes    {'Temperature_C': +2, 'Precipitation_mm': {City: +20}} applied through the
+#                        per (category, city) sensitivities of weather_demand.py
+# Each chunk is a batched (paths x days x SKUs) array; chunks run in parallel across cores
+# and only per-SKU / per-path totals are kept, so memory stays bounded.
+
+DEFAULT_PATHS = 2000
+DEFAULT_HORIZON_DAYS = 90
+PRICE_ELASTICITY = -1.5 # % change in demand per % change in price
+MAX_CHUNK_BYTES = 32 * 2**20 # Every buffer _simulate_chunk holds for one chunk (see _cell_bytes)
+STATE_BYTES_PER_CELL = 96 # Per (path, SKU): float32 lots / orders and daily temporaries, int32 stock-out days,
+                          # float64 revenue / units sold / waste / profit
+MIN_PARALLEL_CELLS = 20_000_000 # Below this the process pool costs more than it saves
+PERCENTILES = [5, 25, 50, 75, 95]
+
+
+def promotions_from_frame(df_promotions):
+    """Converts promotions.csv rows into the list-of-dicts form used by scenarios."""
+    if df_promotions is None or df_promotions.empty:
+        return []
+    cols = ['ProductID', 'DiscountPercentage', 'PromotionStartDate', 'PromotionEndDate']
+    promos = df_promotions[[c for c in cols if c in df_promotions.columns]].copy()
+    if 'ProductID' in promos.columns:
+        promos['ProductID'] = promos['ProductID'].where(promos['ProductID'].notna(), None)
+    return promos.to_dict('records')
+
+
+def _scenario_multipliers(df_products, scenario, start_date, horizon_days):
+    """
+    Turns a scenario into per-day price factors (days x SKUs) and extra lead-time days per SKU.
+    The demand response is price_factor ** elasticity.
+    """
+    n_items = len(df_products)
+    product_ids = df_products['ProductID'].to_numpy()
+    categories = df_products['Category'].to_numpy() if 'Category' in df_products.columns else np.full(n_items, None)
+
+    # Permanent price changes, by ProductID or Category
+    price_change = np.zeros(n_items)
+    for key, change in (scenario.get('price_changes') or {}).items():
+        price_change[(product_ids == key) | (categories == key)] = float(change)
+    price_factor = np.tile(1 + price_change, (horizon_days, 1))
+
+    # Promotion windows (discount applies on [start, end] inclusive)
+    for promo in scenario.get('promotions') or []:
+        discount = float(promo.get('DiscountPercentage') or 0) / 100
+        start = (pd.Timestamp(promo['PromotionStartDate']) - start_date).days
+        end = (pd.Timestamp(promo['PromotionEndDate']) - start_date).days + 1
+        start, end = max(start, 0), min(end, horizon_days)
+        if start >= end or discount <= 0:
+            continue
+        target = promo.get('ProductID')
+        sku_mask = np.ones(n_items, dtype=bool) if not target or pd.isna(target) else (product_ids == target)
+        price_factor[start:end, sku_mask] *= 1 - discount
+
+    extra_lead_time = np.zeros(n_items)
+    if 'SupplierID' in df_products.columns:
+        supplier_ids = df_products['SupplierID'].to_numpy()
+        for supplier, delay in (scenario.get('supplier_delays') or {}).items():
+            extra_lead_time[supplier_ids == supplier] += float(delay)
+    return price_factor, extra_lead_time
+
+
+def _max_lead(lead_time, lead_time_std):
+    """Days past the horizon an order can still arrive (lead times are sampled up to 3 std devs out)."""
+    return int(np.ceil(np.max(lead_time + 3 * lead_time_std, initial=0))) + 1
+
+
+def _cell_bytes(horizon_days, max_lead):
+    """Bytes _simulate_chunk holds per (path, SKU): float32 demand and arrivals by day plus the per-path state."""
+    return 4 * horizon_days + 4 * (horizon_days + max_lead + 1) + STATE_BYTES_PER_CELL
+
+
+def _simulate_chunk(task):
+    """
+    Simulates one (paths x SKUs) chunk. Runs in a worker process, so it only takes plain arrays.
+    Returns per-SKU counts / sums for the chunk and per-path totals over its SKUs.
+    """
+    (seed, n_paths, sku_slice, base_demand, demand_multiplier, unit_price, unit_cost, stock, reorder_level,
+     order_up_to, lead_time, lead_time_std, expiry_day) = task
+    rng = np.random.default_rng(seed)
+    horizon_days, n_items = demand_multiplier.shape
+    max_lead = _max_lead(lead_time, lead_time_std)
+
+    # Batched demand for the whole chunk: paths x days x SKUs, sampled a day at a time into float32 so
+    # the int64 Poisson draws never take more than one day's slice on top of the buffer
+    demand = np.empty((n_paths, horizon_days, n_items), dtype=np.float32)
+    for day in range(horizon_days):
+        demand[:, day, :] = rng.poisson(base_demand * demand_multiplier[day], size=(n_paths, n_items))
+
+    initial = np.broadcast_to(stock.astype(np.float32), (n_paths, n_items)).copy() # Current lot, expires at expiry_day
+    fresh = np.zeros((n_paths, n_items), dtype=np.float32) # Replenished stock (assumed fresh for the horizon)
+    on_order = np.zeros((n_paths, n_items), dtype=np.float32)
+    arrivals = np.zeros((n_paths, horizon_days + max_lead + 1, n_items), dtype=np.float32)
+    stockout_days = np.zeros((n_paths, n_items), dtype=np.int32)
+    revenue = np.zeros((n_paths, n_items))
+    sold_total = np.zeros((n_paths, n_items))
+    wasted = np.zeros((n_paths, n_items))
+
+    for day in range(horizon_days):
+        received = arrivals[:, day, :]
+        fresh += received
+        on_order -= received
+
+        expiring = expiry_day == day
+        if expiring.any():
+            wasted[:, expiring] += initial[:, expiring]
+            initial[:, expiring] = 0
+
+        available = initial + fresh
+        want = demand[:, day, :]
+        sold = np.minimum(want, available)
+        stockout_days += want > available
+        from_initial = np.minimum(sold, initial)
+        initial -= from_initial
+        fresh -= sold - from_initial
+        sold_total += sold
+        revenue += sold * unit_price[day]
+
+        # (s, S) replenishment on inventory position, with a sampled lead time per order
+        position = initial + fresh + on_order
+        order_qty = np.where(position <= reorder_level, order_up_to - position, 0).astype(np.float32)
+        ordering = order_qty > 0
+        if ordering.any():
+            paths, skus = np.nonzero(ordering)
+            sampled_lead = np.rint(lead_time[skus] + rng.standard_normal(len(skus)) * lead_time_std[skus])
+            arrival_day = day + 1 + np.clip(sampled_lead, 0, max_lead - 1).astype(np.int64)
+            np.add.at(arrivals, (paths, arrival_day, skus), order_qty[paths, skus])
+            on_order += order_qty
+
+    profit = revenue - sold_total * unit_cost - wasted * unit_cost
+    return {
+        'sku_slice': sku_slice,
+        'stockout_paths': (stockout_days > 0).sum(axis=0),
+        'stockout_days': stockout_days.sum(axis=0),
+        'units_sold': sold_total.sum(axis=0),
+        'waste_units': wasted.sum(axis=0),
+        'profit': profit.sum(axis=0),
+        'path_profit': profit.sum(axis=1),
+        'path_waste': wasted.sum(axis=1),
+    }
+
+
+def run_scenario(df_products, daily_demand, scenario=None, planning=None, n_paths=DEFAULT_PATHS,
+                 horizon_days=DEFAULT_HORIZON_DAYS, start_date=None, elasticity=PRICE_ELASTICITY,
+                 weather_sensitivity=None, max_workers=None, seed=0):
+    """
+    Runs the Monte Carlo simulation for every SKU in df_products.
+
+    daily_demand: baseline units/day aligned with df_products rows.
+    planning: optional DataFrame indexed by ProductID with ReorderLevel, OrderQty, LeadTimeDays and
+              LeadTimeStdDev (see safety_stock.py / order_cycles.py); ReorderPoint / LeadTimeDays are used otherwise.
+    weather_sensitivity: weather_demand.fit_weather_sensitivity output, needed for scenario['weather_changes'].
+    Returns {'per_sku': DataFrame, 'summary': dict, 'path_profit': array, 'path_waste': array}.
+    """
+    scenario = scenario or {}
+    start_date = pd.Timestamp(start_date if start_date is not None else datetime.now().date())
+    n_items = len(df_products)
+    if n_items == 0 or n_paths <= 0 or horizon_days <= 0:
+        return {'per_sku': pd.DataFrame(), 'summary': {}, 'path_profit': np.zeros(0), 'path_waste': np.zeros(0)}
+
+    def numeric(col, default=0.0):
+        if col not in df_products.columns:
+            return np.full(n_items, default)
+        return pd.to_numeric(df_products[col], errors='coerce').fillna(default).to_numpy(dtype=float)
+
+    product_ids = df_products['ProductID'].to_numpy()
+    planning = planning.reindex(product_ids) if planning is not None else pd.DataFrame(index=product_ids)
+    base_demand = np.clip(np.asarray(daily_demand, dtype=float), 0, None)
+    lead_time = planning['LeadTimeDays'].fillna(pd.Series(numeric('LeadTimeDays'), index=product_ids)).to_numpy(dtype=float) \
+        if 'LeadTimeDays' in planning.columns else numeric('LeadTimeDays')
+    lead_time_std = planning['LeadTimeStdDev'].fillna(0).to_numpy(dtype=float) if 'LeadTimeStdDev' in planning.columns else np.zeros(n_items)
+    reorder_level = planning['ReorderLevel'].fillna(pd.Series(numeric('ReorderPoint'), index=product_ids)).to_numpy(dtype=float) \
+        if 'ReorderLevel' in planning.columns else numeric('ReorderPoint')
+    order_qty = planning['OrderQty'].to_numpy(dtype=float) if 'OrderQty' in planning.columns else np.full(n_items, np.nan)
+    order_qty = np.where(np.isfinite(order_qty) & (order_qty > 0), order_qty, np.maximum(base_demand * 14, 1))
+
+    price_factor, extra_lead_time = _scenario_multipliers(df_products, scenario, start_date, horizon_days)
+    demand_multiplier = np.power(price_factor, elasticity)
+    if scenario.get('weather_changes') and weather_sensitivity is not None and 'Category' in df_products.columns:
+        demand_multiplier = demand_multiplier * weather_demand_multipliers(
+            weather_sensitivity, df_products['Category'], scenario['weather_changes'])[None, :]
+    unit_price = numeric('Price')[None, :] * price_factor
+    unit_cost = numeric('Cost')
+    lead_time = lead_time + extra_lead_time
+
+    expiry = pd.to_datetime(df_products['ExpiryDate'], errors='coerce') if 'ExpiryDate' in df_products.columns \
+        else pd.Series(pd.NaT, index=df_products.index)
+    expiry_day = ((expiry - start_date).dt.days).fillna(horizon_days).to_numpy(dtype=np.int64)
+    # Stock already past its expiry is a sunk loss in every scenario, so it is written off before day 0
+    stock = np.where(expiry_day < 0, 0, numeric('quantity'))
+
+    # Chunk so that every per-chunk buffer (demand, arrivals and per-path state) stays under MAX_CHUNK_BYTES
+    chunk_cells = max(1, MAX_CHUNK_BYTES // _cell_bytes(horizon_days, _max_lead(lead_time, lead_time_std)))
+    sku_chunk = max(1, min(n_items, chunk_cells))
+    path_chunk = max(1, min(n_paths, chunk_cells // sku_chunk))
+    seeds = np.random.SeedSequence(seed)
+    tasks = []
+    for sku_start in range(0, n_items, sku_chunk):
+        s = slice(sku_start, min(sku_start + sku_chunk, n_items))
+        for path_start in range(0, n_paths, path_chunk):
+            chunk_paths = min(path_chunk, n_paths - path_start)
+            tasks.append((seeds.spawn(1)[0], chunk_paths, (s.start, s.stop), base_demand[s], demand_multiplier[:, s],
+                          unit_price[:, s], unit_cost[s], stock[s], reorder_level[s],
+                          reorder_level[s] + order_qty[s], lead_time[s], lead_time_std[s], expiry_day[s]))
+
+    total_cells = n_paths * horizon_days * n_items
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if max_workers > 1 and len(tasks) > 1 and total_cells >= MIN_PARALLEL_CELLS:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(_simulate_chunk, tasks))
+    else:
+        results = [_simulate_chunk(task) for task in tasks]
+
+    # Reduce: per-SKU sums across path chunks, per-path sums across SKU chunks
+    per_sku = {key: np.zeros(n_items) for key in ['stockout_paths', 'stockout_days', 'units_sold', 'waste_units', 'profit']}
+    path_profit = np.zeros(n_paths)
+    path_waste = np.zeros(n_paths)
+    path_offsets = {}
+    for result in results:
+        start, stop = result['sku_slice']
+        for key in per_sku:
+            per_sku[key][start:stop] += result[key]
+        offset = path_offsets.get(start, 0)
+        chunk_paths = len(result['path_profit'])
+        path_profit[offset:offset + chunk_paths] += result['path_profit']
+        path_waste[offset:offset + chunk_paths] += result['path_waste']
+        path_offsets[start] = offset + chunk_paths
+
+    per_sku_df = pd.DataFrame({
+        'StockoutProbability': per_sku['stockout_paths'] / n_paths,
+        'ExpectedStockoutDays': per_sku['stockout_days'] / n_paths,
+        'ExpectedUnitsSold': per_sku['units_sold'] / n_paths,
+        'ExpectedWasteUnits': per_sku['waste_units'] / n_paths,
+        'ExpectedProfit': per_sku['profit'] / n_paths,
+    }, index=pd.Index(product_ids, name='ProductID'))
+
+    summary = {
+        'paths': n_paths,
+        'horizon_days': horizon_days,
+        'expected_profit': float(path_profit.mean()),
+        'profit_percentiles': dict(zip(PERCENTILES, np.percentile(path_profit, PERCENTILES).tolist())),
+        'expected_waste_units': float(path_waste.mean()),
+        'waste_percentiles': dict(zip(PERCENTILES, np.percentile(path_waste, PERCENTILES).tolist())),
+        'skus_at_risk': int((per_sku_df['StockoutProbability'] >= 0.5).sum()),
+    }
+    return {'per_sku': per_sku_df, 'summary': summary, 'path_profit': path_profit, 'path_waste': path_waste}
+
+
+def run_scenario_for_dataset(stored_data_json, scenario=None, **kwargs):
+    """Runs a scenario against the stored dataset, using the cached demand and replenishment plans."""
+    df_products = read_frame(stored_data_json, 'products')
+    if df_products.empty:
+        return run_scenario(df_products, [], scenario, **kwargs)
+
+    safety_stock = get_safety_stock(stored_data_json)
+    planning = safety_stock[['LeadTimeDays', 'LeadTimeStdDev', 'ReorderLevel']].join(
+        get_order_cycles(stored_data_json)[['OrderQty']], how='left')
+    daily_demand = safety_stock['AvgDailyDemand'].reindex(df_products['ProductID']).fillna(0).to_numpy()
+    kwargs.setdefault('weather_sensitivity', get_weather_sensitivity(stored_data_json))
+    return run_scenario(df_products, daily_demand, scenario, planning=planning, **kwargs)
@@ -0,0 +1,157 @@
+import csv
+import hashlib
+import os
+import sqlite3
+from contextlib import closing
+
+import pandas as pd
+
+# --- Embedded SQLite Backend ---
+# Optional copy of the transactional tables (sales, stock movements, purchases) in a local SQLite
+# file, indexed on (ProductID, date) and (LocationID, date), so per-product and per-location
+# drilldowns are indexed lookups with the filtering and summing done in SQL instead of scanning
+# whole frames. Standard library only (sqlite3 + csv). sync_database keeps it in step with the
+# CSVs: files that only grew (e.g. streamed sales, see ingest.py) have just their new lines loaded.
+
+DB_FILE = 'invai.sqlite'
+TABLES = { # table -> (CSV file, date column)
+    'sales': ('sales_data.csv', 'SaleDate'),
+    'inventory_movements': ('inventory_movements.csv', 'MovementDate'),
+    'purchase_history': ('purchase_history.csv', 'PurchaseDate'),
+}
+NUMERIC_COLUMNS = {'Quantity', 'UnitPrice', 'TotalPrice', 'Profit', 'QuantityPurchased', 'CostOfPurchase'}
+HEAD_BYTES = 64 * 1024 # A file whose first HEAD_BYTES are unchanged is treated as appended to
+INSERT_BATCH_ROWS = 10_000
+
+
+def _connect(db_path):
+    connection = sqlite3.connect(db_path, timeout=30)
+    connection.execute('PRAGMA journal_mode=WAL') # Readers are not blocked while a sync writes
+    return connection
+
+
+def _file_state(path):
+    stat = os.stat(path)
+    with open(path, 'rb') as f:
+        head_hash = hashlib.sha1(f.read(HEAD_BYTES)).hexdigest()
+    return stat.st_size, stat.st_mtime_ns, head_hash
+
+
+def _create_table(connection, table, header, date_col):
+    columns = ', '.join(f'"{col}" {"REAL" if col in NUMERIC_COLUMNS else "TEXT"}' for col in header)
+    connection.execute(f'DROP TABLE IF EXISTS "{table}"')
+    connection.execute(f'CREATE TABLE "{table}" ({columns})')
+    if 'ProductID' in header:
+        connection.execute(f'CREATE INDEX "{table}_product_date" ON "{table}" (ProductID, "{date_col}")')
+    if 'LocationID' in header:
+        connection.execute(f'CREATE INDEX "{table}_location_date" ON "{table}" (LocationID, "{date_col}")')
+
+
+def _load_rows(connection, table, path, header, offset):
+    """Inserts the CSV lines after byte `offset` (just after the header when offset is 0). Returns the new offset."""
+    placeholders = ', '.join('?' * len(header))
+    insert = f'INSERT INTO "{table}" VALUES ({placeholders})'
+    with open(path, 'rb') as f: # Binary, so the position can be recorded after reading
+        if offset:
+            f.seek(offset)
+        else:
+            f.readline()
+        batch = []
+        for row in csv.reader(line.decode('utf-8') for line in f):
+            if not row:
+                continue
+            batch.append([value if value != '' else None for value in row[:len(header)]] + [None] * (len(header) - len(row)))
+            if len(batch) >= INSERT_BATCH_ROWS:
+                connection.executemany(insert, batch)
+                batch = []
+        if batch:
+            connection.executemany(insert, batch)
+        return f.tell()
+
+
+def sync_database(data_dir, db_path=None):
+    """
+    Brings the SQLite copy of the transactional CSVs up to date and returns its path.
+    A table is reloaded only when its file changed: appended files load their new lines, anything else is rebuilt.
+    """
+    db_path = db_path or os.path.join(data_dir, DB_FILE)
+    with closing(_connect(db_path)) as connection, connection:
+        connection.execute('CREATE TABLE IF NOT EXISTS sync_state '
+                           '("table" TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, head_hash TEXT, offset INTEGER)')
+        for table, (file_name, date_col) in TABLES.items():
+            path = os.path.join(data_dir, file_name)
+            if not os.path.exists(path):
+                continue
+            size, mtime, head_hash = _file_state(path)
+            previous = connection.execute('SELECT size, mtime, head_hash, offset FROM sync_state WHERE "table" = ?',
+                                          (table,)).fetchone()
+            if previous is not None and previous[:2] == (size, mtime):
+                continue
+
+            with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+                header = next(csv.reader(f), [])
+            appended = (previous is not None and size > previous[0] > HEAD_BYTES and head_hash == previous[2])
+            if appended:
+                offset = _load_rows(connection, table, path, header, previous[3])
+            else:
+                _create_table(connection, table, header, date_col)
+                offset = _load_rows(connection, table, path, header, 0)
+            connection.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?, ?)',
+                               (table, size, mtime, head_hash, offset))
+    return db_path
+
+
+def _query(db_path, sql, params=()):
+    with closing(sqlite3.connect(db_path, timeout=30)) as connection:
+        cursor = connection.execute(sql, params)
+        return pd.DataFrame(cursor.fetchall(), columns=[description[0] for description in cursor.description])
+
+
+def _window(date_col, start, end):
+    """WHERE fragment and parameters for an optional [start, end] date range (ISO date strings compare in order)."""
+    clauses, params = [], []
+    if start is not None:
+        clauses.append(f'"{date_col}" >= ?')
+        params.append(pd.Timestamp(start).strftime('%Y-%m-%d'))
+    if end is not None:
+        clauses.append(f'"{date_col}" < ?') # Exclusive of the following day, so timestamps on `end` are included
+        params.append((pd.Timestamp(end) + pd.Timedelta(days=1)).strftime('%Y-%m-%d'))
+    return ''.join(f' AND {clause}' for clause in clauses), params
+
+
+def product_daily_sales(db_path, product_id, start=None, end=None):
+    """One product's demand history: Quantity, TotalPrice and Profit per sale day (indexed on ProductID, SaleDate)."""
+    where, params = _window('SaleDate', start, end)
+    df = _query(db_path,
+                'SELECT substr(SaleDate, 1, 10) AS SaleDate, SUM(Quantity) AS Quantity, '
+                'SUM(TotalPrice) AS TotalPrice, SUM(Profit) AS Profit '
+                f'FROM sales WHERE ProductID = ?{where} GROUP BY 1 ORDER BY 1',
+                [product_id] + params)
+    df['SaleDate'] = pd.to_datetime(df['SaleDate'])
+    return df
+
+
+def location_daily_sales(db_path, location_id, start=None, end=None):
+    """Quantity and TotalPrice per sale day at one location (indexed on LocationID, SaleDate)."""
+    where, params = _window('SaleDate', start, end)
+    df = _query(db_path,
+                'SELECT substr(SaleDate, 1, 10) AS SaleDate, SUM(Quantity) AS Quantity, SUM(TotalPrice) AS TotalPrice '
+                f'FROM sales WHERE LocationID = ?{where} GROUP BY 1 ORDER BY 1',
+                [location_id] + params)
+    df['SaleDate'] = pd.to_datetime(df['SaleDate'])
+    return df
+
+
+def product_stock_by_location(db_path, product_id):
+    """Net stock movements (IN - OUT) of one product per location."""
+    return _query(db_path,
+                  "SELECT LocationID, SUM(CASE WHEN MovementType = 'IN' THEN Quantity ELSE -Quantity END) AS NetQuantity "
+                  'FROM inventory_movements WHERE ProductID = ? GROUP BY LocationID ORDER BY LocationID',
+                  (product_id,))
+
+
+def last_purchase_date(db_path, product_id):
+    """Date of the product's most recent purchase (restock), or None."""
+    value = _query(db_path, 'SELECT MAX(PurchaseDate) AS LastPurchase FROM purchase_history WHERE ProductID = ?',
+                   (product_id,))['LastPurchase'].iloc[0]
+    return pd.Timestamp(value) if value is not None else None
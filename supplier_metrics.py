@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+
+from catalog import product_keys
+from datastore import get_cached, get_version, read_frame
+
+# --- Supplier Performance ---
+# Purchases joined to the catalog by ProductID give each supplier's deliveries per product name
+# (a product name is stocked from several suppliers under different ProductIDs). Everything is
+# computed with grouped aggregations: delivery counts and intervals, volume, spend, the volume-
+# weighted unit price and its trend (least-squares slope of unit price over time from grouped sums).
+# purchase_history has no receipt dates, so the spread of the intervals between deliveries stands in
+# for lead-time variability; the promised lead time comes from the catalog's LeadTimeDays.
+# Results are cached per dataset version in a (SupplierID, ProductName) indexed table plus dicts,
+# so the comparison dropdowns only do dictionary lookups.
+
+PRICE_TREND_DAYS = 30 # Unit-price trend is reported as % change per this many days
+VARIABILITY_LEVELS = [(0.3, 'Very Low'), (0.6, 'Low'), (0.9, 'Medium')] # Interval CV upper bounds; above (~1 for irregular orders): 'High'
+UNKNOWN_LABEL = 'Unknown' # Stands in for a missing SupplierID or ProductName
+
+
+def _variability_level(cv):
+    levels = np.full(len(cv), 'High', dtype=object)
+    for bound, label in reversed(VARIABILITY_LEVELS):
+        levels[cv.to_numpy() <= bound] = label
+    levels[cv.isna().to_numpy()] = 'N/A' # Fewer than two intervals
+    return levels
+
+
+def _aggregate(purchases, keys):
+    """Delivery, volume, spend and unit-price metrics per group of `keys` (one pass of grouped sums)."""
+    metrics = purchases.groupby(keys, sort=False).agg(
+        Products=('NameCode', 'nunique'),
+        Deliveries=('PurchaseDate', 'size'),
+        LastDelivery=('PurchaseDate', 'max'),
+        AvgIntervalDays=('IntervalDays', 'mean'),
+        IntervalStd=('IntervalDays', 'std'),
+        LeadTimeDays=('LeadTimeDays', 'mean'),
+        Volume=('QuantityPurchased', 'sum'),
+        Spend=('CostOfPurchase', 'sum'),
+        n=('Priced', 'sum'), t=('t', 'sum'), p=('p', 'sum'), tp=('tp', 'sum'), tt=('tt', 'sum'),
+    )
+    metrics['UnitPrice'] = metrics['Spend'] / metrics['Volume'].where(metrics['Volume'] > 0)
+    metrics['IntervalCV'] = metrics['IntervalStd'] / metrics['AvgIntervalDays'].where(metrics['AvgIntervalDays'] > 0)
+
+    # Least-squares slope of unit price over time, from the grouped sums
+    denominator = metrics['n'] * metrics['tt'] - metrics['t'] ** 2
+    slope = (metrics['n'] * metrics['tp'] - metrics['t'] * metrics['p']) / denominator.where(denominator > 0)
+    mean_price = metrics['p'] / metrics['n'].where(metrics['n'] > 0)
+    metrics['PriceTrendPct'] = slope * PRICE_TREND_DAYS / mean_price.where(mean_price > 0) * 100
+    return metrics.drop(columns=['n', 't', 'p', 'tp', 'tt', 'IntervalStd'])
+
+
+def build_supplier_metrics(df_purchases, df_products):
+    """
+    Returns (supplier summary indexed by SupplierID, metrics indexed by (SupplierID, ProductName)).
+    Empty frames when either table lacks the columns needed for the join.
+    """
+    needed = {'ProductID', 'PurchaseDate', 'QuantityPurchased', 'CostOfPurchase'}
+    if df_purchases.empty or df_products.empty or not needed <= set(df_purchases.columns) \
+            or 'SupplierID' not in df_products.columns:
+        return pd.DataFrame(), pd.DataFrame()
+
+    # Join by integer product key; suppliers and product names as integer codes until the end
+    keys = product_keys(df_products).get_indexer(df_purchases['ProductID'])
+    purchase_date = pd.to_datetime(df_purchases['PurchaseDate'], errors='coerce')
+    known = (keys >= 0) & purchase_date.notna().to_numpy()
+    keys = keys[known]
+    supplier_codes, supplier_ids = pd.factorize(df_products['SupplierID'].fillna(UNKNOWN_LABEL))
+    name_codes, names = pd.factorize(df_products['ProductName'].fillna(UNKNOWN_LABEL)
+                                     if 'ProductName' in df_products.columns else df_products['ProductID'])
+    lead_time = (pd.to_numeric(df_products['LeadTimeDays'], errors='coerce').to_numpy()
+                 if 'LeadTimeDays' in df_products.columns else np.full(len(df_products), np.nan))
+
+    purchases = pd.DataFrame({
+        'SupplierCode': supplier_codes[keys],
+        'NameCode': name_codes[keys],
+        'PurchaseDate': purchase_date[known].to_numpy(),
+        'LeadTimeDays': lead_time[keys],
+        'QuantityPurchased': pd.to_numeric(df_purchases['QuantityPurchased'], errors='coerce').fillna(0).to_numpy()[known],
+        'CostOfPurchase': pd.to_numeric(df_purchases['CostOfPurchase'], errors='coerce').fillna(0).to_numpy()[known],
+    })
+
+    # Days between consecutive deliveries of the same product name by the same supplier
+    order = np.lexsort((purchases['PurchaseDate'].to_numpy(), purchases['NameCode'].to_numpy(),
+                        purchases['SupplierCode'].to_numpy()))
+    purchases = purchases.iloc[order].reset_index(drop=True)
+    group = purchases['SupplierCode'].to_numpy().astype(np.int64) * len(names) + purchases['NameCode'].to_numpy()
+    same_group = np.r_[False, group[1:] == group[:-1]]
+    purchases['IntervalDays'] = purchases['PurchaseDate'].diff().dt.days.where(same_group)
+
+    # Terms for the unit-price regression (t in days since the first purchase keeps the sums well scaled)
+    unit_price = purchases['CostOfPurchase'] / purchases['QuantityPurchased'].where(purchases['QuantityPurchased'] > 0)
+    priced = unit_price.notna()
+    t = (purchases['PurchaseDate'] - purchases['PurchaseDate'].min()).dt.days.astype(float).where(priced, 0.0)
+    purchases['Priced'] = priced.astype(float)
+    purchases['t'], purchases['p'] = t, unit_price.fillna(0.0)
+    purchases['tp'], purchases['tt'] = t * purchases['p'], t * t
+
+    by_product = _aggregate(purchases, ['SupplierCode', 'NameCode'])
+    summary = _aggregate(purchases, 'SupplierCode')
+    # A supplier's variability is that of its typical product, not of deliveries pooled across products
+    summary['IntervalCV'] = by_product['IntervalCV'].groupby(level=0).median()
+    for metrics in (by_product, summary):
+        metrics['LeadTimeVariability'] = _variability_level(metrics['IntervalCV'])
+
+    supplier_names = (df_products['Supplier'] if 'Supplier' in df_products.columns
+                      else df_products['SupplierID']).groupby(supplier_codes).first()
+    summary.insert(0, 'Supplier', supplier_names.reindex(summary.index).to_numpy())
+    summary.index = pd.Index(supplier_ids[summary.index], name='SupplierID')
+    codes = by_product.index
+    by_product.insert(0, 'Supplier', supplier_names.reindex(codes.get_level_values(0)).to_numpy())
+    by_product.index = pd.MultiIndex.from_arrays([supplier_ids[codes.get_level_values(0)], names[codes.get_level_values(1)]],
+                                                 names=['SupplierID', 'ProductName'])
+    return summary.sort_values('Spend', ascending=False), by_product.sort_index()
+
+
+def _format(metrics):
+    """Display strings for each metrics row, as {index: {column: text}}."""
+    def text(values, fmt):
+        return [fmt.format(v) if pd.notna(v) else 'N/A' for v in values]
+
+    formatted = pd.DataFrame({
+        'Supplier Name': metrics['Supplier'].to_numpy(),
+        'Products': metrics['Products'].to_numpy(),
+        'Deliveries': metrics['Deliveries'].to_numpy(),
+        'Avg Delivery Interval': text(metrics['AvgIntervalDays'], 'Every {:,.0f} days'),
+        'Lead Time (days)': text(metrics['LeadTimeDays'], '{:,.1f}'),
+        'Lead Time Variability': metrics['LeadTimeVariability'].to_numpy(),
+        'Volume': text(metrics['Volume'], '{:,.0f} units'),
+        'Spend': text(metrics['Spend'], '₹{:,.0f}'),
+        'Unit Price': text(metrics['UnitPrice'], '₹{:,.2f}'),
+        'Unit Price Trend': text(metrics['PriceTrendPct'], '{:+.1f}% / ' + f'{PRICE_TREND_DAYS} days'),
+        'Last Delivery': text(metrics['LastDelivery'], '{:%d %b %Y}'),
+    }, index=metrics.index)
+    return formatted.to_dict('index')
+
+
+def get_supplier_metrics(stored_data_json):
+    """
+    Returns the supplier engine for the stored dataset, built once per dataset version:
+    'summary' / 'by_product' (numeric frames), 'summary_rows' (display records for the overview table),
+    'rows' ({(SupplierID, ProductName): display dict}), 'suppliers' ({SupplierID: name}, by spend)
+    and 'products' ({SupplierID: sorted product names}).
+    """
+    def build():
+        summary, by_product = build_supplier_metrics(read_frame(stored_data_json, 'purchases', ('PurchaseDate',)),
+                                                     read_frame(stored_data_json, 'products'))
+        if summary.empty:
+            return {'summary': summary, 'by_product': by_product, 'summary_rows': [], 'rows': {},
+                    'suppliers': {}, 'products': {}}
+        products = by_product.reset_index().groupby('SupplierID')['ProductName'].agg(sorted)
+        return {
+            'summary': summary,
+            'by_product': by_product,
+            'summary_rows': list(_format(summary).values()),
+            'rows': _format(by_product),
+            'suppliers': summary['Supplier'].to_dict(),
+            'products': products.to_dict(),
+        }
+
+    return get_cached(get_version(stored_data_json), ('supplier_metrics',), build)
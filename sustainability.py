@@ -0,0 +1,52 @@
+from datetime import datetime
+
+import pandas as pd
+
+from waste_rollup import ROLLUP_COLUMNS, get_waste_rollup
+
+# --- Sustainability Tracker ---
+# Wasted kg, kg CO2e and disposal cost per location and month. Everything is read from the
+# incrementally maintained waste rollup (waste_rollup.py): unit weights come from
+# catalog.unit_weight_kg and emission / disposal factors from catalog.category_factors, so
+# rendering the tracker costs a groupby over a few hundred cells regardless of history length.
+
+DEFAULT_TRACKER_MONTHS = 12
+
+
+def sustainability_totals(rollup, start_month=None, end_month=None, location=None, by=('Month', 'LocationID')):
+    """Sums the rollup over the requested levels, optionally limited to a month range and one location."""
+    if rollup is None or rollup.empty:
+        return pd.DataFrame(columns=list(by) + ROLLUP_COLUMNS)
+
+    months = rollup.index.get_level_values('Month')
+    mask = pd.Series(True, index=rollup.index)
+    if start_month is not None:
+        mask &= months >= start_month
+    if end_month is not None:
+        mask &= months <= end_month
+    if location not in (None, 'all'):
+        mask &= rollup.index.get_level_values('LocationID') == location
+    return rollup[mask.to_numpy()].groupby(level=list(by))[ROLLUP_COLUMNS].sum().reset_index()
+
+
+def get_sustainability_summary(stored_data_json, num_months=DEFAULT_TRACKER_MONTHS, location=None):
+    """
+    Tracker figures for the last num_months months (current month to date) and the same span before.
+    Returns a dict with 'totals', 'previous_totals', 'monthly' (Month x LocationID), 'by_category' and 'locations'.
+    """
+    rollup = get_waste_rollup(stored_data_json)
+    end_month = pd.Timestamp(datetime.now().date()).to_period('M')
+    start_month = end_month - (num_months - 1)
+
+    current = sustainability_totals(rollup, start_month, end_month, location, by=('Month', 'LocationID'))
+    previous = sustainability_totals(rollup, start_month - num_months, start_month - 1, location, by=('LocationID',))
+    by_category = sustainability_totals(rollup, start_month, end_month, location, by=('Category',))
+    locations = sorted(rollup.index.get_level_values('LocationID').unique()) if not rollup.empty else []
+    return {
+        'totals': current[ROLLUP_COLUMNS].sum(),
+        'previous_totals': previous[ROLLUP_COLUMNS].sum(),
+        'monthly': current,
+        'by_category': by_category.sort_values('CO2eKg', ascending=False),
+        'locations': locations,
+        'months': pd.period_range(start_month, end_month, freq='M'),
+    }
@@ -0,0 +1,108 @@
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from catalog import category_factors
+from datastore import get_cached, get_version, read_frame
+from expiry_index import expired_between, get_expiry_index
+
+# --- Monthly Waste Rollup ---
+# Written-off stock (kg, units, kg CO2e, ₹ disposal cost) summed by (expiry month, category, location): a few hundred cells instead of
+# thousands of lots. Lot waste is final once a lot expires, so each day only the lots that expired
+# since the last update are added. Lots have no location of their own; a product's waste is split
+# across locations in proportion to where the product sells.
+
+UNASSIGNED_LOCATION = 'Unassigned' # Products with no sales history
+ROLLUP_COLUMNS = ['WasteKg', 'WasteUnits', 'CO2eKg', 'DisposalCost']
+
+_rollup_lock = threading.Lock()
+
+
+def location_shares(df_sales, product_ids):
+    """
+    Share of each product's sales by location: returns (n_products x n_locations array, location names).
+    Products without sales put their whole share on UNASSIGNED_LOCATION.
+    """
+    product_index = pd.Index(product_ids)
+    if df_sales.empty or 'LocationID' not in df_sales.columns:
+        return np.ones((len(product_index), 1)), np.array([UNASSIGNED_LOCATION], dtype=object)
+
+    codes = product_index.get_indexer(df_sales['ProductID'])
+    location_codes, locations = pd.factorize(df_sales['LocationID'].fillna(UNASSIGNED_LOCATION))
+    locations = np.append(locations.to_numpy(dtype=object), UNASSIGNED_LOCATION)
+    quantity = pd.to_numeric(df_sales['Quantity'], errors='coerce').fillna(0).to_numpy(dtype=float)
+    valid = codes >= 0
+    n_locations = len(locations)
+    totals = np.bincount(codes[valid] * n_locations + location_codes[valid], weights=quantity[valid],
+                         minlength=len(product_index) * n_locations).reshape(len(product_index), n_locations)
+    row_totals = totals.sum(axis=1, keepdims=True)
+    shares = np.divide(totals, row_totals, out=np.zeros_like(totals), where=row_totals > 0)
+    shares[row_totals[:, 0] == 0, -1] = 1.0
+    return shares, locations
+
+
+def rollup_rows(df_rows, df_products, shares, locations):
+    """Aggregates written-off stock rows into (Month, Category, LocationID) cells."""
+    if df_rows.empty:
+        return pd.DataFrame(columns=ROLLUP_COLUMNS, index=pd.MultiIndex.from_arrays([[], [], []],
+                            names=['Month', 'Category', 'LocationID']))
+
+    product_index = pd.Index(df_products['ProductID'].to_numpy())
+    codes = product_index.get_indexer(df_rows['ProductID'])
+    categories = df_products['Category'].fillna('Unknown').to_numpy() if 'Category' in df_products.columns \
+        else np.full(len(product_index), 'Unknown', dtype=object)
+    row_shares = np.where(codes[:, None] >= 0, shares[np.maximum(codes, 0)], 0.0)
+    row_shares[codes < 0, -1] = 1.0 # Unknown products go to UNASSIGNED_LOCATION
+
+    # Long form: one entry per (row, location) with a non-zero share
+    row_pos, location_pos = np.nonzero(row_shares)
+    weight = row_shares[row_pos, location_pos]
+    months = pd.to_datetime(df_rows['ExpiryDate']).dt.to_period('M').to_numpy()
+    row_categories = np.where(codes >= 0, categories[np.maximum(codes, 0)], 'Unknown')
+    emission, disposal = category_factors(row_categories)
+    waste_kg = df_rows['Weight'].to_numpy(dtype=float)[row_pos] * weight
+    long = pd.DataFrame({
+        'Month': months[row_pos],
+        'Category': row_categories[row_pos],
+        'LocationID': locations[location_pos],
+        'WasteKg': waste_kg,
+        'WasteUnits': df_rows['quantity'].to_numpy(dtype=float)[row_pos] * weight,
+        'CO2eKg': waste_kg * emission[row_pos],
+        'DisposalCost': waste_kg * disposal[row_pos],
+    })
+    return long.groupby(['Month', 'Category', 'LocationID'])[ROLLUP_COLUMNS].sum()
+
+
+def get_waste_rollup(stored_data_json):
+    """
+    Returns the (Month, Category, LocationID) waste rollup for the stored dataset up to today.
+    Built once per dataset version, then topped up with the lots that expired since the last call.
+    """
+    today = pd.Timestamp(datetime.now().date())
+    state = get_cached(get_version(stored_data_json), ('waste_rollup',), lambda: {'as_of': None, 'table': None})
+
+    with _rollup_lock:
+        if state['as_of'] is not None and state['as_of'] >= today:
+            return state['table']
+
+        df_products = read_frame(stored_data_json, 'products')
+        df_stock, index = get_expiry_index(stored_data_json)
+        if 'shares' not in state:
+            product_ids = df_products['ProductID'].to_numpy() if not df_products.empty else np.array([])
+            state['shares'], state['locations'] = location_shares(read_frame(stored_data_json, 'sales'), product_ids)
+
+        new_rows = df_stock.iloc[expired_between(index, state['as_of'], today)]
+        increment = rollup_rows(new_rows, df_products, state['shares'], state['locations'])
+        table = increment if state['table'] is None else state['table'].add(increment, fill_value=0)
+        state['table'], state['as_of'] = table.sort_index(), today
+        return state['table']
+
+
+def monthly_waste(rollup, end_month, num_months, column='WasteKg'):
+    """Totals per month for the num_months months ending at end_month (a Period), zero-filled."""
+    periods = pd.period_range(end=end_month, periods=num_months, freq='M')
+    if rollup is None or rollup.empty:
+        return pd.Series(0.0, index=periods)
+    return rollup.groupby(level='Month')[column].sum().reindex(periods, fill_value=0.0)
@@ -0,0 +1,202 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from datastore import get_cached, get_version, read_frame
+from demand import LONG_PERIOD_DAYS
+from sales_facts import get_sales_facts
+from sales_insights import FALSE_DISCOVERY_RATE, benjamini_hochberg, t_p_values
+
+# --- Weather x Demand Sensitivity ---
+# Daily units sold per (category, city) - sales locations mapped to their city through
+# locations.csv - joined to that city's weather, with days without sales counted as zero. Every
+# group gets the same linear model, units = a + b . weather, fitted for all groups at once: the
+# centred normal equations come from grouped sums and are solved as one stacked np.linalg.solve.
+# Coefficients are also reported relative to the group's mean daily units, which is how the
+# carousel describes them and how the scenario planner applies weather changes to demand. The reorder
+# page's demand forecast is scaled the same way for the coming month: each city's seasonal normal
+# (the same calendar days of earlier years) against the weather of the demand window it averages.
+# With one test per group and variable, a coefficient only counts as an effect when its
+# Benjamini-Hochberg adjusted p-value (Q_*) is within FALSE_DISCOVERY_RATE.
+
+WEATHER_VARIABLES = ['Temperature_C', 'Precipitation_mm'] # Regressors, in coefficient order
+EFFECT_STEPS = {'Temperature_C': 1.0, 'Precipitation_mm': 10.0} # Effects are reported per +1 °C and per +10 mm
+MIN_GROUP_DAYS = 60 # Groups with fewer weather days are not fitted
+OUTLOOK_DAYS = 30 # Seasonal weather outlook horizon for the reorder demand forecast
+SENSITIVITY_COLUMNS = (['Category', 'City', 'Days', 'MeanUnits', 'R2']
+                       + [f'{prefix}_{variable}' for variable in WEATHER_VARIABLES for prefix in ('Coef', 'T', 'Q', 'EffectPct')])
+
+
+def daily_units_by_city(facts, df_locations, df_weather):
+    """
+    Units sold per (Category, City, day) on every day the city has weather, within the sales history.
+    Returns a frame with Category, City, Date, Units and the WEATHER_VARIABLES.
+    """
+    if facts.empty or df_weather.empty or df_locations.empty or 'City' not in df_locations.columns \
+            or not {'WeatherDate', 'City'} <= set(df_weather.columns):
+        return pd.DataFrame(columns=['Category', 'City', 'Date', 'Units'] + WEATHER_VARIABLES)
+
+    city = facts['LocationID'].map(df_locations.drop_duplicates('LocationID').set_index('LocationID')['City'])
+    units = facts['Quantity'].groupby([facts['Category'], city.rename('City'),
+                                       facts['SaleDate'].dt.normalize().rename('Date')]).sum().rename('Units')
+
+    weather = df_weather.assign(Date=pd.to_datetime(df_weather['WeatherDate'], errors='coerce').dt.normalize())
+    weather = weather.dropna(subset=['Date']).groupby(['City', 'Date'])[WEATHER_VARIABLES].mean().dropna().reset_index()
+    first_day, last_day = facts['SaleDate'].min().normalize(), facts['SaleDate'].max().normalize()
+    weather = weather[(weather['Date'] >= first_day) & (weather['Date'] <= last_day)]
+
+    # Each (category, city) with sales gets one row per weather day of its city; no sales that day is zero units
+    groups = units.index.droplevel('Date').unique().to_frame(index=False)
+    daily = groups.merge(weather, on='City')
+    daily['Units'] = units.reindex(pd.MultiIndex.from_frame(daily[['Category', 'City', 'Date']])).fillna(0).to_numpy()
+    return daily[['Category', 'City', 'Date', 'Units'] + WEATHER_VARIABLES]
+
+
+def fit_weather_sensitivity(daily):
+    """
+    Least-squares weather coefficients per (Category, City), solved for all groups in one batch.
+    Coef_* are units/day per unit of the variable, T_* their t statistics, Q_* their p-values adjusted over all
+    groups and variables (Benjamini-Hochberg) and EffectPct_* the effect of EFFECT_STEPS of the variable as % of
+    the group's mean daily units.
+    """
+    if daily.empty:
+        return pd.DataFrame(columns=SENSITIVITY_COLUMNS)
+
+    k = len(WEATHER_VARIABLES)
+    x = daily[WEATHER_VARIABLES].to_numpy(dtype=float)
+    y = daily['Units'].to_numpy(dtype=float)
+    codes, groups = pd.factorize(pd.MultiIndex.from_frame(daily[['Category', 'City']]))
+    n_groups = len(groups)
+
+    def group_sum(values):
+        """Per-group sums of the rows of `values`: (rows, ...) -> (groups, ...)."""
+        flat = values.reshape(len(values), -1)
+        sums = [np.bincount(codes, weights=flat[:, j], minlength=n_groups) for j in range(flat.shape[1])]
+        return np.stack(sums, axis=1).reshape((n_groups,) + values.shape[1:])
+
+    # Centred sums of squares and cross-products from raw grouped sums
+    n = np.bincount(codes, minlength=n_groups).astype(float)
+    sum_x, sum_y = group_sum(x), group_sum(y)
+    mean_x, mean_y = sum_x / n[:, None], sum_y / n
+    sxx = group_sum(x[:, :, None] * x[:, None, :]) - n[:, None, None] * mean_x[:, :, None] * mean_x[:, None, :]
+    sxy = group_sum(x * y[:, None]) - n[:, None] * mean_x * mean_y[:, None]
+    syy = group_sum(y * y) - n * mean_y ** 2
+
+    # Only groups with enough days and non-degenerate weather (e.g. some rain) are solved
+    solvable = (n >= max(MIN_GROUP_DAYS, k + 2)) & (np.linalg.det(sxx) > 1e-9 * np.prod(np.diagonal(sxx, axis1=1, axis2=2), axis=1))
+    coef = np.full((n_groups, k), np.nan)
+    t_stat = np.full((n_groups, k), np.nan)
+    r2 = np.full(n_groups, np.nan)
+    if solvable.any():
+        beta = np.linalg.solve(sxx[solvable], sxy[solvable][:, :, None])[:, :, 0]
+        rss = np.maximum(syy[solvable] - np.einsum('gk,gk->g', beta, sxy[solvable]), 0)
+        sigma2 = rss / (n[solvable] - k - 1)
+        covariance_diag = np.diagonal(np.linalg.inv(sxx[solvable]), axis1=1, axis2=2) * sigma2[:, None]
+        coef[solvable] = beta
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t_stat[solvable] = beta / np.sqrt(covariance_diag)
+            r2[solvable] = np.where(syy[solvable] > 0, 1 - rss / syy[solvable], np.nan)
+
+    q_values = benjamini_hochberg(t_p_values(t_stat, (n - k - 1)[:, None]))
+    steps = np.array([EFFECT_STEPS[variable] for variable in WEATHER_VARIABLES])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        effect_pct = np.where(mean_y[:, None] > 0, coef * steps / mean_y[:, None] * 100, np.nan)
+
+    result = pd.DataFrame({'Category': groups.get_level_values(0), 'City': groups.get_level_values(1),
+                           'Days': n.astype(int), 'MeanUnits': mean_y, 'R2': r2})
+    for i, variable in enumerate(WEATHER_VARIABLES):
+        result[f'Coef_{variable}'] = coef[:, i]
+        result[f'T_{variable}'] = t_stat[:, i]
+        result[f'Q_{variable}'] = q_values[:, i]
+        result[f'EffectPct_{variable}'] = effect_pct[:, i]
+    return result[SENSITIVITY_COLUMNS].sort_values(['Category', 'City'], ignore_index=True)
+
+
+def weather_demand_multipliers(sensitivity, categories, weather_changes):
+    """
+    Demand multiplier per item of `categories` for a change in weather, e.g. {'Temperature_C': 2} or
+    {'Precipitation_mm': {'Mumbai': 20}} (per city; cities not listed are unchanged). A category's
+    response is the mean-units weighted average over its cities; coefficients not significant (Q_* > FALSE_DISCOVERY_RATE) count as zero.
+    """
+    categories = pd.Index(categories)
+    if sensitivity.empty or not weather_changes:
+        return np.ones(len(categories))
+
+    change = np.zeros(len(sensitivity))
+    for variable, delta in weather_changes.items():
+        if variable not in WEATHER_VARIABLES:
+            continue
+        if isinstance(delta, dict):
+            delta = sensitivity['City'].map(delta).fillna(0).to_numpy(dtype=float)
+        relative = (sensitivity[f'Coef_{variable}'] / sensitivity['MeanUnits']).where(
+            sensitivity[f'Q_{variable}'] <= FALSE_DISCOVERY_RATE, 0).fillna(0).to_numpy()
+        change += relative * delta
+
+    weights = sensitivity['MeanUnits'].to_numpy()
+    weighted = pd.DataFrame({'Category': sensitivity['Category'], 'change': change * weights, 'weight': weights})
+    by_category = weighted.groupby('Category')[['change', 'weight']].sum()
+    category_change = (by_category['change'] / by_category['weight'].where(by_category['weight'] > 0)).fillna(0)
+    return np.clip(1 + category_change.reindex(categories).fillna(0).to_numpy(), 0, None)
+
+
+def seasonal_weather_changes(df_weather, today, recent_days=LONG_PERIOD_DAYS, horizon_days=OUTLOOK_DAYS):
+    """
+    Per city, the mean weather of the next horizon_days in earlier years minus that of the last recent_days,
+    as {variable: {City: change}} for weather_demand_multipliers. Cities lacking either side get no change.
+    """
+    if df_weather.empty or not {'WeatherDate', 'City'} <= set(df_weather.columns):
+        return {}
+    today = pd.Timestamp(today)
+    weather = df_weather.assign(Date=pd.to_datetime(df_weather['WeatherDate'], errors='coerce').dt.normalize())
+    recent = weather[(weather['Date'] > today - timedelta(days=recent_days)) & (weather['Date'] <= today)]
+
+    start = today + timedelta(days=1)
+    earlier = weather[weather['Date'] < start - timedelta(days=365 - horizon_days)]
+    ahead = (earlier['Date'].dt.dayofyear - start.dayofyear) % 365 < horizon_days # Same calendar days, any earlier year
+
+    change = (earlier[ahead.to_numpy()].groupby('City')[WEATHER_VARIABLES].mean()
+              - recent.groupby('City')[WEATHER_VARIABLES].mean())
+    return {variable: change[variable].dropna().to_dict() for variable in WEATHER_VARIABLES}
+
+
+def weather_insights(sensitivity, limit=3):
+    """The strongest significant effects (Q_* <= FALSE_DISCOVERY_RATE), one row per (Category, City, Variable), by |t|."""
+    rows = []
+    for variable in WEATHER_VARIABLES:
+        significant = sensitivity[sensitivity[f'Q_{variable}'] <= FALSE_DISCOVERY_RATE]
+        rows.append(pd.DataFrame({'Category': significant['Category'], 'City': significant['City'],
+                                  'Variable': variable, 'Days': significant['Days'],
+                                  'EffectPct': significant[f'EffectPct_{variable}'], 'T': significant[f'T_{variable}'],
+                                  'Q': significant[f'Q_{variable}']}))
+    insights = pd.concat(rows, ignore_index=True)
+    return insights.iloc[np.argsort(-insights['T'].abs().to_numpy(), kind='stable')].head(limit).reset_index(drop=True)
+
+
+def get_weather_sensitivity(stored_data_json):
+    """Returns fit_weather_sensitivity for the stored dataset, built once per dataset version (shared; do not modify)."""
+    def build():
+        daily = daily_units_by_city(get_sales_facts(stored_data_json), read_frame(stored_data_json, 'locations'),
+                                    read_frame(stored_data_json, 'weather', ('WeatherDate',)))
+        return fit_weather_sensitivity(daily)
+
+    return get_cached(get_version(stored_data_json), ('weather_sensitivity',), build)
+
+
+def get_weather_demand_outlook(stored_data_json):
+    """
+    Demand multiplier per ProductID for the seasonal weather of the next OUTLOOK_DAYS against the last
+    LONG_PERIOD_DAYS (see seasonal_weather_changes), built once per dataset version and day.
+    """
+    today = pd.Timestamp(datetime.now().date())
+
+    def build():
+        df_products = read_frame(stored_data_json, 'products')
+        if df_products.empty or not {'ProductID', 'Category'} <= set(df_products.columns):
+            return pd.Series(dtype=float)
+        changes = seasonal_weather_changes(read_frame(stored_data_json, 'weather', ('WeatherDate',)), today)
+        multipliers = weather_demand_multipliers(get_weather_sensitivity(stored_data_json), df_products['Category'], changes)
+        return pd.Series(multipliers, index=df_products['ProductID'].to_numpy())
+
+    return get_cached(get_version(stored_data_json), ('weather_demand_outlook', today), build)
+